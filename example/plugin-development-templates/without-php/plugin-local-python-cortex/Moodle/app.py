@@ -1,14 +1,60 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import subprocess
 import os
 import sys
 import json
+from worker_pool import WorkerPool, PoolBusy, WorkerTimeout
+from executions import Runner, RunnerBusy, Limits, FINISHED, CANCELLED
 
 app = Flask(__name__)
 
 # Mounted storage configuration
 PYTHON_FILES_PATH = os.getenv('PYTHON_FILES_PATH', '/app/python')
 
+# Warm worker pool (PYRUNNER_WORKERS=0 runs every call in a fresh subprocess instead)
+PYRUNNER_WORKERS = int(os.getenv('PYRUNNER_WORKERS', 4))
+PYRUNNER_MAX_RUNS = int(os.getenv('PYRUNNER_MAX_RUNS', 100))  # calls before a worker is replaced
+PYRUNNER_QUEUE = int(os.getenv('PYRUNNER_QUEUE', 16))  # calls allowed to wait for a free worker
+PYRUNNER_TIMEOUT = int(os.getenv('PYRUNNER_TIMEOUT', 60))  # seconds per call
+PYRUNNER_PRELOAD = [name for name in os.getenv('PYRUNNER_PRELOAD', 'cortex.py').split(',') if name]
+
+worker_pool = WorkerPool(
+    PYTHON_FILES_PATH,
+    size=PYRUNNER_WORKERS,
+    max_runs=PYRUNNER_MAX_RUNS,
+    queue_size=PYRUNNER_QUEUE,
+    timeout=PYRUNNER_TIMEOUT,
+    preload=PYRUNNER_PRELOAD
+) if PYRUNNER_WORKERS > 0 else None
+if worker_pool is not None:
+    worker_pool.start()
+
+# Streaming and job modes: each run gets its own process with these limits (0 disables one);
+# a request may lower them with "limits" but not raise them
+PYRUNNER_MAX_CONCURRENT = int(os.getenv('PYRUNNER_MAX_CONCURRENT', 2))  # streams and jobs running at once
+PYRUNNER_JOB_QUEUE = int(os.getenv('PYRUNNER_JOB_QUEUE', 32))  # jobs allowed to wait for a slot
+PYRUNNER_JOB_TTL = int(os.getenv('PYRUNNER_JOB_TTL', 3600))  # seconds a finished job can still be polled
+PYRUNNER_MAX_JOBS = int(os.getenv('PYRUNNER_MAX_JOBS', 64))  # jobs kept, with their output; oldest finished go first
+PYRUNNER_JOB_TIMEOUT = int(os.getenv('PYRUNNER_JOB_TIMEOUT', 900))  # wall-clock seconds per run
+PYRUNNER_CPU_SECONDS = int(os.getenv('PYRUNNER_CPU_SECONDS', 600))
+PYRUNNER_MEMORY_MB = int(os.getenv('PYRUNNER_MEMORY_MB', 2048))
+PYRUNNER_MAX_OUTPUT_KB = int(os.getenv('PYRUNNER_MAX_OUTPUT_KB', 4096))
+EXECUTE_MODES = ('sync', 'stream', 'job')
+
+runner = Runner(
+    PYTHON_FILES_PATH,
+    Limits(
+        timeout=PYRUNNER_JOB_TIMEOUT,
+        cpu_seconds=PYRUNNER_CPU_SECONDS,
+        memory_mb=PYRUNNER_MEMORY_MB,
+        max_output_bytes=PYRUNNER_MAX_OUTPUT_KB * 1024
+    ),
+    max_concurrent=PYRUNNER_MAX_CONCURRENT,
+    queue_size=PYRUNNER_JOB_QUEUE,
+    job_ttl=PYRUNNER_JOB_TTL,
+    max_jobs=PYRUNNER_MAX_JOBS
+)
+
 def get_file_from_storage(filename):
     """Get a file from mounted storage"""
     try:
@@ -31,6 +77,61 @@ def get_file_from_storage(filename):
     except Exception as e:
         raise Exception(f"Error accessing file from storage: {str(e)}")
 
+def parse_json_output(stdout):
+    """stdout parsed as JSON if possible (for structured responses), else None"""
+    try:
+        if stdout.strip():
+            return json.loads(stdout.strip())
+    except (json.JSONDecodeError, ValueError):
+        pass  # If parsing fails, keep as string
+    return None
+
+def busy_response(message, filename):
+    response = jsonify({
+        "error": f"Python runner is busy: {message}",
+        "filename": filename,
+        "status": "busy"
+    })
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+def sse(event, data):
+    return f"event: {event}\ndata: {data}\n\n"
+
+def stream_execution(execution, filename):
+    """Forward a running script's output as server-sent events, ending with an 'exit' event"""
+    def generate():
+        try:
+            yield sse("start", json.dumps({"filename": filename, "limits": execution.limits._asdict()}))
+            for event in execution.events():
+                if event is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield sse(*event)
+            result = execution.result()
+            result["status"] = execution.status
+            result["success"] = execution.status == FINISHED and result["return_code"] == 0
+            parsed_output = parse_json_output(result["stdout"])
+            if parsed_output is not None:
+                result["parsed_output"] = parsed_output
+            yield sse("exit", json.dumps(result))
+        finally:
+            # The client went away before the script finished: don't leave it running
+            execution.kill(CANCELLED)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def job_response(job, since=0):
+    response = job.to_dict(since)
+    response["status_url"] = f"/api/jobs/{job.id}"
+    if job.done and job.execution is not None:
+        response["success"] = job.status == FINISHED and response["return_code"] == 0
+        parsed_output = parse_json_output(response["stdout"]) if since == 0 else None
+        if parsed_output is not None:
+            response["parsed_output"] = parsed_output
+    return response
+
 @app.route("/")
 def hello_world():
     return "Hello, World!"
@@ -49,6 +150,13 @@ def execute_python():
         
         filename = data['filename']
         
+        # sync (default) waits for the result, stream sends output as it is printed, job returns a job id to poll
+        mode = data.get('mode', 'sync')
+        if mode not in EXECUTE_MODES:
+            return jsonify({
+                "error": f"Unknown mode '{mode}', expected one of {', '.join(EXECUTE_MODES)}"
+            }), 400
+        
         # Get optional arguments - can be object, list, or string
         arguments = data.get('arguments', {})
         
@@ -101,6 +209,20 @@ def execute_python():
                 "status": "access_error"
             }), 500
         
+        if mode != 'sync':
+            limits = runner.limits.narrowed(data.get('limits'))
+            try:
+                if mode == 'stream':
+                    return stream_execution(runner.stream(file_path, json_arguments, limits), filename)
+                job = runner.submit(file_path, json_arguments, limits, info={
+                    "filename": filename,
+                    "arguments": arguments,
+                    "json_arguments": json_arguments
+                })
+            except RunnerBusy as e:
+                return busy_response(str(e), filename)
+            return jsonify(job_response(job)), 202
+        
         # Execute the Python file with JSON arguments and capture output
         try:
             # Build command: python script.py '{"key": "value", ...}'
@@ -109,25 +231,27 @@ def execute_python():
             else:
                 command = [sys.executable, file_path]
             
-            # Use subprocess to run the Python file safely
-            result = subprocess.run(command, 
-                                  capture_output=True, 
-                                  text=True, 
-                                  timeout=60,  # Increased timeout for API calls
-                                  cwd=PYTHON_FILES_PATH)  # Run in mounted storage directory
-            
-            # Get the output
-            stdout = result.stdout
-            stderr = result.stderr
-            return_code = result.returncode
+            if worker_pool is not None:
+                # Run in a warm worker: no interpreter startup, imports already loaded
+                result = worker_pool.execute(file_path, json_arguments)
+                stdout = result["stdout"]
+                stderr = result["stderr"]
+                return_code = result["return_code"]
+            else:
+                # Use subprocess to run the Python file safely
+                result = subprocess.run(command, 
+                                      capture_output=True, 
+                                      text=True, 
+                                      timeout=PYRUNNER_TIMEOUT,
+                                      cwd=PYTHON_FILES_PATH)  # Run in mounted storage directory
+                
+                # Get the output
+                stdout = result.stdout
+                stderr = result.stderr
+                return_code = result.returncode
             
             # Try to parse stdout as JSON if possible (for structured responses)
-            parsed_output = None
-            try:
-                if stdout.strip():
-                    parsed_output = json.loads(stdout.strip())
-            except (json.JSONDecodeError, ValueError):
-                parsed_output = None  # If parsing fails, keep as string
+            parsed_output = parse_json_output(stdout)
             
             # Prepare response
             response = {
@@ -155,9 +279,12 @@ def execute_python():
             
             return jsonify(response), 200
             
-        except subprocess.TimeoutExpired:
+        except PoolBusy as e:
+            return busy_response(str(e), filename)
+            
+        except (subprocess.TimeoutExpired, WorkerTimeout):
             return jsonify({
-                "error": "Python file execution timed out (60 seconds limit)",
+                "error": f"Python file execution timed out ({PYRUNNER_TIMEOUT} seconds limit)",
                 "filename": filename,
                 "arguments": arguments,
                 "json_arguments": json_arguments,
@@ -185,9 +312,15 @@ def get_execute_info():
         "method": "POST",
         "description": "Execute a Python file from mounted storage with optional arguments",
         "storage_path": PYTHON_FILES_PATH,
+        "workers": worker_pool.stats() if worker_pool is not None else None,
+        "executions": runner.stats(),
         "request_format": {
             "filename": "string (required) - Python file to execute",
-            "arguments": "array or string (optional) - Arguments to pass to the script"
+            "arguments": "array or string (optional) - Arguments to pass to the script",
+            "mode": "string (optional) - 'sync' (default), 'stream' for server-sent events as the script prints, "
+                    "'job' to get a job id to poll at /api/jobs/<job_id>",
+            "limits": "object (optional, stream and job) - timeout, cpu_seconds, memory_mb, max_output_bytes; "
+                      "can only lower the server limits"
         },
         "example_requests": [
             {
@@ -200,6 +333,12 @@ def get_execute_info():
             },
             {
                 "filename": "simple_script.py"
+            },
+            {
+                "filename": "cortex.py",
+                "arguments": ["Summarise sales by region for 2024"],
+                "mode": "job",
+                "limits": {"timeout": 300}
             }
         ],
         "response_format": {
@@ -212,5 +351,26 @@ def get_execute_info():
         }
     })
 
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = runner.get(job_id)
+    if job is None:
+        return jsonify({
+            "error": f"Job '{job_id}' not found (finished jobs are kept for {PYRUNNER_JOB_TTL} seconds, at most {PYRUNNER_MAX_JOBS} of them)",
+            "status": "not_found"
+        }), 404
+    # ?since=<next_since from the previous poll> returns only the stdout lines printed since then
+    return jsonify(job_response(job, request.args.get('since', 0, type=int)))
+
+@app.route("/api/jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    job = runner.cancel(job_id)
+    if job is None:
+        return jsonify({
+            "error": f"Job '{job_id}' not found",
+            "status": "not_found"
+        }), 404
+    return jsonify(job_response(job))
+
 if __name__ == "__main__":
     app.run(host='0.0.0.0', debug=True)
\ No newline at end of file
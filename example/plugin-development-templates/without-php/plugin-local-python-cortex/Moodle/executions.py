@@ -0,0 +1,340 @@
+"""
+Streaming and background executions for /api/execute.
+
+The warm pool in worker_pool.py suits short calls, but it buffers a script's
+output and holds the HTTP request until the script is done. For long Cortex
+analyses there are two other modes, both running the script in a process of
+its own:
+
+- stream: stdout and stderr lines are handed to the caller as the script
+  prints them (the app forwards them as server-sent events).
+- job: the script runs in the background; the caller gets a job id and polls
+  it for status, the output so far and the result.
+
+Each execution runs under Limits: a wall-clock timeout, CPU seconds and
+address space (set with setrlimit in the child before the script starts) and
+a cap on the output kept. An execution that hits one is killed together with
+its process group and ends with that status. At most max_concurrent
+executions run at once. A stream that finds no free slot is refused with
+RunnerBusy; jobs wait in a queue of at most queue_size.
+
+Finished jobs, output included, are kept for job_ttl seconds so they can be
+polled. At most max_jobs are kept; beyond that the oldest finished ones are
+dropped first.
+"""
+import os
+import sys
+import math
+import time
+import uuid
+import queue
+import signal
+import logging
+import threading
+import subprocess
+from collections import namedtuple, deque
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+FINISHED = 'finished'  # exited on its own, whatever the return code
+FAILED = 'failed'  # could not be started
+TIMEOUT = 'timeout'
+CPU_LIMIT = 'cpu_limit'
+OUTPUT_LIMIT = 'output_limit'
+CANCELLED = 'cancelled'
+
+class RunnerBusy(Exception):
+    pass
+
+class Limits(namedtuple('Limits', 'timeout cpu_seconds memory_mb max_output_bytes')):
+    """Per-execution limits; 0 disables a limit"""
+    __slots__ = ()
+
+    def narrowed(self, requested):
+        """These limits lowered (never raised) by the ones a request asked for"""
+        if not isinstance(requested, dict):
+            return self
+        values = []
+        for field, ceiling in zip(self._fields, self):
+            value = requested.get(field)
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+                values.append(ceiling)
+            else:
+                values.append(min(value, ceiling) if ceiling else value)
+        return Limits(*values)
+
+# ----------------- Child Process -----------------
+def _limited_main(cpu_seconds, memory_mb, argv):
+    """Apply the resource limits to this process, then become the script"""
+    import resource
+    if cpu_seconds:
+        # SIGXCPU at the soft limit, SIGKILL a second later
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    if memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    os.execv(sys.executable, [sys.executable, '-u'] + argv)
+
+# ----------------- Executions -----------------
+class Execution:
+    def __init__(self, path, json_arguments, limits, cwd, on_exit=None, stream=False):
+        self.limits = limits
+        self.status = RUNNING
+        self.return_code = None
+        self.stdout = []
+        self.stderr = []
+        self.started_at = time.time()
+        self.finished_at = None
+        self._output_bytes = 0
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._on_exit = on_exit
+        self._events = queue.Queue() if stream else None
+
+        argv = [path] + ([json_arguments] if json_arguments else [])
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__),
+             str(math.ceil(limits.cpu_seconds)), str(math.ceil(limits.memory_mb))] + argv,
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            cwd=cwd, start_new_session=True, env=dict(os.environ, PYTHONUNBUFFERED='1')
+        )
+        self._readers = [
+            threading.Thread(target=self._read, args=(self.process.stdout, 'stdout', self.stdout), daemon=True),
+            threading.Thread(target=self._read, args=(self.process.stderr, 'stderr', self.stderr), daemon=True),
+        ]
+        for reader in self._readers:
+            reader.start()
+        self._timer = None
+        if limits.timeout:
+            self._timer = threading.Timer(limits.timeout, self.kill, (TIMEOUT,))
+            self._timer.daemon = True
+            self._timer.start()
+        threading.Thread(target=self._wait, name='pyrunner-execution', daemon=True).start()
+
+    def _read(self, pipe, name, lines):
+        for raw in iter(pipe.readline, b''):
+            line = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+            with self._lock:
+                self._output_bytes += len(raw)
+                over = self.limits.max_output_bytes and self._output_bytes > self.limits.max_output_bytes
+                if not over:
+                    lines.append(line)
+            if over:
+                self.kill(OUTPUT_LIMIT)
+                break
+            if self._events is not None:
+                self._events.put((name, line))
+        pipe.close()
+
+    def _wait(self):
+        for reader in self._readers:
+            reader.join()
+        return_code = self.process.wait()
+        if self._timer is not None:
+            self._timer.cancel()
+        with self._lock:
+            self.return_code = return_code
+            if self.status == RUNNING:
+                self.status = CPU_LIMIT if return_code == -signal.SIGXCPU else FINISHED
+            self.finished_at = time.time()
+        if self._events is not None:
+            self._events.put(None)
+        self._done.set()
+        if self._on_exit is not None:
+            self._on_exit(self)
+
+    def kill(self, reason=CANCELLED):
+        """Stop the script and anything it started; no-op once it has ended"""
+        with self._lock:
+            if self.status != RUNNING:
+                return
+            self.status = reason
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def events(self, heartbeat=15):
+        """Yield ('stdout' or 'stderr', line) as the script prints, None after heartbeat seconds of silence"""
+        while True:
+            try:
+                event = self._events.get(timeout=heartbeat)
+            except queue.Empty:
+                yield None
+                continue
+            if event is None:
+                return
+            yield event
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, since=0):
+        """Return code and output; stdout from line `since` on, next_since is where the next poll starts"""
+        with self._lock:
+            return {
+                "return_code": self.return_code,
+                "stdout": "".join(line + "\n" for line in self.stdout[since:]),
+                "stderr": "".join(line + "\n" for line in self.stderr),
+                "next_since": len(self.stdout),
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+class Job:
+    def __init__(self, path, json_arguments, limits, info=None):
+        self.id = uuid.uuid4().hex
+        self.path = path
+        self.json_arguments = json_arguments
+        self.limits = limits
+        self.info = dict(info or {})  # echoed back on every poll (filename, arguments)
+        self.created_at = time.time()
+        self.execution = None
+        self.cancelled_at = None
+        self.error = None
+
+    @property
+    def status(self):
+        if self.error is not None:
+            return FAILED
+        if self.execution is None:
+            return CANCELLED if self.cancelled_at else QUEUED
+        return self.execution.status
+
+    @property
+    def done(self):
+        if self.execution is None:
+            return self.error is not None or self.cancelled_at is not None
+        return self.execution.done
+
+    @property
+    def finished_at(self):
+        if self.execution is not None:
+            return self.execution.finished_at
+        return self.cancelled_at or (self.created_at if self.error is not None else None)
+
+    def to_dict(self, since=0):
+        data = dict(self.info, job_id=self.id, status=self.status, created_at=self.created_at,
+                    limits=self.limits._asdict())
+        if self.execution is not None:
+            data.update(self.execution.result(since))
+        if self.error is not None:
+            data["error"] = self.error
+        return data
+
+class Runner:
+    def __init__(self, cwd, limits, max_concurrent=2, queue_size=32, job_ttl=3600, max_jobs=64):
+        self.cwd = cwd
+        self.limits = limits
+        self.max_concurrent = max(1, max_concurrent)
+        self.queue_size = max(0, queue_size)
+        self.job_ttl = job_ttl
+        self.max_jobs = max(1, max_jobs)
+        self._running = 0
+        self._pending = deque()
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def stream(self, path, json_arguments, limits=None):
+        """Start a streamed execution now, or raise RunnerBusy if every slot is taken"""
+        with self._lock:
+            if self._running >= self.max_concurrent:
+                raise RunnerBusy(f"All {self.max_concurrent} execution slots are busy")
+            self._running += 1
+        try:
+            return Execution(path, json_arguments, limits or self.limits, self.cwd, on_exit=self._finished, stream=True)
+        except Exception:
+            self._finished(None)
+            raise
+
+    def submit(self, path, json_arguments, limits=None, info=None):
+        """Queue a job; it starts as soon as a slot is free. Raises RunnerBusy if the queue is full."""
+        job = Job(path, json_arguments, limits or self.limits, info)
+        with self._lock:
+            self._prune()
+            start = self._running < self.max_concurrent
+            if not start and len(self._pending) >= self.queue_size:
+                raise RunnerBusy(f"All {self.max_concurrent} execution slots are busy and {len(self._pending)} jobs are queued")
+            self._jobs[job.id] = job
+            if start:
+                self._running += 1
+            else:
+                self._pending.append(job)
+        if start:
+            self._start(job)
+        return job
+
+    def _start(self, job):
+        if job.cancelled_at is not None:
+            self._finished(None)
+            return
+        try:
+            execution = Execution(job.path, job.json_arguments, job.limits, self.cwd, on_exit=self._finished)
+        except Exception as e:
+            logger.error(f"Could not start job {job.id}: {e}")
+            job.error = str(e)
+            self._finished(None)
+            return
+        with self._lock:
+            job.execution = execution
+            cancelled = job.cancelled_at is not None
+        # Cancelled after it left the queue but before its execution was set
+        if cancelled:
+            execution.kill(CANCELLED)
+
+    def _finished(self, execution):
+        """An execution ended (or failed to start): free its slot for the next queued job"""
+        next_job = None
+        with self._lock:
+            self._prune()
+            self._running -= 1
+            if self._pending:
+                next_job = self._pending.popleft()
+                self._running += 1
+        if next_job is not None:
+            self._start(next_job)
+
+    def _prune(self):
+        """Drop finished jobs past job_ttl, then the oldest finished ones beyond max_jobs"""
+        cutoff = time.time() - self.job_ttl
+        finished = sorted((job for job in self._jobs.values() if job.done), key=lambda job: job.finished_at or 0)
+        excess = len(self._jobs) - self.max_jobs
+        for index, job in enumerate(finished):
+            if index < excess or (job.finished_at or 0) < cutoff:
+                del self._jobs[job.id]
+
+    def get(self, job_id):
+        with self._lock:
+            self._prune()
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns it, or None if unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job.execution is None and not job.done:
+                job.cancelled_at = time.time()
+                # A job _finished just took off the queue is no longer in it; _start skips or kills it
+                if job in self._pending:
+                    self._pending.remove(job)
+                return job
+        if job.execution is not None:
+            job.execution.kill(CANCELLED)
+        return job
+
+    def stats(self):
+        with self._lock:
+            return {"running": self._running, "queued": len(self._pending), "jobs": len(self._jobs),
+                    "max_jobs": self.max_jobs, "max_concurrent": self.max_concurrent, "queue_size": self.queue_size,
+                    "limits": self.limits._asdict()}
+
+if __name__ == "__main__":
+    _limited_main(int(sys.argv[1]), int(sys.argv[2]), sys.argv[3:])
@@ -0,0 +1,281 @@
+"""
+Warm worker processes for /api/execute.
+
+Starting a fresh interpreter per request costs interpreter startup plus
+re-importing requests and friends before the script does any work. Instead,
+a few long-lived workers (this file run as a script) import the scripts once
+and run them on demand:
+
+- A script with a main() function is imported as a module (so its
+  `if __name__ == "__main__"` block does not fire) and main() is called with
+  sys.argv set to [script, json_arguments], exactly as on the command line.
+  A SystemExit code is the return code, as is an int returned by main();
+  any other return value counts as 0.
+- A script without main() is run top to bottom with runpy on each call.
+
+Modules are re-imported when the script file changes. stdout and stderr are
+captured per call and stdin is /dev/null. Workers talk to the pool over stdin/stdout, one JSON line
+per request and per response.
+
+A worker is replaced after max_runs calls, when it crashes, or when a call
+exceeds its timeout. Callers wait at most `timeout` seconds for a free worker,
+and at most queue_size may wait; beyond that execute() raises PoolBusy.
+"""
+import os
+import io
+import ast
+import sys
+import json
+import time
+import runpy
+import atexit
+import select
+import logging
+import threading
+import traceback
+import subprocess
+import importlib.util
+from contextlib import redirect_stdout, redirect_stderr
+
+logger = logging.getLogger(__name__)
+
+STARTUP_TIMEOUT = 60
+RESPAWN_DELAY = 5
+
+class PoolBusy(Exception):
+    pass
+
+class WorkerTimeout(Exception):
+    pass
+
+class WorkerCrashed(Exception):
+    pass
+
+# ----------------- Worker Process -----------------
+_modules = {}  # script path -> (mtime, module or None when it has no main())
+
+def _load(path):
+    mtime = os.path.getmtime(path)
+    cached = _modules.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'rb') as f:
+        tree = ast.parse(f.read(), path)
+    # Only import scripts that define main(); importing the others would run them
+    module = None
+    if any(isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == 'main' for node in tree.body):
+        name = "pyrunner_" + os.path.splitext(os.path.basename(path))[0]
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        if not callable(getattr(module, 'main', None)):
+            module = None
+    _modules[path] = (mtime, module)
+    return module
+
+def _exit_code(code):
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return int(code)  # sys.exit(True) exits with 1
+    print(code, file=sys.stderr)
+    return 1
+
+def _run_script(path, json_arguments):
+    stdout, stderr = io.StringIO(), io.StringIO()
+    sys.argv = [path] + ([json_arguments] if json_arguments else [])
+    with redirect_stdout(stdout), redirect_stderr(stderr):
+        try:
+            module = _load(path)
+            if module is None:
+                runpy.run_path(path, run_name='__main__')
+                return_code = 0
+            else:
+                result = module.main()
+                # The command line ignores main()'s return unless the script passes it to sys.exit
+                return_code = result if isinstance(result, int) and not isinstance(result, bool) else 0
+        except SystemExit as e:
+            return_code = _exit_code(e.code)
+        except BaseException:
+            traceback.print_exc()
+            return_code = 1
+    return {"return_code": return_code, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+def _worker_main(scripts_path, preload):
+    # Responses go to the original stdout; anything else writing to fd 1 lands on stderr
+    protocol = os.fdopen(os.dup(1), 'w', encoding='utf-8')
+    os.dup2(2, 1)
+    # Requests come from the original stdin; scripts that read stdin get EOF
+    requests = os.fdopen(os.dup(0), 'r', encoding='utf-8')
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    sys.stdin = open(os.devnull, 'r')
+    os.chdir(scripts_path)
+    sys.path.insert(0, scripts_path)
+
+    preloaded = []
+    for filename in preload:
+        path = os.path.join(scripts_path, filename)
+        try:
+            with redirect_stdout(sys.stderr):
+                _load(path)
+            preloaded.append(filename)
+        except Exception as e:
+            print(f"Could not preload {filename}: {e}", file=sys.stderr)
+    protocol.write(json.dumps({"ready": True, "preloaded": preloaded}) + "\n")
+    protocol.flush()
+
+    for line in requests:
+        request = json.loads(line)
+        result = _run_script(request["path"], request.get("arguments"))
+        protocol.write(json.dumps(result) + "\n")
+        protocol.flush()
+
+# ----------------- Pool -----------------
+class _Worker:
+    def __init__(self, scripts_path, preload):
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), scripts_path] + list(preload),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0, cwd=scripts_path
+        )
+        self.runs = 0
+        self._buffer = b""
+        self.ready = self._read(STARTUP_TIMEOUT)
+
+    def _read(self, timeout):
+        """Next JSON line from the worker within timeout seconds"""
+        deadline = time.monotonic() + timeout
+        fd = self.process.stdout.fileno()
+        while b"\n" not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise WorkerTimeout(f"Worker {self.process.pid} did not answer within {timeout}s")
+            readable, _, _ = select.select([fd], [], [], remaining)
+            if not readable:
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise WorkerCrashed(f"Worker {self.process.pid} exited with code {self.process.wait()}")
+            self._buffer += chunk
+        line, _, self._buffer = self._buffer.partition(b"\n")
+        return json.loads(line)
+
+    def call(self, path, json_arguments, timeout):
+        self.runs += 1
+        try:
+            self.process.stdin.write((json.dumps({"path": path, "arguments": json_arguments}) + "\n").encode('utf-8'))
+        except (BrokenPipeError, OSError):
+            raise WorkerCrashed(f"Worker {self.process.pid} is gone")
+        return self._read(timeout)
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+
+class WorkerPool:
+    def __init__(self, scripts_path, size=4, max_runs=100, queue_size=16, timeout=60, preload=()):
+        self.scripts_path = scripts_path
+        self.size = max(1, size)
+        self.max_runs = max_runs
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.preload = list(preload)
+        self._idle = []
+        self._workers = set()
+        self._waiting = 0
+        self._starting = 0
+        self._started = False
+        self._cond = threading.Condition()
+        atexit.register(self.shutdown)
+
+    def start(self):
+        """Spawn the workers in the background; safe to call more than once"""
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+        for _ in range(self.size):
+            self._spawn_later(0)
+
+    def _spawn_later(self, delay):
+        with self._cond:
+            self._starting += 1
+        threading.Thread(target=self._spawn, args=(delay,), name='pyrunner-spawn', daemon=True).start()
+
+    def _spawn(self, delay):
+        time.sleep(delay)
+        try:
+            worker = _Worker(self.scripts_path, self.preload)
+        except Exception as e:
+            logger.error(f"Could not start a Python worker, retrying in {RESPAWN_DELAY}s: {e}")
+            with self._cond:
+                self._starting -= 1
+            self._spawn_later(RESPAWN_DELAY)
+            return
+        with self._cond:
+            self._starting -= 1
+            self._workers.add(worker)
+            self._idle.append(worker)
+            self._cond.notify()
+
+    def _retire(self, worker):
+        """Stop a worker and start its replacement"""
+        with self._cond:
+            self._workers.discard(worker)
+        worker.stop()
+        self._spawn_later(0)
+
+    def _checkout(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            # Workers still starting up will take callers too
+            if not self._idle and self._waiting >= self.queue_size + self._starting:
+                raise PoolBusy(f"All {self.size} workers are busy and {self._waiting} calls are queued")
+            self._waiting += 1
+            try:
+                while not self._idle:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolBusy(f"No worker became free within {self.timeout}s")
+                    self._cond.wait(remaining)
+                return self._idle.pop()
+            finally:
+                self._waiting -= 1
+
+    def execute(self, path, json_arguments=None):
+        """Run a script in a warm worker; returns {return_code, stdout, stderr}"""
+        self.start()
+        worker = self._checkout()
+        try:
+            result = worker.call(path, json_arguments, self.timeout)
+        except WorkerTimeout:
+            self._retire(worker)
+            raise
+        except WorkerCrashed as e:
+            self._retire(worker)
+            return {"return_code": worker.process.returncode or 1, "stdout": "", "stderr": str(e)}
+        if worker.runs >= self.max_runs:
+            self._retire(worker)
+        else:
+            with self._cond:
+                self._idle.append(worker)
+                self._cond.notify()
+        return result
+
+    def stats(self):
+        with self._cond:
+            return {"workers": len(self._workers), "starting": self._starting, "idle": len(self._idle), "queued": self._waiting,
+                    "size": self.size, "queue_size": self.queue_size}
+
+    def shutdown(self):
+        with self._cond:
+            workers = list(self._workers)
+            self._workers.clear()
+            self._idle.clear()
+        for worker in workers:
+            worker.stop()
+
+if __name__ == "__main__":
+    _worker_main(sys.argv[1], sys.argv[2:])
@@ -110,9 +110,9 @@ echo $OUTPUT->header();
                 <input type="hidden" id="modal-assignment-id" name="assignment_id">
                 
                 <div class="form-group">
-                    <label for="solution-file">Select Solution PDF:</label>
-                    <input type="file" id="solution-file" name="solution_file" accept=".pdf" required>
-                    <small class="form-text">Only PDF files are allowed (max 16MB)</small>
+                    <label for="solution-file">Select Solution PDF or Page Photos:</label>
+                    <input type="file" id="solution-file" name="solution_file" accept=".pdf,.png,.jpg,.jpeg" multiple required>
+                    <small class="form-text">PDF or image files; several files are combined in the order selected (max 16MB in total)</small>
                 </div>
                 
                 <div class="modal-progress" id="upload-progress" style="display: none;">
@@ -75,7 +75,7 @@ echo $OUTPUT->header();
     <div id="chat-input-container">
         <?php if ($enable_file_upload): ?>
         <div id="file-upload-container">
-            <input type="file" id="file-input" accept=".<?php echo str_replace(',', ',.', $allowed_extensions); ?>" style="display: none;">
+            <input type="file" id="file-input" multiple accept=".<?php echo str_replace(',', ',.', $allowed_extensions); ?>" style="display: none;">
             <button id="file-upload-btn" class="btn btn-outline-secondary" title="<?php echo get_string('upload_file', 'local_chatbot'); ?>">
                 📎
             </button>
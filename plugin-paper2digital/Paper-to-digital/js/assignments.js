@@ -295,20 +295,26 @@ M.local_chatbot_assignments = {
   },
 
   validateFile: function (fileInput) {
-    var file = fileInput.files[0];
+    var allowedTypes = ["application/pdf", "image/png", "image/jpeg"];
+    var totalSize = 0;
     var errorMsg = "";
 
-    if (file) {
+    for (var i = 0; i < fileInput.files.length; i++) {
+      var file = fileInput.files[i];
+      totalSize += file.size;
+
       // Check file type
-      if (file.type !== "application/pdf") {
-        errorMsg = "Please select a valid PDF file.";
-      }
-      // Check file size (16MB limit)
-      else if (file.size > 16 * 1024 * 1024) {
-        errorMsg = "File size must be less than 16MB.";
+      if (allowedTypes.indexOf(file.type) === -1) {
+        errorMsg = "Please select PDF or image (PNG/JPG) files only.";
+        break;
       }
     }
 
+    // Check total size (16MB limit)
+    if (!errorMsg && totalSize > 16 * 1024 * 1024) {
+      errorMsg = "Total file size must be less than 16MB.";
+    }
+
     // Display error or clear previous error
     var existingError = fileInput.parentNode.querySelector('.file-error');
     if (existingError) {
@@ -336,7 +342,7 @@ M.local_chatbot_assignments = {
     var assignmentId = document.getElementById("modal-assignment-id").value;
 
     if (!fileInput.files.length) {
-      alert("Please select a PDF file to upload.");
+      alert("Please select a PDF or image file to upload.");
       return;
     }
 
@@ -345,8 +351,6 @@ M.local_chatbot_assignments = {
       return;
     }
 
-    var file = fileInput.files[0];
-
     // Show progress
     var progressDiv = document.getElementById("upload-progress");
     var submitBtn = form.querySelector('button[type="submit"]');
@@ -360,7 +364,9 @@ M.local_chatbot_assignments = {
     // Create FormData
     var formData = new FormData();
     formData.append("assignment_id", assignmentId);
-    formData.append("solution_file", file);
+    for (var i = 0; i < fileInput.files.length; i++) {
+      formData.append("solution_file", fileInput.files[i]);
+    }
 
     fetch(this.config.apiUrl + "/submit_solution", {
       method: "POST",
@@ -403,8 +409,12 @@ M.local_chatbot_assignments = {
 
         self.showModal("success-modal");
 
-        // Reload assignments to reflect changes
-        self.loadAssignments();
+        // The Drive upload finishes in the background; reload once it is stored
+        if (data.upload_job) {
+          self.waitForUpload(data.upload_job, 0);
+        } else {
+          self.loadAssignments();
+        }
       })
       .catch(function (error) {
         console.error("Error submitting solution:", error);
@@ -422,6 +432,29 @@ M.local_chatbot_assignments = {
       });
   },
 
+  waitForUpload: function (jobId, attempt) {
+    var self = this;
+
+    fetch(this.config.apiUrl + "/submit_solution/status/" + encodeURIComponent(jobId))
+      .then(function (response) {
+        return response.json();
+      })
+      .then(function (job) {
+        if (job.state === "pending" || job.state === "running") {
+          if (attempt < 30) {
+            setTimeout(function () {
+              self.waitForUpload(jobId, attempt + 1);
+            }, 2000);
+            return;
+          }
+        }
+        self.loadAssignments();
+      })
+      .catch(function () {
+        self.loadAssignments();
+      });
+  },
+
   formatFeedback: function (feedback) {
     if (!feedback) return "No feedback available.";
     
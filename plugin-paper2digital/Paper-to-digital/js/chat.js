@@ -67,7 +67,7 @@ M.local_chatbot = {
         .getElementById("file-input")
         .addEventListener("change", function (e) {
           if (e.target.files.length > 0) {
-            self.uploadFile(e.target.files[0]);
+            self.uploadFiles(e.target.files);
           }
         });
     }
@@ -132,35 +132,44 @@ M.local_chatbot = {
     this.callAPIWithJSON("/chat", requestData);
   },
 
-  uploadFile: function (file) {
-    var self = this;
+  uploadFiles: function (files) {
+    // Several files (e.g. photos of an answer sheet) are sent as one ordered document
+    var names = [];
 
-    // Check file size
-    if (file.size > this.config.maxFileSize) {
-      alert(
-        "File size exceeds maximum allowed size of " +
-          this.config.maxFileSize / (1024 * 1024) +
-          "MB"
-      );
-      return;
-    }
+    for (var i = 0; i < files.length; i++) {
+      var file = files[i];
+
+      // Check file size
+      if (file.size > this.config.maxFileSize) {
+        alert(
+          "File size exceeds maximum allowed size of " +
+            this.config.maxFileSize / (1024 * 1024) +
+            "MB"
+        );
+        return;
+      }
 
-    // Check file extension
-    var ext = file.name.split(".").pop().toLowerCase();
-    if (this.config.allowedExtensions.indexOf(ext) === -1) {
-      alert(
-        "File type not allowed. Allowed types: " +
-          this.config.allowedExtensions.join(", ")
-      );
-      return;
+      // Check file extension
+      var ext = file.name.split(".").pop().toLowerCase();
+      if (this.config.allowedExtensions.indexOf(ext) === -1) {
+        alert(
+          "File type not allowed. Allowed types: " +
+            this.config.allowedExtensions.join(", ")
+        );
+        return;
+      }
+
+      names.push(file.name);
     }
 
-    this.addMessage("user", "Uploading file: " + file.name, true);
+    this.addMessage("user", "Uploading file: " + names.join(", "), true);
     this.showTypingIndicator();
 
     // Use FormData for file uploads
     var formData = new FormData();
-    formData.append("file", file);
+    for (var j = 0; j < files.length; j++) {
+      formData.append("file", files[j]);
+    }
     formData.append("session_id", this.sessionId);
     formData.append("language", this.currentLanguage);
 
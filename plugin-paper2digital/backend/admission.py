@@ -0,0 +1,145 @@
+"""
+Admission control for expensive requests.
+
+Work classes (OCR, Gemini, Drive) each get a SlotPool: a fixed number of
+slots and a bounded wait queue, taken around the OCR run, Gemini call or
+Drive transfer itself. An interactive caller that finds every slot busy
+waits up to max_wait seconds in the queue. If the queue is already full, or
+the wait runs out, it is shed with Overloaded, which becomes a 503 with
+Retry-After. Callers that must not be shed (bulk grading, prefetch,
+background jobs) pass shed=False and simply wait, but they never take the
+last `reserved` slots, so a class of background work cannot lock students
+out.
+
+RateLimiter keeps per-key token buckets (per minute and per hour) for
+sessions and users. A key over either budget is refused with the number of
+seconds until a token is available, which becomes a 429 with Retry-After.
+
+Neither touches requests that do not ask for admission, so cheap routes stay
+fast however long the OCR backlog gets.
+"""
+import math
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import metrics
+
+class Overloaded(Exception):
+    def __init__(self, status, retry_after, reason, work_class=None):
+        super().__init__(f"{work_class or 'request'} shed ({reason}), retry after {retry_after}s")
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+        self.work_class = work_class
+
+class SlotPool:
+    def __init__(self, name, slots, queue_size, max_wait=10.0, reserved=0):
+        self.name = name
+        self.slots = max(1, slots)
+        self.queue_size = max(0, queue_size)
+        self.max_wait = max_wait
+        self.reserved = min(max(0, reserved), self.slots - 1)  # slots only callers that can be shed may take
+        self._cond = threading.Condition()
+        self._in_use = 0
+        self._waiting = 0
+        self._queued = 0  # waiters that can be shed; only they count against queue_size
+        self._hold_seconds = 1.0  # moving average of how long a slot is held
+        metrics.ADMISSION_IN_USE.set_function(lambda: self._in_use, work_class=name)
+        metrics.ADMISSION_QUEUE_DEPTH.set_function(lambda: self._waiting, work_class=name)
+
+    def check(self):
+        """Raise Overloaded if a new request would be shed right away, without taking a slot"""
+        with self._cond:
+            saturated = self._in_use >= self.slots and self._queued >= self.queue_size
+        if saturated:
+            raise self._shed('queue_full')
+
+    def retry_after(self):
+        """Seconds until the current backlog has likely drained"""
+        with self._cond:
+            backlog = self._queued + 1
+            return max(1, math.ceil(self._hold_seconds * backlog / self.slots))
+
+    def _shed(self, reason):
+        metrics.ADMISSION_SHED.inc(work_class=self.name, reason=reason)
+        return Overloaded(503, self.retry_after(), reason, self.name)
+
+    def acquire(self, shed=True):
+        """Take a slot; returns the time it was taken. Raises Overloaded if shed and none frees up in time."""
+        start = time.monotonic()
+        limit = self.slots if shed else self.slots - self.reserved
+        with self._cond:
+            if self._in_use >= limit:
+                if shed and self._queued >= self.queue_size:
+                    raise self._shed('queue_full')
+                deadline = start + self.max_wait if shed else None
+                self._waiting += 1
+                self._queued += shed
+                try:
+                    while self._in_use >= limit:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            raise self._shed('wait_timeout')
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+                    self._queued -= shed
+            self._in_use += 1
+        acquired = time.monotonic()
+        metrics.ADMISSION_WAIT_SECONDS.observe(acquired - start, work_class=self.name)
+        return acquired
+
+    def release(self, acquired):
+        held = time.monotonic() - acquired
+        with self._cond:
+            self._in_use -= 1
+            self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * held
+            # Waiters differ in how many slots they may use, so wake them all
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, shed=True):
+        acquired = self.acquire(shed)
+        try:
+            yield
+        finally:
+            self.release(acquired)
+
+class RateLimiter:
+    def __init__(self, name, per_minute=0, per_hour=0, max_keys=10000):
+        """A limit of 0 disables that budget"""
+        self.name = name
+        self.budgets = [
+            (limit, limit / period) for limit, period in ((per_minute, 60.0), (per_hour, 3600.0)) if limit > 0
+        ]
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> ([tokens per budget], last refill), least recently used first
+        self._lock = threading.Lock()
+
+    def check(self, key):
+        """Spend one token for key; returns 0 if allowed, else seconds until it would be"""
+        if not self.budgets or not key:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            entry = self._buckets.pop(key, None)
+            if entry is None:
+                tokens = [float(limit) for limit, _ in self.budgets]
+            else:
+                tokens, last = entry
+                tokens = [min(limit, level + (now - last) * rate)
+                          for level, (limit, rate) in zip(tokens, self.budgets)]
+            wait = max(
+                (0 if level >= 1 else (1 - level) / rate) for level, (_, rate) in zip(tokens, self.budgets)
+            )
+            if wait == 0:
+                tokens = [level - 1 for level in tokens]
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        if wait:
+            metrics.ADMISSION_SHED.inc(work_class='rate_limit', reason=self.name)
+            return max(1, math.ceil(wait))
+        return 0
@@ -1,20 +1,47 @@
 import os
 import snowflake.connector
 import requests
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, Request, request, jsonify, make_response, g, Response, send_file, abort, stream_with_context
 from pydrive2.auth import GoogleAuth
 from pydrive2.drive import GoogleDrive
 from doctr.io import DocumentFile
 from doctr.models import ocr_predictor
+from PIL import Image
+from PyPDF2 import PdfReader, PdfWriter
+import io
 import ssl
 import logging
 import json
 import uuid
+import time
+import zipfile
+import hmac
+import hashlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from werkzeug.utils import secure_filename
 import tempfile
 from datetime import datetime
 from dotenv import load_dotenv
 from flask_cors import CORS
+import metrics
+import tracing
+from ocr_pool import OCRPool
+from ocr_result import OCRDocument
+from write_behind import WriteBehindQueue, RetryLater
+from write_buffer import WriteBuffer, RowsRejected
+from page_cache import PageCache, page_hash
+import segmentation
+import prompt_budget
+import text_compaction
+import ocr_storage
+import summary_tree
+import practice_bank
+import warmup
+import admission
+import ocr_scheduler
+import breaker
+from singleflight import SingleFlight
 
 # Load environment variables
 load_dotenv()
@@ -22,14 +49,25 @@ load_dotenv()
 # Configure SSL (if needed)
 ssl._create_default_https_context = ssl._create_unverified_context
 
-# Configure logging
+# Configure logging (every record carries the current request's trace id)
+tracing.install_log_record_factory()
 log_level = getattr(logging, os.getenv('LOG_LEVEL', 'INFO').upper())
-log_format = os.getenv('LOG_FORMAT', '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+log_format = os.getenv('LOG_FORMAT', '%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s')
 logging.basicConfig(level=log_level, format=log_format)
 logger = logging.getLogger(__name__)
 
 # ----------------- Flask Configuration -----------------
+# Uploads up to this size stay in memory; larger ones roll over to a temp file
+UPLOAD_SPOOL_MAX_BYTES = int(os.getenv('UPLOAD_SPOOL_MAX_BYTES', 8 * 1024 * 1024))
+MAX_UPLOAD_FILES = int(os.getenv('MAX_UPLOAD_FILES', 20))
+
+class SpooledUploadRequest(Request):
+    """Spool uploaded files in memory instead of Werkzeug's 500 KB disk threshold"""
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_BYTES)
+
 app = Flask(__name__)
+app.request_class = SpooledUploadRequest
 
 # Configure CORS properly - SINGLE CORS SETUP
 CORS(app, 
@@ -49,9 +87,120 @@ ALLOWED_EXTENSIONS = set(os.getenv('ALLOWED_EXTENSIONS', 'pdf,png,jpg,jpeg').spl
 # Google Drive configuration for assignments
 ASSIGNMENTS_FOLDER_ID = os.getenv('GOOGLE_DRIVE_ASSIGNMENTS_FOLDER_ID', '1example-folder-id-for-assignments')
 
+# Bulk grading limits
+BULK_MAX_STUDENTS = int(os.getenv('BULK_MAX_STUDENTS', 200))
+BULK_MAX_UNCOMPRESSED_BYTES = int(os.getenv('BULK_MAX_UNCOMPRESSED_BYTES', 512 * 1024 * 1024))
+BULK_OCR_BATCH_DOCUMENTS = int(os.getenv('BULK_OCR_BATCH_DOCUMENTS', 8))
+BULK_GEMINI_CONCURRENCY = int(os.getenv('BULK_GEMINI_CONCURRENCY', 4))
+BULK_DRIVE_CONCURRENCY = int(os.getenv('BULK_DRIVE_CONCURRENCY', 4))
+
+# Per-question scoring: Gemini calls in flight per solution
+SCORING_CONCURRENCY = int(os.getenv('SCORING_CONCURRENCY', 6))
+
+# Input token budgets per prompt (instructions + material + uploads + question)
+QA_PROMPT_TOKENS = int(os.getenv('QA_PROMPT_TOKENS', 3000))
+PRACTICE_PROMPT_TOKENS = int(os.getenv('PRACTICE_PROMPT_TOKENS', 2500))
+SCORING_PROMPT_TOKENS = int(os.getenv('SCORING_PROMPT_TOKENS', 2000))
+
+# Course summary tree used as context for questions across all chapters
+SUMMARY_CHUNK_TOKENS = int(os.getenv('SUMMARY_CHUNK_TOKENS', 1500))
+SUMMARY_INPUT_TOKENS = int(os.getenv('SUMMARY_INPUT_TOKENS', 6000))
+SUMMARY_CONCURRENCY = int(os.getenv('SUMMARY_CONCURRENCY', 4))
+SUMMARY_REFRESH_MINUTES = float(os.getenv('SUMMARY_REFRESH_MINUTES', 0))  # 0 disables the background job
+SUMMARY_PASSAGE_TOKENS = int(os.getenv('SUMMARY_PASSAGE_TOKENS', 300))
+
+# Pre-generated practice questions per chapter and language
+PRACTICE_SAMPLE_SIZE = int(os.getenv('PRACTICE_SAMPLE_SIZE', 5))
+PRACTICE_BANK_SIZE = int(os.getenv('PRACTICE_BANK_SIZE', 30))  # target questions per chapter and language
+PRACTICE_BANK_MAX = int(os.getenv('PRACTICE_BANK_MAX', 90))  # growth cap when sessions exhaust a bank
+PRACTICE_QUESTIONS_PER_CALL = int(os.getenv('PRACTICE_QUESTIONS_PER_CALL', 8))
+PRACTICE_REFRESH_MINUTES = float(os.getenv('PRACTICE_REFRESH_MINUTES', 0))  # 0 disables the background job
+PRACTICE_LANGUAGES = os.getenv('PRACTICE_LANGUAGES', 'en').split(',')  # banks built by the offline job
+
+# Speculative warm-up of course material when a course or chapter is selected
+PREFETCH_WORKERS = int(os.getenv('PREFETCH_WORKERS', 2))
+PREFETCH_MAX_PENDING = int(os.getenv('PREFETCH_MAX_PENDING', 32))
+MATERIAL_CACHE_SECONDS = float(os.getenv('MATERIAL_CACHE_SECONDS', 900))  # 0 disables the in-process cache
+MATERIAL_CACHE_ENTRIES = int(os.getenv('MATERIAL_CACHE_ENTRIES', 64))
+
+# Coalescing of identical concurrent OCR, Drive and Gemini work; the lock directory extends it across processes
+SINGLE_FLIGHT_DIR = os.getenv('SINGLE_FLIGHT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spool', 'locks'))
+SINGLE_FLIGHT_LOCK_TIMEOUT = float(os.getenv('SINGLE_FLIGHT_LOCK_TIMEOUT', 600))
+
+# Journal for Drive uploads and score writes that run after /submit_solution responds
+WRITE_BEHIND_DB = os.getenv('WRITE_BEHIND_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spool', 'write_behind.sqlite3'))
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv('WRITE_BEHIND_MAX_ATTEMPTS', 8))
+WRITE_BEHIND_LEASE_SECONDS = float(os.getenv('WRITE_BEHIND_LEASE_SECONDS', 900))
+
+# Batched OCR cache and scoring cache writes: flushed by size or age
+WRITE_BUFFER_MAX_ROWS = int(os.getenv('WRITE_BUFFER_MAX_ROWS', 100))
+WRITE_BUFFER_MAX_DELAY = float(os.getenv('WRITE_BUFFER_MAX_DELAY', 2.0))
+WRITE_BUFFER_MAX_PENDING = int(os.getenv('WRITE_BUFFER_MAX_PENDING', 10000))
+
+# Admission control: concurrent slots and bounded wait queue per work class; 0 disables a rate limit
+ADMISSION_OCR_SLOTS = int(os.getenv('ADMISSION_OCR_SLOTS', 2))
+ADMISSION_OCR_QUEUE = int(os.getenv('ADMISSION_OCR_QUEUE', 8))
+ADMISSION_GEMINI_SLOTS = int(os.getenv('ADMISSION_GEMINI_SLOTS', 16))
+ADMISSION_GEMINI_QUEUE = int(os.getenv('ADMISSION_GEMINI_QUEUE', 64))
+ADMISSION_DRIVE_SLOTS = int(os.getenv('ADMISSION_DRIVE_SLOTS', 4))
+ADMISSION_DRIVE_QUEUE = int(os.getenv('ADMISSION_DRIVE_QUEUE', 32))
+ADMISSION_MAX_WAIT = float(os.getenv('ADMISSION_MAX_WAIT', 10))
+# Slots that bulk grading, prefetch and other work that waits instead of being shed never takes
+ADMISSION_OCR_RESERVED = int(os.getenv('ADMISSION_OCR_RESERVED', 1))
+ADMISSION_GEMINI_RESERVED = int(os.getenv('ADMISSION_GEMINI_RESERVED', 4))
+RATE_LIMIT_PER_MINUTE = int(os.getenv('RATE_LIMIT_PER_MINUTE', 0))  # per session and per client address
+RATE_LIMIT_PER_HOUR = int(os.getenv('RATE_LIMIT_PER_HOUR', 0))
+
+# Circuit breakers: open when the failure or slow rate over the last BREAKER_WINDOW calls reaches its threshold
+BREAKER_WINDOW = int(os.getenv('BREAKER_WINDOW', 20))
+BREAKER_MIN_CALLS = int(os.getenv('BREAKER_MIN_CALLS', 10))
+BREAKER_FAILURE_RATE = float(os.getenv('BREAKER_FAILURE_RATE', 0.5))
+BREAKER_SLOW_RATE = float(os.getenv('BREAKER_SLOW_RATE', 0.5))
+BREAKER_OPEN_SECONDS = float(os.getenv('BREAKER_OPEN_SECONDS', 30))
+SNOWFLAKE_SLOW_SECONDS = float(os.getenv('SNOWFLAKE_SLOW_SECONDS', 10))
+DRIVE_SLOW_SECONDS = float(os.getenv('DRIVE_SLOW_SECONDS', 30))
+GEMINI_SLOW_SECONDS = float(os.getenv('GEMINI_SLOW_SECONDS', 20))
+GEMINI_TIMEOUT = float(os.getenv('GEMINI_TIMEOUT', 60))
+
+# Token required by the /admin endpoints (disabled when unset)
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def collect_uploads(field_names):
+    """Read every allowed file in the given form fields into memory, in upload order"""
+    uploads = []
+    for field in field_names:
+        for file in request.files.getlist(field):
+            if file.filename and allowed_file(file.filename):
+                uploads.append((secure_filename(file.filename), file.read()))
+    return uploads
+
+def describe_uploads(uploads):
+    """Display name for one or more uploaded files"""
+    if len(uploads) == 1:
+        return uploads[0][0]
+    return f"{uploads[0][0]} (+{len(uploads) - 1} more)"
+
+def assemble_pdf(uploads):
+    """Combine uploads into one PDF in upload order; images become PDF pages"""
+    if len(uploads) == 1 and uploads[0][0].lower().endswith('.pdf'):
+        return uploads[0][1]
+    
+    writer = PdfWriter()
+    for filename, data in uploads:
+        if not filename.lower().endswith('.pdf'):
+            image_pdf = io.BytesIO()
+            Image.open(io.BytesIO(data)).convert('RGB').save(image_pdf, 'PDF')
+            data = image_pdf.getvalue()
+        for page in PdfReader(io.BytesIO(data)).pages:
+            writer.add_page(page)
+    
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
 # ----------------- Multilingual Support -----------------
 TRANSLATIONS = {
     'en': {
@@ -72,6 +221,8 @@ TRANSLATIONS = {
         'choose_course_or_general': "Would you like to:\n1. Learn about a specific course\n2. Ask a general question\n3. Score an assignment\n4. Generate practice questions\n\nPlease let me know what you'd prefer!",
         'type_all_chapters': "Please type the chapter name, or type 'all' to search across all chapters.",
         'scoring_complete': "Scoring complete! You can upload new documents or ask me other questions.",
+        'overall_score': "Overall score: {score}/100",
+        'unanswered': "No answer found for this question.",
         'solution_submitted': "Solution submitted successfully! Your assignment has been scored.",
         'no_assignments': "No assignments found.",
         'assignment_score': "Your assignment has been scored: {score}/100"
@@ -94,6 +245,8 @@ TRANSLATIONS = {
         'choose_course_or_general': "क्या आप चाहेंगे:\n1. किसी विशिष्ट कोर्स के बारे में जानना\n2. सामान्य प्रश्न पूछना\n3. असाइनमेंट स्कोर करना\n4. अभ्यास प्रश्न बनाना\n\nकृपया बताएं कि आप क्या पसंद करेंगे!",
         'type_all_chapters': "कृपया अध्याय का नाम टाइप करें, या सभी अध्यायों में खोजने के लिए 'सभी' टाइप करें।",
         'scoring_complete': "स्कोरिंग पूर्ण! आप नए दस्तावेज़ अपलोड कर सकते हैं या मुझसे अन्य प्रश्न पूछ सकते हैं।",
+        'overall_score': "कुल स्कोर: {score}/100",
+        'unanswered': "इस प्रश्न का कोई उत्तर नहीं मिला।",
         'solution_submitted': "समाधान सफलतापूर्वक जमा हो गया! आपके असाइनमेंट को स्कोर किया गया है।",
         'no_assignments': "कोई असाइनमेंट नहीं मिला।",
         'assignment_score': "आपके असाइनमेंट को स्कोर किया गया: {score}/100"
@@ -116,6 +269,8 @@ TRANSLATIONS = {
         'choose_course_or_general': "¿Te gustaría:\n1. Aprender sobre un curso específico\n2. Hacer una pregunta general\n3. Calificar una tarea\n4. Generar preguntas de práctica\n\n¡Por favor dime qué prefieres!",
         'type_all_chapters': "Por favor escribe el nombre del capítulo, o escribe 'todo' para buscar en todos los capítulos.",
         'scoring_complete': "¡Calificación completa! Puedes subir nuevos documentos o hacerme otras preguntas.",
+        'overall_score': "Puntuación global: {score}/100",
+        'unanswered': "No se encontró respuesta para esta pregunta.",
         'solution_submitted': "¡Solución enviada exitosamente! Tu tarea ha sido calificada.",
         'no_assignments': "No se encontraron tareas.",
         'assignment_score': "Tu tarea ha sido calificada: {score}/100"
@@ -138,6 +293,8 @@ TRANSLATIONS = {
         'choose_course_or_general': "Souhaitez-vous:\n1. Apprendre sur un cours spécifique\n2. Poser une question générale\n3. Noter un devoir\n4. Générer des questions de pratique\n\nVeuillez me dire ce que vous préférez!",
         'type_all_chapters': "Veuillez taper le nom du chapitre, ou tapez 'tous' pour rechercher dans tous les chapitres.",
         'scoring_complete': "Notation terminée! Vous pouvez télécharger de nouveaux documents ou me poser d'autres questions.",
+        'overall_score': "Score global : {score}/100",
+        'unanswered': "Aucune réponse trouvée pour cette question.",
         'solution_submitted': "Solution soumise avec succès! Votre devoir a été noté.",
         'no_assignments': "Aucun devoir trouvé.",
         'assignment_score': "Votre devoir a été noté: {score}/100"
@@ -157,6 +314,66 @@ def get_text(key, lang='en', **kwargs):
             return text
     return text
 
+# ----------------- Circuit Breakers -----------------
+def make_breaker(name, slow_seconds):
+    return breaker.CircuitBreaker(
+        name, failure_rate=BREAKER_FAILURE_RATE, slow_seconds=slow_seconds, slow_rate=BREAKER_SLOW_RATE,
+        window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS, open_seconds=BREAKER_OPEN_SECONDS
+    )
+
+breakers = {
+    'snowflake': make_breaker('snowflake', SNOWFLAKE_SLOW_SECONDS),
+    'drive': make_breaker('drive', DRIVE_SLOW_SECONDS),
+    'gemini': make_breaker('gemini', GEMINI_SLOW_SECONDS),
+}
+
+class BreakerCursor:
+    """
+    Cursor whose statements go through a circuit breaker; everything else is passed through.
+
+    Request threads, prefetchers, write buffers and refill threads all use it, and a
+    cursor's execute and fetch are not atomic together, so each thread gets its own
+    cursor on the shared connection and never reads another query's rows.
+    """
+    def __init__(self, connection, circuit):
+        self._connection = connection
+        self._circuit = circuit
+        self._local = threading.local()
+
+    @property
+    def _cursor(self):
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = self._local.cursor = self._connection.cursor()
+        return cursor
+
+    def execute(self, *args, **kwargs):
+        cursor = self._cursor
+        return self._circuit.call(lambda: cursor.execute(*args, **kwargs))
+
+    def executemany(self, *args, **kwargs):
+        cursor = self._cursor
+        return self._circuit.call(lambda: cursor.executemany(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+def rows_rejected(error):
+    """Whether Snowflake refused a statement because of its data (SQLSTATE class 22 or 23) rather than being unavailable"""
+    return str(getattr(error, 'sqlstate', None) or '').startswith(('22', '23'))
+
+# ----------------- Admission Pools -----------------
+# Defined early: OCR runs, Gemini calls and Drive transfers take their slots wherever they happen
+admission_pools = {
+    'ocr': admission.SlotPool('ocr', ADMISSION_OCR_SLOTS, ADMISSION_OCR_QUEUE, ADMISSION_MAX_WAIT,
+                              reserved=ADMISSION_OCR_RESERVED),
+    'gemini': admission.SlotPool('gemini', ADMISSION_GEMINI_SLOTS, ADMISSION_GEMINI_QUEUE, ADMISSION_MAX_WAIT,
+                                 reserved=ADMISSION_GEMINI_RESERVED),
+    'drive': admission.SlotPool('drive', ADMISSION_DRIVE_SLOTS, ADMISSION_DRIVE_QUEUE, ADMISSION_MAX_WAIT),
+}
+session_limiter = admission.RateLimiter('session', RATE_LIMIT_PER_MINUTE, RATE_LIMIT_PER_HOUR)
+user_limiter = admission.RateLimiter('user', RATE_LIMIT_PER_MINUTE, RATE_LIMIT_PER_HOUR)
+
 # ----------------- Snowflake Configuration -----------------
 def get_snowflake_connection():
     """Create Snowflake connection using environment variables"""
@@ -177,7 +394,7 @@ def get_snowflake_connection():
 
 # Initialize Snowflake connection
 conn = get_snowflake_connection()
-cur = conn.cursor() if conn else None
+cur = BreakerCursor(conn, breakers['snowflake']) if conn else None
 
 # ----------------- Gemini API Configuration -----------------
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
@@ -185,8 +402,19 @@ GEMINI_API_URL = os.getenv('GEMINI_API_URL')
 GEMINI_MAX_TOKENS = int(os.getenv('GEMINI_MAX_TOKENS', 1500))
 GEMINI_TEMPERATURE = float(os.getenv('GEMINI_TEMPERATURE', 0.7))
 
-def call_gemini(prompt, max_tokens=None, language='en'):
-    """Call Gemini API with environment configuration and language support"""
+single_flight = SingleFlight(SINGLE_FLIGHT_DIR or None, lock_timeout=SINGLE_FLIGHT_LOCK_TIMEOUT)
+
+@tracing.traced()
+def call_gemini(prompt, max_tokens=None, language='en', purpose='general'):
+    """Call Gemini API with environment configuration and language support; identical concurrent prompts share one request"""
+    key = hashlib.sha256(f"{language}\0{max_tokens}\0{prompt}".encode('utf-8')).hexdigest()
+    error = get_text('error_occurred', language)
+    return single_flight.do(
+        'gemini', key, lambda: request_gemini(prompt, max_tokens, language, purpose),
+        share=lambda text: text != error
+    )
+
+def request_gemini(prompt, max_tokens=None, language='en', purpose='general'):
     if not GEMINI_API_KEY:
         logger.error("Gemini API key not found in environment variables")
         return get_text('error_occurred', language)
@@ -219,10 +447,26 @@ def call_gemini(prompt, max_tokens=None, language='en'):
         }
         
         url_with_key = f"{GEMINI_API_URL}?key={GEMINI_API_KEY}"
-        response = requests.post(url_with_key, headers=headers, json=data)
+        with admission_pools['gemini'].admit(shed=ocr_scheduler.current_class() == 'interactive'):
+            start = time.perf_counter()
+            response = breakers['gemini'].call(
+                lambda: requests.post(url_with_key, headers=headers, json=data, timeout=GEMINI_TIMEOUT),
+                failed=lambda r: r.status_code == 429 or r.status_code >= 500
+            )
+        metrics.GEMINI_SECONDS.observe(time.perf_counter() - start, status=response.status_code)
+        metrics.GEMINI_REQUESTS.inc(status=response.status_code)
         
         if response.status_code == 200:
             result = response.json()
+            usage = result.get("usageMetadata", {})
+            input_tokens = usage.get("promptTokenCount", 0)
+            output_tokens = usage.get("candidatesTokenCount", 0)
+            metrics.GEMINI_TOKENS.inc(input_tokens, kind='input', purpose=purpose)
+            metrics.GEMINI_TOKENS.inc(output_tokens, kind='output', purpose=purpose)
+            prompt_budget.record_usage(language, enhanced_prompt, input_tokens)
+            current = tracing.current_span()
+            if current is not None:
+                current.set(purpose=purpose, input_tokens=input_tokens, output_tokens=output_tokens)
             candidates = result.get("candidates", [])
             if candidates and "content" in candidates[0]:
                 content = candidates[0]["content"]
@@ -233,7 +477,17 @@ def call_gemini(prompt, max_tokens=None, language='en'):
             logger.error(f"Gemini API error: {response.status_code} - {response.text}")
             return get_text('error_occurred', language)
             
+    except breaker.CircuitOpen as e:
+        # Answer "try again" right away instead of waiting on a failing upstream
+        metrics.GEMINI_REQUESTS.inc(status='circuit_open')
+        logger.warning(f"Skipping Gemini call: {e}")
+        return get_text('error_occurred', language)
+    except admission.Overloaded as e:
+        metrics.GEMINI_REQUESTS.inc(status='shed')
+        logger.warning(f"Skipping Gemini call: {e}")
+        return get_text('error_occurred', language)
     except Exception as e:
+        metrics.GEMINI_REQUESTS.inc(status='exception')
         logger.error(f"Error calling Gemini API: {e}")
         return get_text('error_occurred', language)
 
@@ -279,8 +533,35 @@ def initialize_ocr():
 # Initialize OCR
 ocr_model = initialize_ocr()
 
+# Page-parallel OCR for large documents (disabled when OCR_WORKERS < 2)
+OCR_WORKERS = int(os.getenv('OCR_WORKERS', 0))
+OCR_PARALLEL_MIN_PAGES = int(os.getenv('OCR_PARALLEL_MIN_PAGES', 8))
+OCR_SHARD_PAGES = int(os.getenv('OCR_SHARD_PAGES', 4))
+ocr_pool = OCRPool(
+    OCR_WORKERS,
+    shard_pages=OCR_SHARD_PAGES,
+    pretrained=os.getenv('OCR_PRETRAINED', 'True').lower() == 'true'
+) if OCR_WORKERS > 1 else None
+
+# OCR runs in slices of up to OCR_SLICE_PAGES pages, scheduled by priority class on OCR_SCHEDULER_SLOTS engine slots
+OCR_SLICE_PAGES = int(os.getenv('OCR_SLICE_PAGES', max(OCR_PARALLEL_MIN_PAGES, OCR_WORKERS * OCR_SHARD_PAGES)))
+OCR_SCHEDULER_SLOTS = int(os.getenv('OCR_SCHEDULER_SLOTS', 1))
+OCR_STARVATION_SECONDS = float(os.getenv('OCR_STARVATION_SECONDS', 60))  # a slice waiting this long runs next
+ocr_slices = ocr_scheduler.Scheduler(OCR_SCHEDULER_SLOTS, max_wait=OCR_STARVATION_SECONDS)
+
+# Strip repeated headers/footers and duplicate pages from course PDFs (assignment question papers are left as OCR'd)
+OCR_COMPACTION = os.getenv('OCR_COMPACTION', 'True').lower() == 'true'
+
+# Per-page OCR cache keyed by page image hash; new pages are checkpointed every OCR_CHECKPOINT_PAGES
+OCR_PAGE_CACHE_DB = os.getenv('OCR_PAGE_CACHE_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spool', 'ocr_pages.sqlite3'))
+OCR_PAGE_CACHE_DAYS = float(os.getenv('OCR_PAGE_CACHE_DAYS', 90))
+OCR_CHECKPOINT_PAGES = int(os.getenv('OCR_CHECKPOINT_PAGES', 16))
+OCR_MODEL_TAG = os.getenv('OCR_MODEL_TAG', 'doctr-' + os.getenv('OCR_PRETRAINED', 'True').lower())  # change to invalidate cached pages
+page_cache = PageCache(OCR_PAGE_CACHE_DB, max_age_days=OCR_PAGE_CACHE_DAYS) if OCR_PAGE_CACHE_DB else None
+
 # ----------------- Session Management -----------------
 user_sessions = {}
+metrics.ACTIVE_SESSIONS.set_function(lambda: len(user_sessions))
 
 class ChatSession:
     def __init__(self):
@@ -291,6 +572,8 @@ class ChatSession:
         self.assignment_pdf = None
         self.answer_pdf = None
         self.language = 'en'
+        # Practice question ids already shown, so the bank never repeats within a session
+        self.served_practice = set()
         
     def reset(self):
         self.state = "general"
@@ -301,6 +584,7 @@ class ChatSession:
         self.answer_pdf = None
 
 # ----------------- Assignment Helper Functions -----------------
+@metrics.SNOWFLAKE_QUERY_SECONDS.time(helper='get_all_assignments')
 def get_all_assignments():
     """Get all assignments from database"""
     if not cur:
@@ -309,9 +593,12 @@ def get_all_assignments():
         cur.execute("SELECT id, course_name, assignment_name, assignment_pdf, solution_pdf, score FROM assignments ORDER BY course_name, assignment_name")
         return cur.fetchall()
     except Exception as e:
+        metrics.SNOWFLAKE_ERRORS.inc(helper='get_all_assignments')
         logger.error(f"Error fetching assignments: {e}")
         return []
 
+@tracing.traced()
+@metrics.SNOWFLAKE_QUERY_SECONDS.time(helper='get_assignment_by_id')
 def get_assignment_by_id(assignment_id):
     """Get specific assignment by ID"""
     if not cur:
@@ -320,74 +607,290 @@ def get_assignment_by_id(assignment_id):
         cur.execute("SELECT id, course_name, assignment_name, assignment_pdf, solution_pdf, score FROM assignments WHERE id = %s", (assignment_id,))
         return cur.fetchone()
     except Exception as e:
+        metrics.SNOWFLAKE_ERRORS.inc(helper='get_assignment_by_id')
         logger.error(f"Error fetching assignment: {e}")
         return None
 
 def update_assignment_solution(assignment_id, solution_pdf_link, score):
-    """Update assignment with solution PDF link and score"""
+    """Write the assignment's solution PDF link and score; returns False if Snowflake did not take it"""
+    # Written directly, not buffered: the write-behind job that calls this is only marked done once it returns True
+    return write_assignment_solutions([(assignment_id, solution_pdf_link, score)])
+
+@tracing.traced()
+@metrics.SNOWFLAKE_QUERY_SECONDS.time(helper='write_assignment_solutions')
+def write_assignment_solutions(rows):
+    """Apply [(assignment_id, solution_pdf, score)] in one statement"""
     if not cur:
         return False
     try:
-        cur.execute(
-            "UPDATE assignments SET solution_pdf = %s, score = %s WHERE id = %s",
-            (solution_pdf_link, score, assignment_id)
-        )
+        values = ", ".join(["(%s, %s, %s)"] * len(rows))
+        query = f"""
+        MERGE INTO assignments AS target
+        USING (SELECT column1 AS id, column2 AS solution_pdf, column3 AS score FROM VALUES {values}) AS source
+        ON target.id = source.id
+        WHEN MATCHED THEN UPDATE SET solution_pdf = source.solution_pdf, score = source.score
+        """
+        cur.execute(query, tuple(value for row in rows for value in row))
         conn.commit()
         return True
     except Exception as e:
-        logger.error(f"Error updating assignment solution: {e}")
+        metrics.SNOWFLAKE_ERRORS.inc(helper='write_assignment_solutions')
+        logger.error(f"Error updating assignment solutions: {e}")
         return False
 
-def upload_solution_to_drive(file_path, assignment_id, assignment_name):
-    """Upload solution PDF to Google Drive assignments folder"""
+@tracing.traced()
+@metrics.SNOWFLAKE_QUERY_SECONDS.time(helper='save_submission_scores')
+def save_submission_scores(rows):
+    """Upsert per-student results [(assignment_id, student_id, solution_pdf, score, feedback)] in one statement"""
+    if not cur or not rows:
+        return False
+    try:
+        values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(rows))
+        query = f"""
+        MERGE INTO assignment_submissions AS target
+        USING (SELECT column1 AS assignment_id, column2 AS student_id, column3 AS solution_pdf,
+                      column4 AS score, column5 AS feedback FROM VALUES {values}) AS source
+        ON target.assignment_id = source.assignment_id AND target.student_id = source.student_id
+        WHEN MATCHED THEN UPDATE SET solution_pdf = source.solution_pdf, score = source.score,
+            feedback = source.feedback, submitted_at = CURRENT_TIMESTAMP()
+        WHEN NOT MATCHED THEN INSERT (assignment_id, student_id, solution_pdf, score, feedback)
+        VALUES (source.assignment_id, source.student_id, source.solution_pdf, source.score, source.feedback)
+        """
+        cur.execute(query, tuple(value for row in rows for value in row))
+        conn.commit()
+        return True
+    except Exception as e:
+        metrics.SNOWFLAKE_ERRORS.inc(helper='save_submission_scores')
+        logger.error(f"Error saving submission scores: {e}")
+        return False
+
+@tracing.traced()
+def fetch_assignment_text(assignment):
+    """Download an assignment's question paper and OCR it"""
+    # Unique path: concurrent submissions for the same assignment must not share a file
+    def ocr_assignment():
+        assignment_pdf_path = f"/tmp/assignment_{assignment[0]}_{uuid.uuid4().hex}.pdf"
+        try:
+            download_pdf(assignment[3], assignment_pdf_path)  # assignment[3] is assignment_pdf URL
+            # Not compacted: repeated "Q2" or "(10 marks)" lines are the questions, not boilerplate
+            return extract_text_from_file(assignment_pdf_path, compact=False)
+        finally:
+            try:
+                os.remove(assignment_pdf_path)
+            except:
+                pass
+    
+    # Submissions arriving together for one assignment download and OCR its paper once
+    return single_flight.do('assignment_ocr', drive_file_id(assignment[3]), ocr_assignment)
+
+# Bump whenever build_solution_prompt, parse_score or score_solution changes, so cached scores are not reused
+SCORING_PROMPT_VERSION = '3'
+
+_scoring_in_flight = {}
+_scoring_lock = threading.Lock()
+
+def solution_fingerprint(uploads):
+    """Content hash of the uploaded solution pages (file names are ignored)"""
+    digest = hashlib.sha256()
+    for _, data in uploads:
+        digest.update(len(data).to_bytes(8, 'big'))
+        digest.update(data)
+    return digest.hexdigest()
+
+def run_once_per_key(key, compute):
+    """Run compute() for key; concurrent callers with the same key wait for and share its result"""
+    with _scoring_lock:
+        future = _scoring_in_flight.get(key)
+        leader = future is None
+        if leader:
+            future = _scoring_in_flight[key] = Future()
+    if not leader:
+        metrics.CACHE_REQUESTS.inc(cache='scoring', result='in_flight')
+        return future.result()
+    try:
+        result = compute()
+        future.set_result(result)
+        return result
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _scoring_lock:
+            _scoring_in_flight.pop(key, None)
+
+SOLUTION_PROMPT = "You are an experienced teacher evaluating a student's answer to one question. Please provide a numerical score out of 100 and brief feedback on what was done well and what to improve.\n\nQUESTION:\n{question}\n\nSTUDENT'S ANSWER:\n{answer}\n\nPlease respond in the format:\nSCORE: [number]/100\nFEEDBACK: [brief feedback]"
+
+def build_solution_prompt(question_text, answer_text, language='en'):
+    return prompt_budget.render(
+        SOLUTION_PROMPT, language, SCORING_PROMPT_TOKENS,
+        sections=[('question', question_text, 0.4), ('answer', answer_text, None)],
+        purpose='scoring'
+    )
+
+def parse_score(gemini_response):
+    """Extract the numeric score from a 'SCORE: n/100' response"""
+    score = 0
+    try:
+        if "SCORE:" in gemini_response:
+            score_line = gemini_response.split("SCORE:")[1].split("FEEDBACK:")[0].strip()
+            score = int(score_line.split("/")[0].strip())
+    except:
+        score = 75  # Default score if parsing fails
+    return score
+
+def score_question(pair, language='en'):
+    """Score one question/answer pair; unanswered questions skip Gemini"""
+    if not pair['answer'].strip():
+        return {**pair, 'score': 0, 'feedback': get_text('unanswered', language), 'ok': True}
+    response = call_gemini(build_solution_prompt(pair['question'], pair['answer'], language),
+                           max_tokens=500, language=language, purpose='scoring')
+    feedback = response.split("FEEDBACK:", 1)[1].strip() if "FEEDBACK:" in response else response
+    return {**pair, 'score': max(0, min(100, parse_score(response))), 'feedback': feedback, 'ok': "SCORE:" in response}
+
+@tracing.traced()
+def score_solution(assignment_text, solution_text, language='en'):
+    """
+    Split into question/answer pairs, score each in a parallel Gemini call and aggregate.
+    Returns (total out of 100, per-question results, True if every question was scored).
+    """
+    pairs = segmentation.pair_questions(assignment_text, solution_text, max_chars=None)
+    with tracing.span('score_questions', questions=len(pairs)):
+        with ThreadPoolExecutor(max_workers=min(SCORING_CONCURRENCY, len(pairs))) as executor:
+            results = list(executor.map(tracing.wrap(lambda pair: score_question(pair, language)), pairs))
+    
+    # Weight by printed marks when every question has them, otherwise equally
+    weights = [r['marks'] for r in results]
+    if not all(weights):
+        weights = [1] * len(results)
+    total = round(sum(r['score'] * w for r, w in zip(results, weights)) / sum(weights))
+    return total, results, all(r['ok'] for r in results)
+
+def format_question_feedback(results):
+    lines = []
+    for r in results:
+        if r['marks']:
+            points = f"{round(r['score'] * r['marks'] / 100, 1):g}/{r['marks']}"
+        else:
+            points = f"{r['score']}/100"
+        lines.append(f"{r['label']} ({points}): {r['feedback']}")
+    return "\n\n".join(lines)
+
+@tracing.traced()
+def upload_solution_to_drive(pdf_bytes, assignment_id, assignment_name, progress=None):
+    """
+    Upload solution PDF (in memory) to Google Drive assignments folder and share it.
+    progress (a write-behind payload) keeps the uploaded file's id and link, so a retry after a failed share only shares it.
+    """
     if not drive:
         raise Exception("Google Drive not initialized")
+    progress = {} if progress is None else progress
     
     try:
-        filename = f"solution_{assignment_id}_{assignment_name.replace(' ', '_')}.pdf"
-        
-        file_metadata = {
-            'title': filename,
-            'parents': [{'id': ASSIGNMENTS_FOLDER_ID}]
-        }
-        
-        file_drive = drive.CreateFile(file_metadata)
-        file_drive.SetContentFile(file_path)
-        file_drive.Upload()
+        if progress.get('drive_file_id'):
+            file_drive = drive.CreateFile({'id': progress['drive_file_id']})
+        else:
+            filename = f"solution_{assignment_id}_{assignment_name.replace(' ', '_')}.pdf"
+            
+            file_metadata = {
+                'title': filename,
+                'mimeType': 'application/pdf',
+                'parents': [{'id': ASSIGNMENTS_FOLDER_ID}]
+            }
+            
+            file_drive = drive.CreateFile(file_metadata)
+            file_drive.content = io.BytesIO(pdf_bytes)
+            with admission_pools['drive'].admit(shed=False), metrics.DRIVE_SECONDS.time(operation='upload'):
+                breakers['drive'].call(file_drive.Upload)
+            metrics.DRIVE_BYTES.inc(len(pdf_bytes), operation='upload')
+            progress['drive_file_id'] = file_drive['id']
+            progress['drive_link'] = file_drive['alternateLink']
         
         # Make file shareable
-        file_drive.InsertPermission({
-            'type': 'anyone',
-            'role': 'reader'
-        })
+        with admission_pools['drive'].admit(shed=False), metrics.DRIVE_SECONDS.time(operation='share'):
+            breakers['drive'].call(lambda: file_drive.InsertPermission({
+                'type': 'anyone',
+                'role': 'reader'
+            }))
         
-        return file_drive['alternateLink']
+        return progress['drive_link']
         
     except Exception as e:
         logger.error(f"Error uploading solution to drive: {e}")
         raise
 
+# ----------------- Write-Behind Jobs -----------------
+def persist_solution(payload, pdf_bytes):
+    """Upload a scored solution to Drive and record it; safe to retry"""
+    if not payload.get('solution_pdf'):
+        payload['solution_pdf'] = upload_when_drive_is_up(
+            pdf_bytes, payload['assignment_id'], payload['assignment_name'], payload
+        )
+    if not update_assignment_solution(payload['assignment_id'], payload['solution_pdf'], payload['score']):
+        raise Exception("Assignment update failed")
+
+def persist_submission(payload, pdf_bytes):
+    """Upload a bulk-graded answer sheet whose upload was deferred, then record its link"""
+    if not payload.get('solution_pdf'):
+        payload['solution_pdf'] = upload_when_drive_is_up(
+            pdf_bytes, payload['assignment_id'], payload['upload_name'], payload
+        )
+    if not save_submission_scores([(payload['assignment_id'], payload['student_id'], payload['solution_pdf'],
+                                     payload['score'], payload['feedback'])]):
+        raise Exception("Submission update failed")
+
+def upload_when_drive_is_up(pdf_bytes, assignment_id, name, progress):
+    """Upload, or defer the job without spending an attempt while the Drive circuit is open"""
+    try:
+        return upload_solution_to_drive(pdf_bytes, assignment_id, name, progress)
+    except breaker.CircuitOpen as e:
+        raise RetryLater(e.retry_after, str(e))
+
+write_behind = WriteBehindQueue(WRITE_BEHIND_DB, max_attempts=WRITE_BEHIND_MAX_ATTEMPTS,
+                                lease_seconds=WRITE_BEHIND_LEASE_SECONDS)
+write_behind.register('persist_solution', persist_solution)
+write_behind.register('persist_submission', persist_submission)
+
 # ----------------- Database Helper Functions -----------------
-def get_all_courses():
+# Last course and chapter lists read from Snowflake, served while it is failing
+catalog_snapshots = {}
+
+def catalog_fallback(key, error, strict):
+    """The last good list for key; with strict, re-raise error when there is none instead of returning []"""
+    if key in catalog_snapshots:
+        metrics.CACHE_REQUESTS.inc(cache='catalog', result='stale')
+        return catalog_snapshots[key]
+    if strict:
+        raise error
+    return []
+
+@metrics.SNOWFLAKE_QUERY_SECONDS.time(helper='get_all_courses')
+def get_all_courses(strict=False):
     if not cur:
         return []
     try:
         cur.execute("SELECT DISTINCT course_id FROM course_pdfs ORDER BY course_id")
-        return [row[0] for row in cur.fetchall()]
+        courses = catalog_snapshots[('courses',)] = [row[0] for row in cur.fetchall()]
+        return courses
     except Exception as e:
+        metrics.SNOWFLAKE_ERRORS.inc(helper='get_all_courses')
         logger.error(f"Error fetching courses: {e}")
-        return []
+        return catalog_fallback(('courses',), e, strict)
 
-def get_chapters_for_course(course_id):
+@metrics.SNOWFLAKE_QUERY_SECONDS.time(helper='get_chapters_for_course')
+def get_chapters_for_course(course_id, strict=False):
     if not cur:
         return []
     try:
         cur.execute("SELECT DISTINCT chapter_name FROM course_pdfs WHERE course_id = %s ORDER BY chapter_name", (course_id,))
-        return [row[0] for row in cur.fetchall()]
+        chapters = catalog_snapshots[('chapters', course_id)] = [row[0] for row in cur.fetchall()]
+        return chapters
     except Exception as e:
+        metrics.SNOWFLAKE_ERRORS.inc(helper='get_chapters_for_course')
         logger.error(f"Error fetching chapters: {e}")
-        return []
+        return catalog_fallback(('chapters', course_id), e, strict)
 
+@tracing.traced()
+@metrics.SNOWFLAKE_QUERY_SECONDS.time(helper='get_pdf_links')
 def get_pdf_links(course, chapter=None):
     if not cur:
         return []
@@ -400,107 +903,755 @@ def get_pdf_links(course, chapter=None):
             cur.execute(query, (course,))
         return cur.fetchall()
     except Exception as e:
+        metrics.SNOWFLAKE_ERRORS.inc(helper='get_pdf_links')
         logger.error(f"Error fetching PDF links: {e}")
         return []
 
+@tracing.traced()
+@metrics.SNOWFLAKE_QUERY_SECONDS.time(helper='get_cached_ocr')
 def get_cached_ocr(course, chapter, pdf_uri):
     if not cur:
         return None
+    pending = ocr_cache_writes.get((course, chapter, pdf_uri))
+    if pending is not None:
+        return ocr_storage.cached_text(pending[3])
     try:
-        query = "SELECT ocr_text FROM pdf_ocr_cache WHERE course_id = %s AND chapter_name = %s AND pdf_uri = %s"
+        query = "SELECT ocr_data, ocr_text FROM pdf_ocr_cache WHERE course_id = %s AND chapter_name = %s AND pdf_uri = %s"
         cur.execute(query, (course, chapter, pdf_uri))
         row = cur.fetchone()
-        return row[0] if row else None
+        if not row:
+            return None
+        if row[0]:
+            metrics.OCR_CACHE_BYTES.inc(len(row[0]), operation='read')
+        return ocr_storage.cached_text(row[0], row[1])
     except Exception as e:
+        metrics.SNOWFLAKE_ERRORS.inc(helper='get_cached_ocr')
         logger.error(f"Error getting cached OCR: {e}")
         return None
 
-def cache_ocr(course, chapter, pdf_uri, ocr_text):
+def cache_ocr(course, chapter, pdf_uri, pages, separator="\n"):
+    """Queue a PDF's page texts (separator.join(pages) is its text) for the next batched write to PDF_OCR_CACHE"""
     if not cur:
         return
+    blob = ocr_storage.encode(pages, separator)
+    metrics.OCR_CACHE_BYTES.inc(sum(len(page.encode('utf-8')) for page in pages), operation='raw')
+    metrics.OCR_CACHE_BYTES.inc(len(blob), operation='write')
+    ocr_cache_writes.add((course, chapter, pdf_uri), (course, chapter, pdf_uri, blob, ocr_storage.format_tag()))
+
+@tracing.traced()
+@metrics.SNOWFLAKE_QUERY_SECONDS.time(helper='write_ocr_cache')
+def write_ocr_cache(rows):
+    """Upsert [(course, chapter, pdf_uri, ocr_data, ocr_format)] in one statement"""
+    if not cur:
+        return False
     try:
-        escaped_text = ocr_text.replace("'", "''")
-        query = """
+        values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(rows))
+        query = f"""
         MERGE INTO pdf_ocr_cache AS target
-        USING (SELECT %s AS course_id, %s AS chapter_name, %s AS pdf_uri) AS source
+        USING (SELECT column1 AS course_id, column2 AS chapter_name, column3 AS pdf_uri,
+                      column4 AS ocr_data, column5 AS ocr_format FROM VALUES {values}) AS source
         ON target.course_id = source.course_id AND target.chapter_name = source.chapter_name AND target.pdf_uri = source.pdf_uri
-        WHEN MATCHED THEN UPDATE SET ocr_text = %s, last_updated = CURRENT_TIMESTAMP()
-        WHEN NOT MATCHED THEN INSERT (course_id, chapter_name, pdf_uri, ocr_text)
-        VALUES (%s, %s, %s, %s)
+        WHEN MATCHED THEN UPDATE SET ocr_data = source.ocr_data, ocr_format = source.ocr_format,
+            ocr_text = NULL, last_updated = CURRENT_TIMESTAMP()
+        WHEN NOT MATCHED THEN INSERT (course_id, chapter_name, pdf_uri, ocr_data, ocr_format)
+        VALUES (source.course_id, source.chapter_name, source.pdf_uri, source.ocr_data, source.ocr_format)
         """
-        cur.execute(query, (course, chapter, pdf_uri, escaped_text, course, chapter, pdf_uri, escaped_text))
+        cur.execute(query, tuple(value for row in rows for value in row))
         conn.commit()
+        return True
     except Exception as e:
+        metrics.SNOWFLAKE_ERRORS.inc(helper='write_ocr_cache')
         logger.error(f"Error caching OCR: {e}")
+        if rows_rejected(e):
+            raise RowsRejected(str(e)) from e
+        return False
+
+@tracing.traced()
+@metrics.SNOWFLAKE_QUERY_SECONDS.time(helper='get_cached_score')
+def get_cached_score(assignment_id, solution_hash, prompt_version):
+    """Stored (score, feedback) for an identical earlier submission, or None"""
+    if not cur:
+        return None
+    pending = scoring_cache_writes.get((assignment_id, solution_hash, prompt_version))
+    if pending is not None:
+        return (pending[3], pending[4])
+    try:
+        query = "SELECT score, feedback FROM scoring_cache WHERE assignment_id = %s AND solution_hash = %s AND prompt_version = %s"
+        cur.execute(query, (assignment_id, solution_hash, prompt_version))
+        row = cur.fetchone()
+        return (row[0], row[1]) if row else None
+    except Exception as e:
+        metrics.SNOWFLAKE_ERRORS.inc(helper='get_cached_score')
+        logger.error(f"Error getting cached score: {e}")
+        return None
+
+def cache_score(assignment_id, solution_hash, prompt_version, score, feedback):
+    """Queue a score for the next batched write to SCORING_CACHE"""
+    if not cur:
+        return
+    key = (assignment_id, solution_hash, prompt_version)
+    scoring_cache_writes.add(key, key + (score, feedback))
+
+@tracing.traced()
+@metrics.SNOWFLAKE_QUERY_SECONDS.time(helper='write_scoring_cache')
+def write_scoring_cache(rows):
+    """Insert [(assignment_id, solution_hash, prompt_version, score, feedback)] not stored yet, in one statement"""
+    if not cur:
+        return False
+    try:
+        values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(rows))
+        query = f"""
+        MERGE INTO scoring_cache AS target
+        USING (SELECT column1 AS assignment_id, column2 AS solution_hash, column3 AS prompt_version,
+                      column4 AS score, column5 AS feedback FROM VALUES {values}) AS source
+        ON target.assignment_id = source.assignment_id AND target.solution_hash = source.solution_hash AND target.prompt_version = source.prompt_version
+        WHEN NOT MATCHED THEN INSERT (assignment_id, solution_hash, prompt_version, score, feedback)
+        VALUES (source.assignment_id, source.solution_hash, source.prompt_version, source.score, source.feedback)
+        """
+        cur.execute(query, tuple(value for row in rows for value in row))
+        conn.commit()
+        return True
+    except Exception as e:
+        metrics.SNOWFLAKE_ERRORS.inc(helper='write_scoring_cache')
+        logger.error(f"Error caching scores: {e}")
+        if rows_rejected(e):
+            raise RowsRejected(str(e)) from e
+        return False
+
+@tracing.traced()
+@metrics.SNOWFLAKE_QUERY_SECONDS.time(helper='get_course_summaries')
+def get_course_summaries(course):
+    """Current-version summaries: {'course': (summary, source_hash) or None, 'chapters': {name: (summary, source_hash)}}"""
+    summaries = {'course': None, 'chapters': {}}
+    if not cur:
+        return summaries
+    try:
+        cur.execute(
+            "SELECT level, chapter_name, summary, source_hash FROM course_summaries "
+            "WHERE course_id = %s AND level IN ('chapter', 'course') AND summary_version = %s ORDER BY chapter_name",
+            (course, summary_tree.SUMMARY_VERSION)
+        )
+        for level, chapter, summary, digest in cur.fetchall():
+            if level == 'course':
+                summaries['course'] = (summary, digest)
+            else:
+                summaries['chapters'][chapter] = (summary, digest)
+        return summaries
+    except Exception as e:
+        metrics.SNOWFLAKE_ERRORS.inc(helper='get_course_summaries')
+        logger.error(f"Error getting course summaries: {e}")
+        return summaries
+
+@tracing.traced()
+@metrics.SNOWFLAKE_QUERY_SECONDS.time(helper='save_summary_nodes')
+def save_summary_nodes(course, chapter, nodes):
+    """Replace the stored summary nodes of one chapter ('' for the course level); nodes [(level, chunk_index, summary, source_hash)]"""
+    if not cur:
+        return False
+    try:
+        cur.execute("DELETE FROM course_summaries WHERE course_id = %s AND chapter_name = %s", (course, chapter))
+        cur.executemany(
+            "INSERT INTO course_summaries (course_id, chapter_name, level, chunk_index, summary, source_hash, summary_version) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            [(course, chapter, level, index, summary, digest, summary_tree.SUMMARY_VERSION)
+             for level, index, summary, digest in nodes]
+        )
+        conn.commit()
+        return True
+    except Exception as e:
+        metrics.SNOWFLAKE_ERRORS.inc(helper='save_summary_nodes')
+        logger.error(f"Error saving course summaries: {e}")
+        return False
+
+@tracing.traced()
+@metrics.SNOWFLAKE_QUERY_SECONDS.time(helper='get_practice_questions')
+def get_practice_questions(course, chapter, language):
+    """Banked practice questions for one chapter, or every chapter of the course when chapter is None"""
+    if not cur:
+        return []
+    try:
+        query = "SELECT chapter_name, question_id, question, answer, source_hash FROM practice_questions WHERE course_id = %s AND language = %s"
+        params = (course, language)
+        if chapter:
+            query += " AND chapter_name = %s"
+            params += (chapter,)
+        cur.execute(query, params)
+        return [
+            {'chapter': row[0], 'question_id': row[1], 'question': row[2], 'answer': row[3], 'source_hash': row[4]}
+            for row in cur.fetchall()
+        ]
+    except Exception as e:
+        metrics.SNOWFLAKE_ERRORS.inc(helper='get_practice_questions')
+        logger.error(f"Error getting practice questions: {e}")
+        return []
+
+@metrics.SNOWFLAKE_QUERY_SECONDS.time(helper='get_practice_languages')
+def get_practice_languages(course, chapter):
+    if not cur:
+        return []
+    try:
+        cur.execute("SELECT DISTINCT language FROM practice_questions WHERE course_id = %s AND chapter_name = %s", (course, chapter))
+        return [row[0] for row in cur.fetchall()]
+    except Exception as e:
+        metrics.SNOWFLAKE_ERRORS.inc(helper='get_practice_languages')
+        logger.error(f"Error getting practice languages: {e}")
+        return []
+
+@tracing.traced()
+@metrics.SNOWFLAKE_QUERY_SECONDS.time(helper='save_practice_questions')
+def save_practice_questions(course, chapter, language, source_hash, items, replace=False):
+    """Add [(question_id, question, answer)] to a bank; replace drops questions built from older material"""
+    if not cur:
+        return False
+    try:
+        if replace:
+            cur.execute(
+                "DELETE FROM practice_questions WHERE course_id = %s AND chapter_name = %s AND language = %s",
+                (course, chapter, language)
+            )
+        if items:
+            cur.executemany(
+                "INSERT INTO practice_questions (course_id, chapter_name, language, question_id, question, answer, source_hash) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                [(course, chapter, language, qid, question, answer, source_hash) for qid, question, answer in items]
+            )
+        conn.commit()
+        return True
+    except Exception as e:
+        metrics.SNOWFLAKE_ERRORS.inc(helper='save_practice_questions')
+        logger.error(f"Error saving practice questions: {e}")
+        return False
+
+# Cache and score writes leave the request path and reach Snowflake in batches
+ocr_cache_writes = WriteBuffer('pdf_ocr_cache', write_ocr_cache, WRITE_BUFFER_MAX_ROWS, WRITE_BUFFER_MAX_DELAY,
+                               max_pending=WRITE_BUFFER_MAX_PENDING)
+scoring_cache_writes = WriteBuffer('scoring_cache', write_scoring_cache, WRITE_BUFFER_MAX_ROWS, WRITE_BUFFER_MAX_DELAY,
+                                   max_pending=WRITE_BUFFER_MAX_PENDING)
 
 # ----------------- File Processing Functions -----------------
+def drive_file_id(drive_link):
+    return drive_link.split("/d/")[1].split("/")[0]
+
+@tracing.traced()
 def download_pdf(drive_link, local_path):
     if not drive:
         raise Exception("Google Drive not initialized")
     try:
-        file_id = drive_link.split("/d/")[1].split("/")[0]
-        file = drive.CreateFile({'id': file_id})
-        file.GetContentFile(local_path)
+        file = drive.CreateFile({'id': drive_file_id(drive_link)})
+        with admission_pools['drive'].admit(shed=False), metrics.DRIVE_SECONDS.time(operation='download'):
+            breakers['drive'].call(lambda: file.GetContentFile(local_path))
+        metrics.DRIVE_BYTES.inc(os.path.getsize(local_path), operation='download')
         return local_path
     except Exception as e:
         logger.error(f"Error downloading PDF: {e}")
         raise
 
-def extract_text_from_file(file_path):
+def document_source(filenames):
+    kinds = {'pdf' if name.lower().endswith('.pdf') else 'image' for name in filenames}
+    return kinds.pop() if len(kinds) == 1 else 'mixed'
+
+def load_document_pages(sources):
+    """Load (filename, path or bytes) sources into one ordered list of page images"""
+    pages = []
+    for filename, data in sources:
+        if filename.lower().endswith('.pdf'):
+            pages.extend(DocumentFile.from_pdf(data))
+        else:
+            pages.extend(DocumentFile.from_images([data]))
+    return pages
+
+@tracing.traced()
+def extract_pages_from_file(file_path, compact=None):
+    """OCR a file; returns (page texts, separator that joins them into the document text). compact defaults to OCR_COMPACTION."""
     if not ocr_model:
         raise Exception("OCR model not loaded")
     
     try:
-        if file_path.lower().endswith('.pdf'):
-            doc = DocumentFile.from_pdf(file_path)
-        else:
-            doc = DocumentFile.from_images(file_path)
-        
-        result = ocr_model(doc)
-        text_per_page = []
-        
-        for page in result.pages:
-            page_text = ""
-            for block in page.blocks:
-                for line in block.lines:
-                    for word in line.words:
-                        page_text += word.value + " "
-                    page_text += "\n"
-                page_text += "\n"
-            text_per_page.append(page_text)
-        
-        return "\n".join(text_per_page)
+        return ocr_document_pages([(file_path, file_path)], compact=OCR_COMPACTION if compact is None else compact)
     except Exception as e:
         logger.error(f"Error extracting text: {e}")
         raise
 
-def process_course_materials(course, chapter=None):
-    pdf_rows = get_pdf_links(course, chapter)
-    combined_text = ""
+def extract_text_from_file(file_path, compact=None):
+    pages, separator = extract_pages_from_file(file_path, compact)
+    return separator.join(pages)
+
+@tracing.traced()
+def extract_text_from_uploads(uploads):
+    """OCR in-memory uploads [(filename, bytes)] as one ordered multi-page document"""
+    if not ocr_model:
+        raise Exception("OCR model not loaded")
+    
+    try:
+        # The same pages uploaded in several sessions at once are OCR'd once
+        return single_flight.do('upload_ocr', solution_fingerprint(uploads), lambda: ocr_document(uploads))
+    except Exception as e:
+        logger.error(f"Error extracting text from uploads: {e}")
+        raise
+
+def run_ocr(pages):
+    """OCR page images slice by slice through the priority scheduler; returns (OCRDocument, used the pool)"""
+    documents, parallel = [], False
+    # A student waiting on the response is shed when OCR is saturated; other work waits outside the reserved slots
+    with admission_pools['ocr'].admit(shed=ocr_scheduler.current_class() == 'interactive'):
+        for i in range(0, len(pages), OCR_SLICE_PAGES):
+            # Each slice waits for its turn, so long documents yield to other work at page boundaries
+            chunk = pages[i:i + OCR_SLICE_PAGES]
+            document, used_pool = ocr_slices.run(len(chunk), lambda: ocr_slice(chunk))
+            documents.append(document)
+            parallel = parallel or used_pool
+    if len(documents) == 1:
+        return documents[0], parallel
+    return OCRDocument.concat(documents), parallel
+
+def ocr_slice(pages):
+    """OCR page images (in the process pool for large batches); returns (OCRDocument, used the pool)"""
+    if ocr_pool is not None and len(pages) >= OCR_PARALLEL_MIN_PAGES:
+        try:
+            return ocr_pool.run(pages), True
+        except Exception as e:
+            logger.error(f"Parallel OCR failed, falling back to in-process OCR: {e}")
+    return OCRDocument.from_doctr(ocr_model(pages)), False
+
+def cached_page_results(hashes):
+    """{page_hash: single-page OCRDocument} for cached pages"""
+    try:
+        return {digest: OCRDocument.from_bytes(data) for digest, data in page_cache.get_many(hashes).items()}
+    except Exception as e:
+        logger.error(f"Error reading OCR page cache: {e}")
+        return {}
+
+def checkpoint_pages(results):
+    try:
+        page_cache.put_many({digest: page.to_bytes() for digest, page in results.items()})
+    except Exception as e:
+        logger.error(f"Error writing OCR page cache: {e}")
+
+def ocr_pages(doc, source):
+    """OCR loaded page images, reusing cached pages and checkpointing new ones; returns an OCRDocument"""
+    start = time.perf_counter()
+    if page_cache is None:
+        result, parallel = run_ocr(doc)
+        cached_pages, ocr_page_count = 0, len(doc)
+    else:
+        hashes = [page_hash(page, OCR_MODEL_TAG) for page in doc]
+        results = cached_page_results(hashes)
+        cached_pages = sum(1 for digest in hashes if digest in results)
+        
+        # Pages not cached yet, each distinct image once, in page order
+        todo = {}
+        for index, digest in enumerate(hashes):
+            if digest not in results:
+                todo.setdefault(digest, index)
+        todo = list(todo.items())
+        parallel = False
+        for i in range(0, len(todo), OCR_CHECKPOINT_PAGES):
+            batch = todo[i:i + OCR_CHECKPOINT_PAGES]
+            batch_result, used_pool = run_ocr([doc[index] for _, index in batch])
+            parallel = parallel or used_pool
+            done = {digest: batch_result.page_document(position) for position, (digest, _) in enumerate(batch)}
+            # Checkpoint: a retry after a crash resumes after the last stored batch
+            checkpoint_pages(done)
+            results.update(done)
+        result = OCRDocument.concat([results[digest] for digest in hashes])
+        ocr_page_count = len(todo)
+        metrics.CACHE_REQUESTS.inc(cached_pages, cache='ocr_page', result='hit')
+        metrics.CACHE_REQUESTS.inc(len(doc) - cached_pages, cache='ocr_page', result='miss')
+    
+    metrics.OCR_SECONDS.observe(time.perf_counter() - start, source=source)
+    metrics.OCR_PAGES.inc(ocr_page_count, source=source)
+    current_span = tracing.current_span()
+    if current_span:
+        current_span.set(source=source, pages=len(result), cached_pages=cached_pages, parallel=parallel)
+    return result
+
+def compact_text(text_per_page, source):
+    """Remove boilerplate and duplicate pages, recording how much smaller the text got; returns the kept pages"""
+    pages, stats = text_compaction.compact_page_list(text_per_page)
+    metrics.OCR_COMPACTION_RATIO.observe(stats['ratio'], source=source)
+    current_span = tracing.current_span()
+    if current_span:
+        current_span.set(compaction=stats)
+    logger.info(f"OCR text compacted to {stats['ratio']:.0%} ({stats['chars_in']} -> {stats['chars_out']} chars, "
+                f"{stats['pages_in']} -> {stats['pages_out']} pages)")
+    return pages
+
+def ocr_document_pages(sources, compact=False):
+    """Run OCR over sources assembled into one document; returns (page texts, separator that joins them)"""
+    source = document_source([filename for filename, _ in sources])
+    doc = load_document_pages(sources)
+    text_per_page = ocr_pages(doc, source).pages()
+    if compact:
+        return compact_text(text_per_page, source), text_compaction.PAGE_SEPARATOR
+    return text_per_page, "\n"
+
+def ocr_document(sources, compact=False):
+    """Run OCR over one or more sources assembled into a single document"""
+    pages, separator = ocr_document_pages(sources, compact)
+    return separator.join(pages)
+
+@tracing.traced()
+def ocr_documents_batch(documents):
+    """OCR several documents [[(filename, bytes)], ...] in one batch; returns one text per document"""
+    if not ocr_model:
+        raise Exception("OCR model not loaded")
+    
+    page_lists = [load_document_pages(sources) for sources in documents]
+    all_pages = [page for pages in page_lists for page in pages]
+    text_per_page = ocr_pages(all_pages, 'batch').pages()
     
-    for c_id, chap_name, pdf_uri in pdf_rows:
+    texts = []
+    offset = 0
+    for pages in page_lists:
+        texts.append("\n".join(text_per_page[offset:offset + len(pages)]))
+        offset += len(pages)
+    return texts
+
+@tracing.traced()
+def load_chapter_materials(course, chapter):
+    """OCR text of one chapter's PDFs, read from the OCR cache or produced by running OCR"""
+    combined_text = ""
+    for c_id, chap_name, pdf_uri in get_pdf_links(course, chapter):
         try:
             ocr_text = get_cached_ocr(c_id, chap_name, pdf_uri)
+            metrics.CACHE_REQUESTS.inc(cache='pdf_ocr', result='hit' if ocr_text else 'miss')
             
             if not ocr_text:
-                os.makedirs("/tmp", exist_ok=True)
-                local_path = f"/tmp/{chap_name.replace(' ', '_').replace('/', '_')}.pdf"
-                download_pdf(pdf_uri, local_path)
-                ocr_text = extract_text_from_file(local_path)
-                cache_ocr(c_id, chap_name, pdf_uri, ocr_text)
-                try:
-                    os.remove(local_path)
-                except:
-                    pass
+                # Sessions (and worker processes) missing the same PDF together download and OCR it once
+                ocr_text = single_flight.do(
+                    'pdf_ocr', f"{c_id}/{chap_name}/{drive_file_id(pdf_uri)}",
+                    lambda: ocr_course_pdf(c_id, chap_name, pdf_uri),
+                    recheck=lambda: get_cached_ocr(c_id, chap_name, pdf_uri)
+                )
             
             combined_text += f"\n[{chap_name}] {ocr_text}"
             
         except Exception as e:
             logger.error(f"Error processing PDF for {chap_name}: {e}")
             continue
-    
     return combined_text
 
+def ocr_course_pdf(course, chapter, pdf_uri):
+    """Download and OCR one course PDF, then store it in the OCR cache"""
+    os.makedirs("/tmp", exist_ok=True)
+    local_path = f"/tmp/{chapter.replace(' ', '_').replace('/', '_')}_{uuid.uuid4().hex}.pdf"
+    try:
+        download_pdf(pdf_uri, local_path)
+        # Course PDFs are long and shared; never let them crowd out student uploads
+        with ocr_scheduler.priority(ocr_scheduler.at_most('normal')):
+            pages, separator = extract_pages_from_file(local_path)
+    finally:
+        try:
+            os.remove(local_path)
+        except:
+            pass
+    cache_ocr(course, chapter, pdf_uri, pages, separator)
+    ocr_text = separator.join(pages)
+    # New material: rebuild the practice banks generated from the old text
+    for bank_language in get_practice_languages(course, chapter):
+        schedule_practice_refill(course, chapter, bank_language)
+    return ocr_text
+
+@tracing.traced()
+def process_course_materials(course, chapter=None):
+    start = time.perf_counter()
+    chapters = [chapter] if chapter else course_chapters(course)
+    combined_text = "".join(
+        cached_material(('materials', course, name), lambda name=name: load_chapter_materials(course, name))
+        for name in chapters
+    )
+    metrics.COURSE_MATERIALS_SECONDS.observe(time.perf_counter() - start, scope='chapter' if chapter else 'course')
+    return combined_text
+
+# ----------------- Material Cache and Prefetch -----------------
+material_cache = warmup.TTLCache(MATERIAL_CACHE_ENTRIES, MATERIAL_CACHE_SECONDS)
+prefetcher = warmup.Prefetcher(PREFETCH_WORKERS, PREFETCH_MAX_PENDING)
+metrics.PREFETCH_PENDING.set_function(prefetcher.pending)
+
+def material_degraded():
+    """True while Snowflake or Drive is failing, so freshly loaded material may be incomplete"""
+    return any(breakers[name].state != breaker.CLOSED for name in ('snowflake', 'drive'))
+
+def stale_material(key):
+    value = material_cache.get(key, stale=True)
+    if value is not None:
+        metrics.CACHE_REQUESTS.inc(cache='materials', result='stale')
+    return value
+
+def _load_into_cache(key, load):
+    def run():
+        value = load()
+        if material_degraded():
+            # Loaded during an outage: prefer the last full copy and do not cache this one
+            stale = stale_material(key)
+            return stale if stale is not None else value
+        material_cache.put(key, value)
+        return value
+    return run
+
+def cached_material(key, load):
+    """Value for key from the in-process cache, else load() (joining a prefetch of the same key)"""
+    value = material_cache.get(key)
+    if value is not None:
+        metrics.CACHE_REQUESTS.inc(cache='materials', result='hit')
+        return value
+    if material_degraded():
+        value = stale_material(key)
+        if value is not None:
+            return value
+    metrics.CACHE_REQUESTS.inc(cache='materials', result='miss')
+    return prefetcher.run(key, _load_into_cache(key, load))
+
+def warm(key, load):
+    """Queue load() in the background unless key is already cached"""
+    if material_cache.get(key) is not None:
+        metrics.PREFETCH_REQUESTS.inc(result='cached')
+        return
+    prefetcher.prefetch(key, _load_into_cache(key, load))
+
+def course_chapters(course):
+    return cached_material(('chapters', course), lambda: get_chapters_for_course(course))
+
+def course_summaries(course):
+    return cached_material(('summaries', course), lambda: get_course_summaries(course))
+
+def course_passages(course, language='en'):
+    """The whole course's material cut into passages for matching specific questions"""
+    return cached_material(
+        ('passages', course, language),
+        lambda: summary_tree.chunk_text(process_course_materials(course), SUMMARY_PASSAGE_TOKENS, language)
+    )
+
+def prefetch_course(course, chapters):
+    """After a course is selected: warm its summaries and every chapter's material"""
+    material_cache.put(('chapters', course), chapters)
+    warm(('summaries', course), lambda: get_course_summaries(course))
+    for chapter in chapters:
+        warm(('materials', course, chapter), lambda chapter=chapter: load_chapter_materials(course, chapter))
+
+def prefetch_chapter(course, chapter, language='en'):
+    """After a chapter (or all chapters) is selected: warm what the first question will read"""
+    if chapter:
+        warm(('materials', course, chapter), lambda: load_chapter_materials(course, chapter))
+    else:
+        warm(('passages', course, language), lambda: summary_tree.chunk_text(
+            process_course_materials(course), SUMMARY_PASSAGE_TOKENS, language))
+
+# ----------------- Course Summaries -----------------
+SUMMARY_PROMPTS = {
+    'chunk': ("Summarize this part of a lecture for a study guide. Keep definitions, key terms, formulas "
+              "and examples; drop repetition and filler.\n\n{text}", 400),
+    'chapter': ("Combine these section summaries of one chapter into a single chapter summary. List the main "
+                "topics and the key definitions and results.\n\n{text}", 800),
+    'course': ("Combine these chapter summaries into a course overview. For each chapter (in [brackets]) give "
+               "its main topics in one or two lines, then the concepts that connect the chapters.\n\n{text}", 1000),
+}
+
+def summarize_text(text, level):
+    template, max_tokens = SUMMARY_PROMPTS[level]
+    summary = call_gemini(template.format(text=text), max_tokens=max_tokens, purpose='summary')
+    if summary == get_text('error_occurred'):
+        raise Exception(f"Gemini failed to summarize a {level}")
+    metrics.SUMMARY_BUILDS.inc(level=level)
+    return summary
+
+@tracing.traced()
+def refresh_course_summaries(course, force=False):
+    """Rebuild the summaries of chapters whose material changed, then the course summary; returns rebuilt chapters"""
+    stored = get_course_summaries(course)
+    chapter_summaries = {}
+    rebuilt = []
+    with ThreadPoolExecutor(max_workers=SUMMARY_CONCURRENCY) as executor:
+        def parallel_map(func, items):
+            return executor.map(tracing.wrap(func), items)
+        
+        for chapter in get_chapters_for_course(course):
+            text = process_course_materials(course, chapter)
+            if not text.strip():
+                continue
+            digest = summary_tree.source_hash(text)
+            current = stored['chapters'].get(chapter)
+            if current and current[1] == digest and not force:
+                chapter_summaries[chapter] = current[0]
+                continue
+            
+            tree = summary_tree.build_chapter_tree(
+                text, summarize_text, SUMMARY_CHUNK_TOKENS, SUMMARY_INPUT_TOKENS, map_function=parallel_map
+            )
+            nodes = [('chunk', index, summary, digest) for index, summary in enumerate(tree['chunks'])]
+            nodes.append(('chapter', 0, tree['summary'], digest))
+            save_summary_nodes(course, chapter, nodes)
+            chapter_summaries[chapter] = tree['summary']
+            rebuilt.append(chapter)
+    
+    if chapter_summaries:
+        labelled = [f"[{chapter}] {summary}" for chapter, summary in sorted(chapter_summaries.items())]
+        digest = summary_tree.source_hash("\n\n".join(labelled))
+        if force or not stored['course'] or stored['course'][1] != digest:
+            course_summary = summary_tree.reduce_summaries(labelled, summarize_text, 'course', SUMMARY_INPUT_TOKENS)
+            save_summary_nodes(course, '', [('course', 0, course_summary, digest)])
+    material_cache.invalidate(('summaries', course))
+    return rebuilt
+
+def refresh_all_summaries(force=False):
+    for course in get_all_courses():
+        try:
+            rebuilt = refresh_course_summaries(course, force=force)
+            logger.info(f"Summary tree for {course} is current ({len(rebuilt)} chapters rebuilt)")
+        except Exception as e:
+            logger.error(f"Error refreshing summaries for {course}: {e}")
+
+def _summary_refresher():
+    while True:
+        refresh_all_summaries()
+        time.sleep(SUMMARY_REFRESH_MINUTES * 60)
+
+if SUMMARY_REFRESH_MINUTES > 0:
+    threading.Thread(target=_summary_refresher, name='summary-refresher', daemon=True).start()
+
+@tracing.traced()
+def whole_course_context(course, question, language='en'):
+    """
+    Context for a question across all chapters: (summaries, passages), or None before a tree exists.
+    Broad questions get the summaries only; specific ones also get the best-matching raw passages.
+    """
+    stored = course_summaries(course)
+    if not stored['chapters']:
+        metrics.CACHE_REQUESTS.inc(cache='summary', result='miss')
+        return None
+    metrics.CACHE_REQUESTS.inc(cache='summary', result='hit')
+    
+    parts = []
+    if stored['course']:
+        parts.append(f"[Course summary]\n{stored['course'][0]}")
+    parts.extend(f"[{chapter}] {summary}" for chapter, (summary, _) in sorted(stored['chapters'].items()))
+    summaries = "\n\n".join(parts) + "\n\n"
+    
+    passages = ""
+    if not summary_tree.is_broad_question(question):
+        matches = summary_tree.rank_passages(course_passages(course, language), question, limit=8)
+        if matches:
+            passages = "[Relevant passages]\n" + "\n\n".join(matches)
+    return summaries, passages
+
+# ----------------- Practice Question Bank -----------------
+PRACTICE_BANK_PROMPT = ("Based on the following course material from {course} ({chapter}), write {count} practice "
+                        "questions with answers that test understanding, not just recall.\n\n"
+                        "Do not repeat these existing questions:\n{existing}\n\nCourse Material:\n{material}\n\n"
+                        "Format every item exactly as below, separated by a blank line, keeping the 'Q:' and 'A:' "
+                        "markers in English:\nQ: [Question]\nA: [Answer]")
+
+_practice_refills = set()
+_practice_refills_lock = threading.Lock()
+
+def generate_practice_items(course, chapter, material, count, language, existing_questions):
+    prompt = prompt_budget.render(
+        PRACTICE_BANK_PROMPT, language, PRACTICE_PROMPT_TOKENS,
+        fixed={'course': course, 'chapter': chapter, 'count': count},
+        sections=[('material', material, None), ('existing', "\n".join(existing_questions), 0.2)],
+        purpose='practice_bank'
+    )
+    return practice_bank.parse_items(call_gemini(prompt, max_tokens=1500, language=language, purpose='practice_bank'))
+
+@tracing.traced()
+def refill_practice_bank(course, chapter, language, target=None, force=False):
+    """Top a chapter's bank up to target questions (rebuilding it if the material changed); returns questions added"""
+    text = process_course_materials(course, chapter)
+    if not text.strip():
+        return 0
+    digest = summary_tree.source_hash(text)
+    existing = get_practice_questions(course, chapter, language)
+    stale = force or any(item['source_hash'] != digest for item in existing)
+    if stale:
+        existing = []
+    needed = (target or PRACTICE_BANK_SIZE) - len(existing)
+    if needed <= 0:
+        return 0
+    
+    # Spread generation calls across the chapter so the bank covers all of it
+    chunks = summary_tree.chunk_text(text, PRACTICE_PROMPT_TOKENS, language)
+    chosen = practice_bank.spread(chunks, max(1, -(-needed // PRACTICE_QUESTIONS_PER_CALL)))
+    per_call = -(-needed // len(chosen))
+    existing_questions = [item['question'] for item in existing]
+    with ThreadPoolExecutor(max_workers=SUMMARY_CONCURRENCY) as executor:
+        batches = list(executor.map(
+            tracing.wrap(lambda chunk: generate_practice_items(course, chapter, chunk, per_call, language, existing_questions)),
+            chosen
+        ))
+    
+    seen = {item['question_id'] for item in existing}
+    items = []
+    for question, answer in (item for batch in batches for item in batch):
+        qid = practice_bank.question_id(question)
+        if qid not in seen:
+            seen.add(qid)
+            items.append((qid, question, answer))
+    save_practice_questions(course, chapter, language, digest, items[:needed], replace=stale)
+    logger.info(f"Practice bank {course}/{chapter}/{language}: added {len(items[:needed])} questions")
+    return len(items[:needed])
+
+def schedule_practice_refill(course, chapter, language, target=None):
+    """Refill a bank in a background thread, at most one refill per bank at a time"""
+    key = (course, chapter, language)
+    with _practice_refills_lock:
+        if key in _practice_refills:
+            return
+        _practice_refills.add(key)
+    
+    def run():
+        try:
+            refill_practice_bank(course, chapter, language, target=target)
+        except Exception as e:
+            logger.error(f"Error refilling practice bank {key}: {e}")
+        finally:
+            with _practice_refills_lock:
+                _practice_refills.discard(key)
+    
+    threading.Thread(target=run, name='practice-refill', daemon=True).start()
+
+def serve_practice_questions(session):
+    """A sample of banked questions this session has not seen, or None if the bank cannot supply one yet"""
+    course, chapter, lang = session.current_course, session.current_chapter, session.language
+    bank = get_practice_questions(course, chapter, lang)
+    
+    per_chapter = {}
+    for item in bank:
+        per_chapter[item['chapter']] = per_chapter.get(item['chapter'], 0) + 1
+    unseen = [item for item in bank if item['question_id'] not in session.served_practice]
+    running_low = len(unseen) < 2 * PRACTICE_SAMPLE_SIZE
+    for bank_chapter in ([chapter] if chapter else course_chapters(course)):
+        size = per_chapter.get(bank_chapter, 0)
+        if size < PRACTICE_BANK_SIZE:
+            schedule_practice_refill(course, bank_chapter, lang)
+        elif running_low and size < PRACTICE_BANK_MAX:
+            # This session has used up most of the bank: grow it
+            schedule_practice_refill(course, bank_chapter, lang, target=min(PRACTICE_BANK_MAX, size + PRACTICE_BANK_SIZE))
+    
+    if len(unseen) < PRACTICE_SAMPLE_SIZE:
+        metrics.CACHE_REQUESTS.inc(cache='practice_bank', result='miss')
+        return None
+    metrics.CACHE_REQUESTS.inc(cache='practice_bank', result='hit')
+    items = practice_bank.sample(unseen, session.served_practice, PRACTICE_SAMPLE_SIZE)
+    session.served_practice.update(item['question_id'] for item in items)
+    return practice_bank.format_items(items, lang)
+
+def refresh_all_practice_banks(force=False):
+    for course in get_all_courses():
+        for chapter in get_chapters_for_course(course):
+            for language in PRACTICE_LANGUAGES:
+                try:
+                    refill_practice_bank(course, chapter, language, force=force)
+                except Exception as e:
+                    logger.error(f"Error refreshing practice bank {course}/{chapter}/{language}: {e}")
+
+def _practice_refresher():
+    while True:
+        refresh_all_practice_banks()
+        time.sleep(PRACTICE_REFRESH_MINUTES * 60)
+
+if PRACTICE_REFRESH_MINUTES > 0:
+    threading.Thread(target=_practice_refresher, name='practice-refresher', daemon=True).start()
+
 # ----------------- Chat Logic Functions -----------------
 def handle_general_query(message, session):
     """Handle general queries and route to specific modes"""
@@ -574,6 +1725,7 @@ def handle_course_selection(message, session):
         
         if chapters:
             session.state = "chapter_selection"
+            prefetch_course(message_clean, chapters)
             chapter_list = "\n".join([f"• {chapter}" for chapter in chapters])
             return f"{get_text('chapter_selection', lang, course=message_clean)}\n\n{chapter_list}\n\n{get_text('type_all_chapters', lang)}"
         else:
@@ -588,7 +1740,7 @@ def handle_chapter_selection(message, session):
         session.reset()
         return get_text('error_occurred', session.language)
     
-    chapters = get_chapters_for_course(session.current_course)
+    chapters = course_chapters(session.current_course)
     message_clean = message.strip()
     lang = session.language
     
@@ -598,11 +1750,13 @@ def handle_chapter_selection(message, session):
     if message_clean.lower() in all_keywords:
         session.current_chapter = None
         session.state = "qa_mode"
+        prefetch_chapter(session.current_course, None, lang)
         return get_text('all_chapters', lang, course=session.current_course)
     
     elif message_clean in chapters:
         session.current_chapter = message_clean
         session.state = "qa_mode"
+        prefetch_chapter(session.current_course, message_clean, lang)
         return get_text('chapter_ready', lang, chapter=message_clean, course=session.current_course)
     
     else:
@@ -627,20 +1781,30 @@ def handle_qa_mode(message, session):
         }
         
         if any(word in message.lower() for word in generate_keywords.get(lang, generate_keywords['en'])):
+            # Serve from the pre-generated bank when it has enough unseen questions
+            banked = serve_practice_questions(session)
+            if banked:
+                return banked
+            
             combined_text = process_course_materials(session.current_course, session.current_chapter)
             
             if combined_text.strip():
                 chapter_info = f" from {session.current_chapter}" if session.current_chapter else " from all chapters"
                 
                 question_prompts = {
-                    'en': f"Based on the following course material from {session.current_course}{chapter_info}, create 5 practice questions with answers.\n\nCourse Material:\n{combined_text[:3000]}\n\nPlease format as:\nQ1: [Question]\nA1: [Answer]\n\nQ2: [Question]\nA2: [Answer]\n\netc.",
-                    'hi': f"{session.current_course}{chapter_info} की निम्नलिखित कोर्स सामग्री के आधार पर, उत्तरों के साथ 5 अभ्यास प्रश्न बनाएं।\n\nकोर्स सामग्री:\n{combined_text[:3000]}\n\nकृपया इस प्रकार प्रारूपित करें:\nप्र1: [प्रश्न]\nउ1: [उत्तर]\n\nप्र2: [प्रश्न]\nउ2: [उत्तर]\n\nआदि।",
-                    'es': f"Basado en el siguiente material del curso de {session.current_course}{chapter_info}, crea 5 preguntas de práctica con respuestas.\n\nMaterial del Curso:\n{combined_text[:3000]}\n\nPor favor formatea como:\nP1: [Pregunta]\nR1: [Respuesta]\n\nP2: [Pregunta]\nR2: [Respuesta]\n\netc.",
-                    'fr': f"Basé sur le matériel de cours suivant de {session.current_course}{chapter_info}, créez 5 questions de pratique avec réponses.\n\nMatériel de Cours:\n{combined_text[:3000]}\n\nVeuillez formater comme:\nQ1: [Question]\nR1: [Réponse]\n\nQ2: [Question]\nR2: [Réponse]\n\netc."
+                    'en': "Based on the following course material from {course}{chapter_info}, create 5 practice questions with answers.\n\nCourse Material:\n{material}\n\nPlease format as:\nQ1: [Question]\nA1: [Answer]\n\nQ2: [Question]\nA2: [Answer]\n\netc.",
+                    'hi': "{course}{chapter_info} की निम्नलिखित कोर्स सामग्री के आधार पर, उत्तरों के साथ 5 अभ्यास प्रश्न बनाएं।\n\nकोर्स सामग्री:\n{material}\n\nकृपया इस प्रकार प्रारूपित करें:\nप्र1: [प्रश्न]\nउ1: [उत्तर]\n\nप्र2: [प्रश्न]\nउ2: [उत्तर]\n\nआदि।",
+                    'es': "Basado en el siguiente material del curso de {course}{chapter_info}, crea 5 preguntas de práctica con respuestas.\n\nMaterial del Curso:\n{material}\n\nPor favor formatea como:\nP1: [Pregunta]\nR1: [Respuesta]\n\nP2: [Pregunta]\nR2: [Respuesta]\n\netc.",
+                    'fr': "Basé sur le matériel de cours suivant de {course}{chapter_info}, créez 5 questions de pratique avec réponses.\n\nMatériel de Cours:\n{material}\n\nVeuillez formater comme:\nQ1: [Question]\nR1: [Réponse]\n\nQ2: [Question]\nR2: [Réponse]\n\netc."
                 }
                 
-                prompt = question_prompts.get(lang, question_prompts['en'])
-                return call_gemini(prompt, max_tokens=1500, language=lang)
+                prompt = prompt_budget.render(
+                    question_prompts.get(lang, question_prompts['en']), lang, PRACTICE_PROMPT_TOKENS,
+                    fixed={'course': session.current_course, 'chapter_info': chapter_info},
+                    sections=[('material', combined_text, None)],
+                    purpose='practice'
+                )
+                return call_gemini(prompt, max_tokens=1500, language=lang, purpose='practice')
             else:
                 return f"{get_text('no_courses', lang)} {session.current_course}{chapter_info}"
         
@@ -650,23 +1814,35 @@ def handle_qa_mode(message, session):
             for doc_info in session.uploaded_documents:
                 uploaded_context += f"\n[Uploaded Document] {doc_info['text']}"
             
-            # Get course materials
-            combined_text = process_course_materials(session.current_course, session.current_chapter)
+            # Across all chapters, use the summary tree (plus matching passages) when it has been built
+            summaries = ""
+            course_context = None if session.current_chapter else whole_course_context(session.current_course, message, lang)
+            if course_context:
+                summaries, combined_text = course_context
+            else:
+                combined_text = process_course_materials(session.current_course, session.current_chapter)
             
-            context = combined_text + uploaded_context
+            context = summaries + combined_text + uploaded_context
             
             if context.strip():
                 chapter_info = f" from {session.current_chapter}" if session.current_chapter else ""
                 
                 context_prompts = {
-                    'en': f"You are a helpful teaching assistant for {session.current_course}{chapter_info}.\n\nStudent question: {message}\n\nPlease answer based on the following course material:\n{context[:4000]}\n\nProvide a clear, educational response that directly addresses the student's question.",
-                    'hi': f"आप {session.current_course}{chapter_info} के लिए एक सहायक शिक्षण सहायक हैं।\n\nछात्र का प्रश्न: {message}\n\nकृपया निम्नलिखित कोर्स सामग्री के आधार पर उत्तर दें:\n{context[:4000]}\n\nएक स्पष्ट, शैक्षणिक प्रतिक्रिया प्रदान करें जो सीधे छात्र के प्रश्न को संबोधित करे।",
-                    'es': f"Eres un asistente de enseñanza útil para {session.current_course}{chapter_info}.\n\nPregunta del estudiante: {message}\n\nPor favor responde basándote en el siguiente material del curso:\n{context[:4000]}\n\nProporciona una respuesta clara y educativa que aborde directamente la pregunta del estudiante.",
-                    'fr': f"Vous êtes un assistant pédagogique utile pour {session.current_course}{chapter_info}.\n\nQuestion de l'étudiant: {message}\n\nVeuillez répondre en vous basant sur le matériel de cours suivant:\n{context[:4000]}\n\nFournissez une réponse claire et éducative qui répond directement à la question de l'étudiant."
+                    'en': "You are a helpful teaching assistant for {course}{chapter_info}.\n\nStudent question: {question}\n\nPlease answer based on the following course material:\n{summaries}{material}{uploads}\n\nProvide a clear, educational response that directly addresses the student's question.",
+                    'hi': "आप {course}{chapter_info} के लिए एक सहायक शिक्षण सहायक हैं।\n\nछात्र का प्रश्न: {question}\n\nकृपया निम्नलिखित कोर्स सामग्री के आधार पर उत्तर दें:\n{summaries}{material}{uploads}\n\nएक स्पष्ट, शैक्षणिक प्रतिक्रिया प्रदान करें जो सीधे छात्र के प्रश्न को संबोधित करे।",
+                    'es': "Eres un asistente de enseñanza útil para {course}{chapter_info}.\n\nPregunta del estudiante: {question}\n\nPor favor responde basándote en el siguiente material del curso:\n{summaries}{material}{uploads}\n\nProporciona una respuesta clara y educativa que aborde directamente la pregunta del estudiante.",
+                    'fr': "Vous êtes un assistant pédagogique utile pour {course}{chapter_info}.\n\nQuestion de l'étudiant: {question}\n\nVeuillez répondre en vous basant sur le matériel de cours suivant:\n{summaries}{material}{uploads}\n\nFournissez une réponse claire et éducative qui répond directement à la question de l'étudiant."
                 }
                 
-                prompt = context_prompts.get(lang, context_prompts['en'])
-                return call_gemini(prompt, max_tokens=1000, language=lang)
+                # The question comes first, then the student's uploads, summaries and course material
+                prompt = prompt_budget.render(
+                    context_prompts.get(lang, context_prompts['en']), lang, QA_PROMPT_TOKENS,
+                    fixed={'course': session.current_course, 'chapter_info': chapter_info},
+                    sections=[('question', message, 0.2), ('uploads', uploaded_context, 0.3),
+                              ('summaries', summaries, 0.4), ('material', combined_text, None)],
+                    purpose='qa'
+                )
+                return call_gemini(prompt, max_tokens=1000, language=lang, purpose='qa')
             else:
                 fallback_prompt = f"Educational question about {message}"
                 return f"{get_text('no_courses', lang)} {session.current_course}{chapter_info}, " + call_gemini(fallback_prompt, language=lang)
@@ -685,15 +1861,8 @@ def handle_scoring_mode(message, session):
             assignment_text = session.assignment_pdf['text']
             answer_text = session.answer_pdf['text']
             
-            scoring_prompts = {
-                'en': f"You are an experienced teacher evaluating a student's work.\n\nASSIGNMENT/QUESTIONS:\n{assignment_text[:2000]}\n\nSTUDENT'S ANSWERS:\n{answer_text[:2000]}\n\nPlease provide:\n1. Overall score out of 100\n2. Detailed feedback for each question/section\n3. Specific areas where the student did well\n4. Areas that need improvement\n5. Suggestions for better answers\n\nBe constructive and helpful in your feedback.",
-                'hi': f"आप एक अनुभवी शिक्षक हैं जो छात्र के काम का मूल्यांकन कर रहे हैं।\n\nअसाइनमेंट/प्रश्न:\n{assignment_text[:2000]}\n\nछात्र के उत्तर:\n{answer_text[:2000]}\n\nकृपया प्रदान करें:\n1. 100 में से कुल स्कोर\n2. प्रत्येक प्रश्न/अनुभाग के लिए विस्तृत फीडबैक\n3. विशिष्ट क्षेत्र जहाँ छात्र ने अच्छा काम किया\n4. सुधार की आवश्यकता वाले क्षेत्र\n5. बेहतर उत्तरों के लिए सुझाव\n\nअपने फीडबैक में रचनात्मक और सहायक बनें।",
-                'es': f"Eres un profesor experimentado evaluando el trabajo de un estudiante.\n\nTAREA/PREGUNTAS:\n{assignment_text[:2000]}\n\nRESPUESTAS DEL ESTUDIANTE:\n{answer_text[:2000]}\n\nPor favor proporciona:\n1. Puntuación general sobre 100\n2. Comentarios detallados para cada pregunta/sección\n3. Áreas específicas donde el estudiante lo hizo bien\n4. Áreas que necesitan mejora\n5. Sugerencias para mejores respuestas\n\nSé constructivo y útil en tus comentarios.",
-                'fr': f"Vous êtes un enseignant expérimenté évaluant le travail d'un étudiant.\n\nDEVOIR/QUESTIONS:\n{assignment_text[:2000]}\n\nRÉPONSES DE L'ÉTUDIANT:\n{answer_text[:2000]}\n\nVeuillez fournir:\n1. Score global sur 100\n2. Commentaires détaillés pour chaque question/section\n3. Domaines spécifiques où l'étudiant a bien réussi\n4. Domaines qui nécessitent des améliorations\n5. Suggestions pour de meilleures réponses\n\nSoyez constructif et utile dans vos commentaires."
-            }
-            
-            prompt = scoring_prompts.get(lang, scoring_prompts['en'])
-            response = call_gemini(prompt, max_tokens=1500, language=lang)
+            score, results, _ = score_solution(assignment_text, answer_text, language=lang)
+            response = f"{get_text('overall_score', lang, score=score)}\n\n{format_question_feedback(results)}"
             
             # Reset scoring mode after evaluation
             session.assignment_pdf = None
@@ -715,8 +1884,230 @@ def handle_scoring_mode(message, session):
     else:
         return get_text('scoring_mode', lang)
 
+# ----------------- Bulk Grading Functions -----------------
+def student_id_from_path(path):
+    """'alice/page1.jpg' -> 'alice', 'bob.pdf' -> 'bob'"""
+    parts = [p for p in path.replace('\\', '/').split('/') if p]
+    if len(parts) > 1:
+        return secure_filename(parts[-2]) or 'student'
+    return secure_filename(os.path.splitext(parts[-1])[0]) or 'student'
+
+def read_bulk_archive(archive_file):
+    """Group the files of a zip archive by student (top-level file or folder name)"""
+    submissions = {}
+    with zipfile.ZipFile(archive_file) as archive:
+        entries = [info for info in archive.infolist()
+                   if not info.is_dir()
+                   and not info.filename.startswith('__MACOSX/')
+                   and not os.path.basename(info.filename).startswith('.')
+                   and allowed_file(os.path.basename(info.filename))]
+        if sum(info.file_size for info in entries) > BULK_MAX_UNCOMPRESSED_BYTES:
+            raise ValueError("Archive is too large once extracted")
+        for info in sorted(entries, key=lambda i: i.filename):
+            student = student_id_from_path(info.filename)
+            submissions.setdefault(student, []).append(
+                (secure_filename(os.path.basename(info.filename)), archive.read(info))
+            )
+    return submissions
+
+def collect_bulk_submissions():
+    """Student submissions from an 'archive' zip and/or 'solution_files' (one file per student)"""
+    submissions = {}
+    archive = request.files.get('archive')
+    if archive and archive.filename:
+        submissions.update(read_bulk_archive(archive.stream))
+    for filename, data in collect_uploads(('solution_files',)):
+        submissions.setdefault(student_id_from_path(filename), []).append((filename, data))
+    return submissions
+
+def bulk_event(event, **fields):
+    return json.dumps({"event": event, **fields}) + "\n"
+
+def grade_submissions(assignment_id, assignment, submissions):
+    """Generator of NDJSON progress events for grading a whole class"""
+    students = sorted(submissions)
+    yield bulk_event("started", assignment_id=assignment_id, students=len(students))
+    
+    # OCR the question paper once
+    with ocr_scheduler.priority('normal'):
+        assignment_text = fetch_assignment_text(assignment)
+    yield bulk_event("assignment_ocr_done", characters=len(assignment_text))
+    
+    # Batch OCR the answers
+    solution_texts = {}
+    failed = {}
+    for i in range(0, len(students), BULK_OCR_BATCH_DOCUMENTS):
+        batch = students[i:i + BULK_OCR_BATCH_DOCUMENTS]
+        try:
+            with ocr_scheduler.priority('normal'):
+                texts = ocr_documents_batch([submissions[student] for student in batch])
+            solution_texts.update(zip(batch, texts))
+            for student in batch:
+                yield bulk_event("ocr_done", student=student)
+        except Exception as e:
+            logger.error(f"Bulk OCR failed for batch starting at {batch[0]}: {e}")
+            for student in batch:
+                failed[student] = "ocr_failed"
+                yield bulk_event("error", student=student, stage="ocr")
+    
+    # Fan out scoring with bounded concurrency (each solution also fans out per question)
+    results = {}
+    with ThreadPoolExecutor(max_workers=BULK_GEMINI_CONCURRENCY) as executor:
+        futures = {
+            executor.submit(tracing.wrap(score_solution), assignment_text, text): student
+            for student, text in solution_texts.items()
+        }
+        for future in as_completed(futures):
+            student = futures[future]
+            try:
+                score, question_results, complete = future.result()
+                results[student] = {
+                    "score": score,
+                    "feedback": f"SCORE: {score}/100\nFEEDBACK:\n{format_question_feedback(question_results)}"
+                }
+                yield bulk_event("scored", student=student, score=score, complete=complete,
+                                 questions={r['label']: r['score'] for r in question_results})
+            except Exception as e:
+                logger.error(f"Bulk scoring failed for {student}: {e}")
+                failed[student] = "scoring_failed"
+                yield bulk_event("error", student=student, stage="scoring")
+    
+    # Bulk upload the solutions to Drive; while Drive's circuit is open, uploads are queued for later
+    deferred_uploads = []
+    with ThreadPoolExecutor(max_workers=BULK_DRIVE_CONCURRENCY) as executor:
+        futures = {
+            executor.submit(tracing.wrap(upload_solution_to_drive), assemble_pdf(submissions[student]),
+                            assignment_id, f"{assignment[2]}_{student}"): student
+            for student in results
+        }
+        for future in as_completed(futures):
+            student = futures[future]
+            try:
+                results[student]["solution_pdf"] = future.result()
+                yield bulk_event("uploaded", student=student, solution_pdf=results[student]["solution_pdf"])
+            except breaker.CircuitOpen:
+                results[student]["solution_pdf"] = None
+                deferred_uploads.append(student)
+                yield bulk_event("upload_queued", student=student)
+            except Exception as e:
+                logger.error(f"Bulk upload failed for {student}: {e}")
+                results[student]["solution_pdf"] = None
+                yield bulk_event("error", student=student, stage="upload")
+    
+    # Commit every score in one statement
+    saved = save_submission_scores([
+        (assignment_id, student, r["solution_pdf"], r["score"], r["feedback"])
+        for student, r in sorted(results.items())
+    ])
+    # Queued after the batch write, so they fill in the links the batch left empty
+    for student in deferred_uploads:
+        write_behind.submit('persist_submission', {
+            'assignment_id': assignment_id,
+            'student_id': student,
+            'upload_name': f"{assignment[2]}_{student}",
+            'score': results[student]["score"],
+            'feedback': results[student]["feedback"]
+        }, blob=assemble_pdf(submissions[student]))
+    
+    scores = [r["score"] for r in results.values()]
+    yield bulk_event(
+        "summary",
+        assignment_id=assignment_id,
+        graded=len(results),
+        failed=failed,
+        saved=saved,
+        average_score=round(sum(scores) / len(scores), 2) if scores else None,
+        results=[{"student": student, "score": r["score"], "solution_pdf": r.get("solution_pdf")}
+                 for student, r in sorted(results.items())]
+    )
+
+# ----------------- Admission Control -----------------
+# Rate-limited endpoints and the work classes whose queues must not be full when they arrive.
+# Slots are taken around the OCR runs, Gemini calls and Drive transfers themselves, not per request.
+ADMISSION_ROUTES = {
+    'submit_solution': ('ocr', 'gemini', 'drive'),
+    'bulk_grade': (),  # waits for slots instead of being shed, and never takes the reserved ones
+}
+CHAT_ENDPOINTS = ('chat', 'ask', 'api_ask')
+
+def admission_classes():
+    """Work classes to check for this request, or None if it skips admission"""
+    if request.endpoint in CHAT_ENDPOINTS:
+        return ('ocr',) if request.files else ('gemini',)
+    return ADMISSION_ROUTES.get(request.endpoint)
+
+def request_session_id():
+    if request.is_json:
+        body = request.get_json(silent=True)
+        return body.get('session_id') if isinstance(body, dict) else None
+    return request.form.get('session_id')
+
+def request_user_id():
+    # Not a header: the client could pick a fresh one for every request
+    return request.remote_addr
+
+def retry_response(status, retry_after, message):
+    response = jsonify({"error": f"{message}, please retry in {retry_after} seconds", "retry_after": retry_after})
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def overloaded_response(e):
+    return retry_response(e.status, e.retry_after, "Too many requests" if e.status == 429 else "Server is busy")
+
+# ----------------- Request Metrics and Tracing -----------------
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    metrics.HTTP_REQUESTS_IN_PROGRESS.inc(endpoint=request.endpoint)
+    route = request.url_rule.rule if request.url_rule else request.path
+    g.trace = tracing.start_trace(f"{request.method} {route}", trace_id=request.headers.get('X-Request-ID'))
+
+@app.before_request
+def start_write_behind():
+    # Started by the server rather than at import, so scripts that import app never drain the journal
+    write_behind.start()
+
+@app.before_request
+def admit_request():
+    """Rate-limit expensive requests and shed them early with 429/503 when their work queues are already full"""
+    classes = admission_classes()
+    if classes is None:
+        return None
+    try:
+        for limiter, key in ((session_limiter, request_session_id()), (user_limiter, request_user_id())):
+            wait = limiter.check(key)
+            if wait:
+                raise admission.Overloaded(429, wait, limiter.name)
+        for work_class in classes:
+            admission_pools[work_class].check()
+    except admission.Overloaded as e:
+        logger.warning(f"Shedding {request.endpoint}: {e}")
+        return overloaded_response(e)
+    return None
+
+@app.after_request
+def record_request_metrics(response):
+    if 'request_start' in g:
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - g.request_start,
+            endpoint=request.endpoint, method=request.method, status=response.status_code
+        )
+    if 'trace' in g:
+        response.headers['X-Trace-Id'] = g.trace.trace_id
+        g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_timer(exc):
+    if 'request_start' in g:
+        metrics.HTTP_REQUESTS_IN_PROGRESS.dec(endpoint=request.endpoint)
+    if 'trace' in g:
+        tracing.finish_trace(status=g.get('response_status', 500))
+
 # ----------------- Main Chat Endpoint -----------------
 @app.route("/chat", methods=["POST"])
+@ocr_scheduler.priority('interactive')  # a student is waiting on every OCR run and Gemini call made here
 def chat():
     try:
         # Get or create session ID - handle both JSON and FormData
@@ -751,58 +2142,55 @@ def chat():
         session = user_sessions[session_id]
         session.language = lang if lang in TRANSLATIONS else 'en'
         
-        # Handle file uploads
-        if 'file' in request.files:
-            file = request.files['file']
-            if file.filename != '' and allowed_file(file.filename):
-                try:
-                    filename = secure_filename(file.filename)
-                    filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{session_id}_{filename}")
-                    file.save(filepath)
-                    
-                    # Extract text from uploaded file
-                    extracted_text = extract_text_from_file(filepath)
-                    
-                    # Determine file purpose based on current state
-                    if session.state == "scoring_mode":
-                        if not session.assignment_pdf:
-                            session.assignment_pdf = {
-                                'filename': filename,
-                                'text': extracted_text
-                            }
-                            response = get_text('assignment_uploaded', session.language, filename=filename)
-                        elif not session.answer_pdf:
-                            session.answer_pdf = {
-                                'filename': filename,
-                                'text': extracted_text
-                            }
-                            response = handle_scoring_mode("", session)
-                        else:
-                            response = handle_scoring_mode("", session)
-                    else:
-                        # Add to uploaded documents for context
-                        session.uploaded_documents.append({
+        # Handle file uploads (one or more files, OCR'd in memory as one document)
+        uploads = collect_uploads(('file', 'files'))
+        if uploads:
+            if len(uploads) > MAX_UPLOAD_FILES:
+                return jsonify({"error": f"Too many files (maximum {MAX_UPLOAD_FILES})"}), 400
+            try:
+                filename = describe_uploads(uploads)
+                
+                # Extract text from uploaded files (a student is waiting: interactive OCR)
+                with ocr_scheduler.priority('interactive'):
+                    extracted_text = extract_text_from_uploads(uploads)
+                
+                # Determine file purpose based on current state
+                if session.state == "scoring_mode":
+                    if not session.assignment_pdf:
+                        session.assignment_pdf = {
                             'filename': filename,
                             'text': extracted_text
-                        })
-                        response = get_text('upload_success', session.language, filename=filename)
-                    
-                    # Clean up file
-                    try:
-                        os.remove(filepath)
-                    except:
-                        pass
-                    
-                    return jsonify({
-                        "answer": response,
-                        "session_id": session_id,
-                        "state": session.state,
-                        "language": session.language
+                        }
+                        response = get_text('assignment_uploaded', session.language, filename=filename)
+                    elif not session.answer_pdf:
+                        session.answer_pdf = {
+                            'filename': filename,
+                            'text': extracted_text
+                        }
+                        response = handle_scoring_mode("", session)
+                    else:
+                        response = handle_scoring_mode("", session)
+                else:
+                    # Add to uploaded documents for context
+                    session.uploaded_documents.append({
+                        'filename': filename,
+                        'text': extracted_text
                     })
-                    
-                except Exception as e:
-                    logger.error(f"Error processing uploaded file: {e}")
-                    return jsonify({"error": get_text('error_occurred', session.language)}), 500
+                    response = get_text('upload_success', session.language, filename=filename)
+                
+                return jsonify({
+                    "answer": response,
+                    "session_id": session_id,
+                    "state": session.state,
+                    "language": session.language
+                })
+                
+            except admission.Overloaded as e:
+                logger.warning(f"Shedding chat upload: {e}")
+                return overloaded_response(e)
+            except Exception as e:
+                logger.error(f"Error processing uploaded file: {e}")
+                return jsonify({"error": get_text('error_occurred', session.language)}), 500
         
         # Handle text messages
         if not user_message:
@@ -873,76 +2261,113 @@ def submit_solution():
         if not assignment:
             return jsonify({"error": "Assignment not found"}), 404
             
-        # Check if solution file is uploaded
+        # Check if solution file(s) are uploaded
         if 'solution_file' not in request.files:
             return jsonify({"error": "Solution file is required"}), 400
             
-        file = request.files['solution_file']
-        if file.filename == '' or not allowed_file(file.filename):
+        uploads = collect_uploads(('solution_file',))
+        if not uploads:
             return jsonify({"error": "Invalid file format"}), 400
+        if len(uploads) > MAX_UPLOAD_FILES:
+            return jsonify({"error": f"Too many files (maximum {MAX_UPLOAD_FILES})"}), 400
         
-        # Save and process the solution file
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"solution_{assignment_id}_{filename}")
-        file.save(filepath)
+        solution_hash = solution_fingerprint(uploads)
         
-        try:
-            # Extract text from solution file
-            solution_text = extract_text_from_file(filepath)
-            
-            # Download and extract text from assignment PDF
-            assignment_pdf_path = f"/tmp/assignment_{assignment_id}.pdf"
-            download_pdf(assignment[3], assignment_pdf_path)  # assignment[3] is assignment_pdf URL
-            assignment_text = extract_text_from_file(assignment_pdf_path)
-            
-            # Score the solution using Gemini
-            prompt = f"You are an experienced teacher evaluating a student's work. Please provide a numerical score out of 100 and brief feedback.\n\nASSIGNMENT:\n{assignment_text[:2000]}\n\nSTUDENT'S SOLUTION:\n{solution_text[:2000]}\n\nPlease respond in the format:\nSCORE: [number]/100\nFEEDBACK: [brief feedback]"
-            
-            gemini_response = call_gemini(prompt, max_tokens=500)
-            
-            # Extract score from response
-            score = 0
-            try:
-                if "SCORE:" in gemini_response:
-                    score_line = gemini_response.split("SCORE:")[1].split("FEEDBACK:")[0].strip()
-                    score = int(score_line.split("/")[0].strip())
-            except:
-                score = 75  # Default score if parsing fails
+        def grade():
+            cached = get_cached_score(assignment_id, solution_hash, SCORING_PROMPT_VERSION)
+            if cached:
+                metrics.CACHE_REQUESTS.inc(cache='scoring', result='hit')
+                score, gemini_response = cached
+            else:
+                metrics.CACHE_REQUESTS.inc(cache='scoring', result='miss')
+                # OCR the solution while the assignment is downloaded and OCR'd
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    solution_future = executor.submit(tracing.wrap(extract_text_from_uploads), uploads)
+                    assignment_future = executor.submit(tracing.wrap(fetch_assignment_text), assignment)
+                    solution_text = solution_future.result()
+                    assignment_text = assignment_future.result()
                 
-            # Upload solution to Google Drive
-            solution_drive_link = upload_solution_to_drive(
-                filepath, assignment_id, assignment[2]  # assignment[2] is assignment_name
-            )
-            
-            # Update database
-            update_assignment_solution(assignment_id, solution_drive_link, score)
-            
-            # Clean up files
-            try:
-                os.remove(filepath)
-                os.remove(assignment_pdf_path)
-            except:
-                pass
-            
-            return jsonify({
-                "message": get_text('solution_submitted'),
-                "score": score,
-                "feedback": gemini_response,
-                "solution_pdf": solution_drive_link
-            })
-            
-        except Exception as e:
-            # Clean up file on error
-            try:
-                os.remove(filepath)
-            except:
-                pass
-            raise e
+                # Score the solution question by question
+                score, results, complete = score_solution(assignment_text, solution_text)
+                gemini_response = f"SCORE: {score}/100\nFEEDBACK:\n{format_question_feedback(results)}"
+                # Only keep fully scored results, never ones containing an error message
+                if complete:
+                    cache_score(assignment_id, solution_hash, SCORING_PROMPT_VERSION, score, gemini_response)
             
+            # Drive upload and database update happen after the response (retried until they succeed)
+            job_id = write_behind.submit('persist_solution', {
+                'assignment_id': assignment_id,
+                'assignment_name': assignment[2],  # assignment[2] is assignment_name
+                'score': score
+            }, blob=assemble_pdf(uploads))
+            return score, gemini_response, job_id
+        
+        # Duplicate submissions in flight (e.g. a double click) share one grading pass
+        with ocr_scheduler.priority('interactive'):
+            score, gemini_response, job_id = run_once_per_key(
+                (assignment_id, solution_hash, SCORING_PROMPT_VERSION), grade
+            )
+        
+        return jsonify({
+            "message": get_text('solution_submitted'),
+            "score": score,
+            "feedback": gemini_response,
+            "solution_pdf": None,
+            "upload_job": job_id
+        })
+        
+    except admission.Overloaded as e:
+        logger.warning(f"Shedding submission: {e}")
+        return overloaded_response(e)
     except Exception as e:
         logger.error(f"Error submitting solution: {e}")
         return jsonify({"error": get_text('error_occurred')}), 500
 
+@app.route("/submit_solution/status/<job_id>", methods=["GET"])
+def submit_solution_status(job_id):
+    """Progress of the Drive upload and score write for a submitted solution"""
+    job = write_behind.status(job_id)
+    if not job:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify({
+        "job_id": job_id,
+        "state": job['state'],
+        "attempts": job['attempts'],
+        "solution_pdf": job['payload'].get('solution_pdf'),
+        "error": job['last_error']
+    })
+
+@app.route("/bulk_grade", methods=["POST"])
+def bulk_grade():
+    """Grade a whole class of answer sheets for one assignment, streaming NDJSON progress"""
+    try:
+        assignment_id = request.form.get('assignment_id')
+        if not assignment_id:
+            return jsonify({"error": "Assignment ID is required"}), 400
+        
+        assignment = get_assignment_by_id(assignment_id)
+        if not assignment:
+            return jsonify({"error": "Assignment not found"}), 404
+        
+        try:
+            submissions = collect_bulk_submissions()
+        except (zipfile.BadZipFile, ValueError) as e:
+            return jsonify({"error": f"Invalid archive: {e}"}), 400
+        
+        if not submissions:
+            return jsonify({"error": "Provide an 'archive' zip or 'solution_files'"}), 400
+        if len(submissions) > BULK_MAX_STUDENTS:
+            return jsonify({"error": f"Too many submissions (maximum {BULK_MAX_STUDENTS})"}), 400
+        
+        return Response(
+            stream_with_context(grade_submissions(assignment_id, assignment, submissions)),
+            mimetype='application/x-ndjson'
+        )
+    
+    except Exception as e:
+        logger.error(f"Error in bulk grading: {e}")
+        return jsonify({"error": get_text('error_occurred')}), 500
+
 # ----------------- Additional Endpoints -----------------
 @app.route("/reset_session", methods=["POST"])
 def reset_session():
@@ -1002,8 +2427,10 @@ def set_language():
 @app.route("/courses", methods=["GET"])
 def get_courses():
     try:
-        courses = get_all_courses()
+        courses = get_all_courses(strict=True)
         return jsonify({"courses": courses})
+    except breaker.CircuitOpen as e:
+        return retry_response(503, e.retry_after, "Course list is temporarily unavailable")
     except Exception as e:
         logger.error(f"Error fetching courses: {e}")
         return jsonify({"error": "Failed to fetch courses"}), 500
@@ -1011,8 +2438,10 @@ def get_courses():
 @app.route("/chapters/<course_id>", methods=["GET"])
 def get_chapters(course_id):
     try:
-        chapters = get_chapters_for_course(course_id)
+        chapters = get_chapters_for_course(course_id, strict=True)
         return jsonify({"chapters": chapters})
+    except breaker.CircuitOpen as e:
+        return retry_response(503, e.retry_after, "Chapter list is temporarily unavailable")
     except Exception as e:
         logger.error(f"Error fetching chapters: {e}")
         return jsonify({"error": "Failed to fetch chapters"}), 500
@@ -1043,13 +2472,72 @@ def ask():
     """Alternative compatibility route"""
     return chat()
 
+# ----------------- Admin Endpoints -----------------
+def require_admin():
+    # Header only: a query-string token would end up in access logs and traced URLs
+    token = request.headers.get('X-Admin-Token', '')
+    if not ADMIN_TOKEN or not hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+        abort(403)
+
+@app.route("/admin/traces", methods=["GET"])
+def admin_traces():
+    """Recent (or only slow) request traces"""
+    require_admin()
+    slow_only = request.args.get('slow', 'false').lower() == 'true'
+    limit = max(0, request.args.get('limit', 50, type=int))
+    return jsonify({"traces": tracing.recent_traces(slow_only=slow_only, limit=limit)})
+
+@app.route("/admin/traces/<trace_id>", methods=["GET"])
+def admin_trace(trace_id):
+    """Span tree for one trace"""
+    require_admin()
+    trace = tracing.get_trace(trace_id)
+    if not trace:
+        return jsonify({"error": "Trace not found"}), 404
+    return jsonify(trace.to_dict())
+
+@app.route("/admin/traces/<trace_id>/profile/<kind>", methods=["GET"])
+def admin_trace_profile(trace_id, kind):
+    """Download a profile dump (collapsed, pstats, tracemalloc or trace)"""
+    require_admin()
+    trace = tracing.get_trace(trace_id)
+    if not trace or kind not in trace.profile_files:
+        return jsonify({"error": "Profile not found"}), 404
+    return send_file(trace.profile_files[kind], as_attachment=True)
+
+@app.route("/admin/summaries/<course>", methods=["GET"])
+def admin_summaries(course):
+    """Stored chapter and course summaries for one course"""
+    require_admin()
+    stored = get_course_summaries(course)
+    return jsonify({
+        "course": course,
+        "version": summary_tree.SUMMARY_VERSION,
+        "summary": stored['course'][0] if stored['course'] else None,
+        "chapters": {chapter: summary for chapter, (summary, _) in stored['chapters'].items()}
+    })
+
+@app.route("/admin/summaries/<course>/rebuild", methods=["POST"])
+def admin_rebuild_summaries(course):
+    """Refresh a course's summary tree in the background (?force=true rebuilds every chapter)"""
+    require_admin()
+    force = request.args.get('force', 'false').lower() == 'true'
+    threading.Thread(target=refresh_course_summaries, args=(course, force), name='summary-rebuild', daemon=True).start()
+    return jsonify({"message": f"Rebuilding summaries for {course}"}), 202
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
 @app.route("/health", methods=["GET"])
 def health_check():
+    circuits = {name: circuit.snapshot() for name, circuit in breakers.items()}
     return jsonify({
-        "status": "healthy",
+        "status": "degraded" if any(c['state'] != breaker.CLOSED for c in circuits.values()) else "healthy",
         "snowflake": "connected" if cur else "disconnected",
         "drive": "connected" if drive else "disconnected",
         "ocr": "loaded" if ocr_model else "not loaded",
+        "circuits": circuits,
         "languages": list(TRANSLATIONS.keys())
     })
 
@@ -1071,4 +2559,6 @@ if __name__ == "__main__":
     else:
         logger.info("All required environment variables are set")
     
+    # Resume jobs left in the journal without waiting for the first request
+    write_behind.start()
     app.run(host=host, port=port, debug=debug)
\ No newline at end of file
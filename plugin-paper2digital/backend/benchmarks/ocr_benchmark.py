@@ -0,0 +1,360 @@
+"""
+OCR benchmark for the Paper2Digital backend.
+
+Builds a deterministic synthetic document corpus (clean digital text,
+scanned-style noise and handwriting-like rendering, 1 to 500 pages) and runs
+every document through app.extract_text_from_file. For each case it records
+pages/sec, p50/p95 latency, process peak RSS and character accuracy against the
+ground truth, and writes everything to a JSON file so that runs can be
+compared across commits and configurations.
+
+Run from the backend folder:
+    python -m benchmarks.ocr_benchmark --sizes 1,10,50 --output ocr_bench.json
+    python -m benchmarks.ocr_benchmark --compare old.json new.json
+"""
+import os
+import sys
+import json
+import math
+import random
+import argparse
+import platform
+import subprocess
+import time
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+STYLES = ('digital', 'scanned', 'handwriting')
+MAX_PAGES = 500
+
+# Page geometry: A4 at 150 DPI
+PAGE_WIDTH = 1240
+PAGE_HEIGHT = 1754
+MARGIN = 90
+
+VOCABULARY = (
+    "lexical analysis token grammar parser compiler syntax semantic tree node "
+    "automaton regular expression finite state input output symbol table scope "
+    "register allocation optimization intermediate code generation loop "
+    "variable function argument return value type checking error recovery "
+    "derivation production terminal nonterminal stack queue graph algorithm "
+    "complexity memory pointer array string integer boolean condition branch "
+    "student answer question chapter course lecture assignment example theorem "
+    "proof definition property result method analysis system design model data"
+).split()
+
+# ----------------- Corpus Generation -----------------
+def make_ground_truth(rng, lines_per_page):
+    """Generate deterministic page text as a list of lines"""
+    lines = []
+    for _ in range(lines_per_page):
+        words = [rng.choice(VOCABULARY) for _ in range(rng.randint(5, 9))]
+        if rng.random() < 0.3:
+            words.append(str(rng.randint(1, 999)))
+        lines.append(" ".join(words))
+    return lines
+
+def load_font(path, size):
+    from PIL import ImageFont
+
+    if path:
+        return ImageFont.truetype(path, size)
+    for candidate in ('DejaVuSans.ttf', 'Arial.ttf', 'LiberationSans-Regular.ttf'):
+        try:
+            return ImageFont.truetype(candidate, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=size)
+
+def render_page(lines, style, rng, font, handwriting_font):
+    """Render one page image in the requested style"""
+    from PIL import Image, ImageDraw, ImageFilter
+
+    image = Image.new('L', (PAGE_WIDTH, PAGE_HEIGHT), 255)
+    draw = ImageDraw.Draw(image)
+    y = MARGIN
+
+    for line in lines:
+        if style == 'handwriting':
+            # Per-word baseline wobble, spacing jitter and ink variation
+            x = MARGIN + rng.randint(-6, 6)
+            for word in line.split():
+                dy = rng.randint(-4, 4)
+                ink = rng.randint(0, 70)
+                draw.text((x, y + dy), word, fill=ink, font=handwriting_font)
+                x += draw.textlength(word + " ", font=handwriting_font) + rng.randint(-3, 8)
+            y += 52 + rng.randint(-3, 3)
+        else:
+            draw.text((MARGIN, y), line, fill=0, font=font)
+            y += 44
+
+    if style == 'scanned':
+        image = image.rotate(rng.uniform(-1.5, 1.5), resample=Image.BICUBIC, fillcolor=255)
+        pixels = image.load()
+        for _ in range(PAGE_WIDTH * PAGE_HEIGHT // 400):
+            px = rng.randrange(PAGE_WIDTH)
+            py = rng.randrange(PAGE_HEIGHT)
+            pixels[px, py] = rng.randint(0, 120)
+        image = image.filter(ImageFilter.GaussianBlur(radius=0.8))
+    elif style == 'handwriting':
+        image = image.rotate(rng.uniform(-0.8, 0.8), resample=Image.BICUBIC, fillcolor=255)
+
+    return image.convert('RGB')
+
+def document_name(style, pages, seed, fmt):
+    return f"{style}_{pages}p_seed{seed}.{fmt}"
+
+def build_document(corpus_dir, style, pages, seed, fmt, font_path=None, handwriting_font_path=None):
+    """Build (or reuse) one synthetic document and its ground-truth text file"""
+    name = document_name(style, pages, seed, fmt)
+    doc_path = os.path.join(corpus_dir, name)
+    truth_path = doc_path + '.txt'
+
+    if os.path.exists(doc_path) and os.path.exists(truth_path):
+        with open(truth_path, 'r', encoding='utf-8') as f:
+            return doc_path, f.read()
+
+    # Seed depends on every parameter so that documents are stable across runs
+    rng = random.Random(f"{seed}:{style}:{pages}:{fmt}")
+    font = load_font(font_path, 28)
+    handwriting_font = load_font(handwriting_font_path or font_path, 32)
+
+    images = []
+    page_texts = []
+    for _ in range(pages):
+        lines = make_ground_truth(rng, 26 if style == 'handwriting' else 34)
+        images.append(render_page(lines, style, rng, font, handwriting_font))
+        page_texts.append("\n".join(lines))
+
+    os.makedirs(corpus_dir, exist_ok=True)
+    if fmt == 'pdf':
+        images[0].save(doc_path, 'PDF', resolution=150, save_all=True, append_images=images[1:])
+    elif fmt == 'jpg':
+        images[0].save(doc_path, 'JPEG', quality=80)
+    else:
+        images[0].save(doc_path, 'PNG')
+
+    ground_truth = "\n\n".join(page_texts)
+    with open(truth_path, 'w', encoding='utf-8') as f:
+        f.write(ground_truth)
+    return doc_path, ground_truth
+
+def build_corpus(corpus_dir, styles, sizes, seed, font_path=None, handwriting_font_path=None):
+    """Build the full corpus; single-page cases also get an image variant"""
+    cases = []
+    for style in styles:
+        for pages in sizes:
+            formats = ['pdf', 'png'] if pages == 1 else ['pdf']
+            for fmt in formats:
+                path, truth = build_document(corpus_dir, style, pages, seed, fmt,
+                                             font_path, handwriting_font_path)
+                cases.append({
+                    'case': f"{style}/{pages}p/{fmt}",
+                    'style': style,
+                    'pages': pages,
+                    'format': fmt,
+                    'path': path,
+                    'ground_truth': truth
+                })
+    return cases
+
+# ----------------- Measurement -----------------
+def percentile(values, pct):
+    """Linear-interpolated percentile of a non-empty list"""
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+def process_peak_rss_mb():
+    """Peak resident set size of this process so far, in MB (ru_maxrss never goes down)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    if sys.platform == 'darwin':
+        return round(peak / (1024 * 1024), 1)
+    return round(peak / 1024, 1)
+
+def normalize_text(text):
+    return " ".join(text.split())
+
+def character_accuracy(ground_truth, ocr_text):
+    """1 - normalized edit distance between ground truth and OCR output"""
+    from rapidfuzz.distance import Levenshtein
+
+    truth = normalize_text(ground_truth)
+    hypothesis = normalize_text(ocr_text)
+    if not truth:
+        return 1.0 if not hypothesis else 0.0
+    distance = Levenshtein.distance(truth, hypothesis)
+    return round(max(0.0, 1.0 - distance / len(truth)), 4)
+
+def run_case(extract, case, repeat, warmup):
+    """Run one corpus document through the OCR path"""
+    for _ in range(warmup):
+        extract(case['path'])
+
+    latencies = []
+    ocr_text = ""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ocr_text = extract(case['path'])
+        latencies.append(time.perf_counter() - start)
+
+    total = sum(latencies)
+    return {
+        'case': case['case'],
+        'style': case['style'],
+        'pages': case['pages'],
+        'format': case['format'],
+        'runs': repeat,
+        'pages_per_sec': round(case['pages'] * repeat / total, 3) if total else None,
+        'latency_p50_s': round(percentile(latencies, 50), 4),
+        'latency_p95_s': round(percentile(latencies, 95), 4),
+        'latency_mean_s': round(total / repeat, 4),
+        # Peak of the whole run up to and including this case, not of this case alone
+        'process_peak_rss_mb': process_peak_rss_mb(),
+        'char_accuracy': character_accuracy(case['ground_truth'], ocr_text)
+    }
+
+def git_revision():
+    """Current commit and dirty flag, if the benchmark runs inside a checkout"""
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain'], stderr=subprocess.DEVNULL, text=True).strip())
+        return commit, dirty
+    except Exception:
+        return None, None
+
+def collect_config(args):
+    """Everything that can change OCR performance, recorded with the results"""
+    commit, dirty = git_revision()
+    env_keys = sorted(k for k in os.environ if k.startswith('OCR_'))
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'git_commit': commit,
+        'git_dirty': dirty,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'label': args.label,
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'warmup': args.warmup,
+        'with_caches': args.with_caches,
+        'env': {k: os.environ[k] for k in env_keys}
+    }
+
+def run_benchmark(args):
+    styles = [s.strip() for s in args.styles.split(',') if s.strip()]
+    sizes = sorted({int(s) for s in args.sizes.split(',') if s.strip()})
+    for style in styles:
+        if style not in STYLES:
+            raise SystemExit(f"Unknown style '{style}', expected one of {', '.join(STYLES)}")
+    for size in sizes:
+        if size < 1 or size > MAX_PAGES:
+            raise SystemExit(f"Page count {size} out of range (1-{MAX_PAGES})")
+
+    cases = build_corpus(args.corpus_dir, styles, sizes, args.seed, args.font, args.handwriting_font)
+    print(f"Corpus ready: {len(cases)} documents in {args.corpus_dir}")
+    if args.generate_only:
+        return None
+
+    if not args.with_caches:
+        # After the warmup every timed run would be a page-cache hit, and compaction
+        # changes the text that accuracy is measured on; app reads both at import
+        os.environ['OCR_PAGE_CACHE_DB'] = ''
+        os.environ['OCR_COMPACTION'] = 'false'
+
+    # Imported late so that corpus generation works without the OCR stack
+    from app import extract_text_from_file
+
+    results = []
+    for case in cases:
+        result = run_case(extract_text_from_file, case, args.repeat, args.warmup)
+        results.append(result)
+        print(f"{result['case']:<28} {result['pages_per_sec']:>8} pages/s  "
+              f"p50 {result['latency_p50_s']:>8}s  p95 {result['latency_p95_s']:>8}s  "
+              f"process peak rss {result['process_peak_rss_mb']}MB  acc {result['char_accuracy']}")
+
+    total_pages = sum(r['pages'] * r['runs'] for r in results)
+    total_time = sum(r['latency_mean_s'] * r['runs'] for r in results)
+    report = {
+        'meta': collect_config(args),
+        'results': results,
+        'summary': {
+            'documents': len(results),
+            'pages_per_sec': round(total_pages / total_time, 3) if total_time else None,
+            'mean_char_accuracy': round(sum(r['char_accuracy'] for r in results) / len(results), 4) if results else None,
+            'process_peak_rss_mb': process_peak_rss_mb()
+        }
+    }
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    return report
+
+# ----------------- Comparison -----------------
+def compare_reports(baseline_path, candidate_path):
+    """Print per-case deltas between two result files"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(candidate_path, 'r', encoding='utf-8') as f:
+        candidate = json.load(f)
+
+    base_cases = {r['case']: r for r in baseline['results']}
+    print(f"baseline:  {baseline['meta'].get('git_commit')} {baseline['meta'].get('label') or ''}")
+    print(f"candidate: {candidate['meta'].get('git_commit')} {candidate['meta'].get('label') or ''}")
+    print(f"{'case':<28} {'pages/s':>18} {'p95 (s)':>20} {'accuracy':>18}")
+
+    def delta(old, new):
+        if old in (None, 0) or new is None:
+            return "n/a"
+        return f"{(new - old) / old * 100:+.1f}%"
+
+    for result in candidate['results']:
+        old = base_cases.get(result['case'])
+        if not old:
+            print(f"{result['case']:<28} (new case)")
+            continue
+        print(f"{result['case']:<28} "
+              f"{str(old['pages_per_sec']):>7}->{str(result['pages_per_sec']):<7}{delta(old['pages_per_sec'], result['pages_per_sec']):>4} "
+              f"{str(old['latency_p95_s']):>7}->{str(result['latency_p95_s']):<7}{delta(old['latency_p95_s'], result['latency_p95_s']):>6} "
+              f"{str(old['char_accuracy']):>6}->{str(result['char_accuracy']):<6}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the OCR path on a synthetic corpus")
+    parser.add_argument('--styles', default=','.join(STYLES), help="Comma-separated styles: digital,scanned,handwriting")
+    parser.add_argument('--sizes', default='1,10,50', help=f"Comma-separated page counts (1-{MAX_PAGES})")
+    parser.add_argument('--seed', type=int, default=1234, help="Corpus seed")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per document")
+    parser.add_argument('--warmup', type=int, default=1, help="Untimed runs per document")
+    parser.add_argument('--corpus-dir', default=os.path.join(os.path.dirname(__file__), '.corpus'))
+    parser.add_argument('--font', default=None, help="TrueType font for printed text")
+    parser.add_argument('--handwriting-font', default=None, help="TrueType handwriting-style font")
+    parser.add_argument('--label', default=None, help="Free-form label stored with the results")
+    parser.add_argument('--output', default='ocr_benchmark.json')
+    parser.add_argument('--with-caches', action='store_true', help="Keep the OCR page cache and compaction enabled")
+    parser.add_argument('--generate-only', action='store_true', help="Only build the corpus")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CANDIDATE'), help="Compare two result files")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compare:
+        compare_reports(*args.compare)
+    else:
+        run_benchmark(args)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
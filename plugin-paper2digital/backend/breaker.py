@@ -0,0 +1,138 @@
+"""
+Circuit breakers for upstream dependencies (Snowflake, Drive, Gemini).
+
+A breaker keeps the outcome of the last `window` calls. A call fails if it
+raises or if failed(result) says so (e.g. an HTTP 5xx), and it is slow if it
+takes longer than slow_seconds. Once min_calls are recorded and either the
+failure rate or the slow rate reaches its threshold, the breaker opens. For
+open_seconds every call is refused at once with CircuitOpen, so callers fall
+back to their degraded behaviour instead of waiting on the upstream.
+
+After that the breaker is half-open and lets `probes` calls through at a
+time. A probe that succeeds in time closes it and clears the window; one
+that fails or is slow opens it again.
+"""
+import math
+import time
+import logging
+import threading
+from collections import deque
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class CircuitOpen(Exception):
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} circuit is open, retry after {retry_after}s")
+        self.name = name
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    def __init__(self, name, failure_rate=0.5, slow_seconds=None, slow_rate=0.5,
+                 window=20, min_calls=10, open_seconds=30.0, probes=1):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_seconds = slow_seconds
+        self.slow_rate = slow_rate
+        self.min_calls = max(1, min_calls)
+        self.open_seconds = open_seconds
+        self.probes = max(1, probes)
+        self._outcomes = deque(maxlen=max(window, self.min_calls))  # (failed, slow) per call
+        self._state = CLOSED
+        self._opened_until = 0.0
+        self._probing = 0
+        self._lock = threading.Lock()
+        metrics.CIRCUIT_STATE.set_function(lambda: STATE_VALUES[self._state], dependency=name)
+
+    def _transition(self, state):
+        if state != self._state:
+            logger.warning(f"Circuit {self.name}: {self._state} -> {state}")
+            metrics.CIRCUIT_TRANSITIONS.inc(dependency=self.name, state=state)
+        self._state = state
+
+    def _open(self, now):
+        self._opened_until = now + self.open_seconds
+        self._outcomes.clear()
+        self._transition(OPEN)
+
+    def _before(self):
+        """Admit a call; returns True if it is a half-open probe, raises CircuitOpen if refused"""
+        now = time.monotonic()
+        with self._lock:
+            if self._state == OPEN:
+                if now < self._opened_until:
+                    metrics.CIRCUIT_CALLS.inc(dependency=self.name, result='rejected')
+                    raise CircuitOpen(self.name, max(1, math.ceil(self._opened_until - now)))
+                self._probing = 0
+                self._transition(HALF_OPEN)
+            if self._state == HALF_OPEN:
+                if self._probing >= self.probes:
+                    metrics.CIRCUIT_CALLS.inc(dependency=self.name, result='rejected')
+                    raise CircuitOpen(self.name, 1)
+                self._probing += 1
+                return True
+            return False
+
+    def _after(self, probe, failed, slow):
+        metrics.CIRCUIT_CALLS.inc(dependency=self.name, result='failed' if failed else 'slow' if slow else 'ok')
+        now = time.monotonic()
+        with self._lock:
+            if probe:
+                self._probing -= 1
+                if failed or slow:
+                    self._open(now)
+                else:
+                    self._transition(CLOSED)
+                return
+            if self._state != CLOSED:
+                return  # started before the breaker opened
+            self._outcomes.append((failed, slow))
+            calls = len(self._outcomes)
+            if calls < self.min_calls:
+                return
+            failures = sum(1 for f, _ in self._outcomes if f)
+            slows = sum(1 for _, s in self._outcomes if s)
+            if failures / calls >= self.failure_rate or slows / calls >= self.slow_rate:
+                self._open(now)
+
+    def call(self, func, failed=None):
+        """func() through the breaker; failed(result) marks a returned result as a failure"""
+        probe = self._before()
+        start = time.monotonic()
+        try:
+            result = func()
+        except Exception:
+            self._after(probe, True, False)
+            raise
+        elapsed = time.monotonic() - start
+        slow = self.slow_seconds is not None and elapsed > self.slow_seconds
+        self._after(probe, bool(failed and failed(result)), slow)
+        return result
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and time.monotonic() >= self._opened_until:
+                return HALF_OPEN
+            return self._state
+
+    def snapshot(self):
+        """State for /health"""
+        state = self.state
+        with self._lock:
+            calls = len(self._outcomes)
+            snapshot = {
+                'state': state,
+                'recent_calls': calls,
+                'failure_rate': round(sum(1 for f, _ in self._outcomes if f) / calls, 3) if calls else 0.0,
+                'slow_rate': round(sum(1 for _, s in self._outcomes if s) / calls, 3) if calls else 0.0,
+            }
+            if state == OPEN:
+                snapshot['retry_after'] = max(1, math.ceil(self._opened_until - time.monotonic()))
+        return snapshot
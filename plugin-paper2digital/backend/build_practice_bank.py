@@ -0,0 +1,38 @@
+"""
+Build or refresh the practice question banks offline, e.g. nightly from cron.
+
+Banks already at PRACTICE_BANK_SIZE for unchanged material are left alone;
+banks built from older OCR text are regenerated.
+
+    python build_practice_bank.py                        # every course, PRACTICE_LANGUAGES
+    python build_practice_bank.py --course compiler --language hi
+    python build_practice_bank.py --force                # regenerate everything
+"""
+import sys
+import argparse
+
+import app
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build practice question banks")
+    parser.add_argument('--course', action='append', help="Course id (repeatable); default is every course")
+    parser.add_argument('--language', action='append', help="Language code (repeatable); default is PRACTICE_LANGUAGES")
+    parser.add_argument('--force', action='store_true', help="Regenerate banks even if the material is unchanged")
+    args = parser.parse_args(argv)
+
+    courses = args.course or app.get_all_courses()
+    languages = args.language or app.PRACTICE_LANGUAGES
+    failed = 0
+    for course in courses:
+        for chapter in app.get_chapters_for_course(course):
+            for language in languages:
+                try:
+                    added = app.refill_practice_bank(course, chapter, language, force=args.force)
+                    print(f"{course}/{chapter}/{language}: {added} questions added")
+                except Exception as e:
+                    failed += 1
+                    print(f"{course}/{chapter}/{language}: failed ({e})", file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+"""
+Load driver that replays realistic conversation flows against the backend.
+
+Flows:
+    qa       course keyword -> course -> chapter -> several questions (/chat)
+    scoring  scoring keyword -> assignment upload -> answer upload (/chat)
+    submit   list assignments -> submit a solution file (/submit_solution)
+
+Each virtual user picks flows by weight until the duration elapses. The
+report gives throughput and latency percentiles per endpoint and per flow
+step, and can be written to JSON.
+
+Run from the backend folder (against loadtest.serve or a real deployment):
+    python -m loadtest.driver --base-url http://127.0.0.1:5050 --users 20 --duration 120 --mix qa=6,scoring=2,submit=2
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+
+import requests
+
+from benchmarks.ocr_benchmark import build_document, percentile
+
+QUESTIONS = [
+    "What is a token?",
+    "Explain the difference between a lexer and a parser.",
+    "Give an example of a regular expression for identifiers.",
+    "Summarize this chapter.",
+    "Generate practice questions",
+]
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = []
+
+    def record(self, endpoint, step, latency, ok, status):
+        with self.lock:
+            self.samples.append((endpoint, step, latency, ok, status))
+
+class VirtualUser:
+    def __init__(self, base_url, recorder, rng, fixtures, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.rng = rng
+        self.fixtures = fixtures
+        self.timeout = timeout
+        self.http = requests.Session()
+        self.session_id = f"load_{uuid.uuid4().hex[:12]}"
+
+    def request(self, method, endpoint, step, **kwargs):
+        start = time.perf_counter()
+        status = None
+        try:
+            response = self.http.request(method, self.base_url + endpoint, timeout=self.timeout, **kwargs)
+            status = response.status_code
+            ok = response.ok
+            body = response.json() if ok else None
+        except (requests.RequestException, ValueError):
+            ok = False
+            body = None
+        self.recorder.record(endpoint, step, time.perf_counter() - start, ok, status)
+        return body
+
+    def chat(self, step, message):
+        return self.request('POST', '/chat', step, json={
+            'session_id': self.session_id, 'message': message, 'language': 'en'
+        })
+
+    def upload(self, step, path):
+        with open(path, 'rb') as f:
+            return self.request('POST', '/chat', step,
+                                data={'session_id': self.session_id, 'language': 'en'},
+                                files={'file': (os.path.basename(path), f, 'application/pdf')})
+
+    def reset(self):
+        self.request('POST', '/reset_session', 'reset', json={'session_id': self.session_id})
+
+    def qa_flow(self):
+        body = self.chat('course_keyword', 'I want to study a course')
+        courses = [line[2:] for line in (body or {}).get('answer', '').splitlines() if line.startswith('• ')]
+        if not courses:
+            return
+        body = self.chat('course', self.rng.choice(courses))
+        chapters = [line[2:] for line in (body or {}).get('answer', '').splitlines() if line.startswith('• ')]
+        self.chat('chapter', self.rng.choice(chapters + ['all']) if chapters else 'all')
+        for question in self.rng.sample(QUESTIONS, k=3):
+            self.chat('question', question)
+        self.reset()
+
+    def scoring_flow(self):
+        self.chat('scoring_keyword', 'Please score my assignment')
+        self.upload('assignment_upload', self.fixtures['assignment'])
+        self.upload('answer_upload', self.fixtures['answer'])
+        self.reset()
+
+    def submit_flow(self):
+        body = self.request('GET', '/assignments', 'list')
+        assignments = (body or {}).get('assignments', [])
+        if not assignments:
+            return
+        assignment = self.rng.choice(assignments)
+        with open(self.fixtures['answer'], 'rb') as f:
+            self.request('POST', '/submit_solution', 'submit',
+                         data={'assignment_id': assignment['id']},
+                         files={'solution_file': ('solution.pdf', f, 'application/pdf')})
+
+def summarize(samples, elapsed):
+    """Throughput and latency percentiles per endpoint and per flow step"""
+    def stats(rows):
+        latencies = [r[2] for r in rows]
+        errors = sum(1 for r in rows if not r[3])
+        return {
+            'requests': len(rows),
+            'errors': errors,
+            'error_rate': round(errors / len(rows), 4),
+            'throughput_rps': round(len(rows) / elapsed, 3) if elapsed else None,
+            'p50_s': round(percentile(latencies, 50), 4),
+            'p90_s': round(percentile(latencies, 90), 4),
+            'p95_s': round(percentile(latencies, 95), 4),
+            'p99_s': round(percentile(latencies, 99), 4),
+            'max_s': round(max(latencies), 4)
+        }
+
+    by_endpoint = {}
+    by_step = {}
+    for row in samples:
+        by_endpoint.setdefault(row[0], []).append(row)
+        by_step.setdefault(f"{row[0]} [{row[1]}]", []).append(row)
+
+    return {
+        'total': stats(samples) if samples else None,
+        'endpoints': {k: stats(v) for k, v in sorted(by_endpoint.items())},
+        'steps': {k: stats(v) for k, v in sorted(by_step.items())}
+    }
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        weights[name.strip()] = float(weight or 1)
+    unknown = set(weights) - {'qa', 'scoring', 'submit'}
+    if unknown:
+        raise SystemExit(f"Unknown flows in --mix: {', '.join(sorted(unknown))}")
+    return weights
+
+def run_load(args):
+    weights = parse_mix(args.mix)
+    fixture_dir = args.fixture_dir or tempfile.mkdtemp(prefix='p2d-load-fixtures-')
+    fixtures = {
+        'assignment': build_document(fixture_dir, 'digital', 1, args.seed, 'pdf')[0],
+        'answer': build_document(fixture_dir, 'handwriting', 2, args.seed, 'pdf')[0],
+    }
+
+    recorder = Recorder()
+    deadline = time.monotonic() + args.duration
+    flows = list(weights)
+
+    def worker(index):
+        rng = random.Random(args.seed + index)
+        user = VirtualUser(args.base_url, recorder, rng, fixtures, args.timeout)
+        # Stagger start-up so users do not arrive in lockstep
+        time.sleep(rng.uniform(0, args.ramp_up))
+        while time.monotonic() < deadline:
+            flow = rng.choices(flows, weights=[weights[f] for f in flows])[0]
+            getattr(user, f"{flow}_flow")()
+            if args.think_time:
+                time.sleep(rng.expovariate(1.0 / args.think_time))
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(args.users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'base_url': args.base_url,
+            'users': args.users,
+            'duration_s': args.duration,
+            'elapsed_s': round(elapsed, 2),
+            'mix': weights,
+            'label': args.label
+        },
+        'summary': summarize(recorder.samples, elapsed)
+    }
+    return report
+
+def print_report(report):
+    print(f"{'endpoint / step':<44} {'req':>6} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for section in ('endpoints', 'steps'):
+        for name, s in report['summary'][section].items():
+            print(f"{name:<44} {s['requests']:>6} {s['errors']:>5} {s['throughput_rps']:>8} "
+                  f"{s['p50_s']:>8} {s['p95_s']:>8} {s['p99_s']:>8}")
+        print()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay conversation flows against the backend")
+    parser.add_argument('--base-url', default='http://127.0.0.1:5050')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=60, help="Seconds to generate load")
+    parser.add_argument('--ramp-up', type=float, default=5, help="Seconds over which users start")
+    parser.add_argument('--think-time', type=float, default=1.0, help="Mean pause between flows (s)")
+    parser.add_argument('--mix', default='qa=6,scoring=2,submit=2', help="Flow weights")
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--fixture-dir', default=None)
+    parser.add_argument('--label', default=None)
+    parser.add_argument('--output', default=None, help="Write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    report = run_load(args)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Filesystem-backed stand-in for the PyDrive2 GoogleDrive object.
+
+Implements the calls app.py makes: CreateFile, GetContentFile,
+SetContentFile (or assigning .content), Upload, InsertPermission and item
+access for 'id' and 'alternateLink'. Files live in <root>/<file id>; unknown ids fall back to a
+default document so that any seeded Drive link can be downloaded.
+"""
+import os
+import time
+import uuid
+import shutil
+import threading
+
+class FakeDriveFile:
+    def __init__(self, drive, metadata):
+        self.drive = drive
+        self.metadata = dict(metadata or {})
+        self.content_path = None
+        self.content = None
+
+    def __getitem__(self, key):
+        if key == 'alternateLink':
+            return f"https://drive.google.com/file/d/{self.metadata['id']}/view?usp=sharing"
+        return self.metadata[key]
+
+    def GetContentFile(self, filename):
+        self.drive._sleep(self.drive.download_latency_ms)
+        source = self.drive.path_for(self.metadata['id'])
+        if not os.path.exists(source):
+            if not self.drive.default_file:
+                raise FileNotFoundError(f"Fake Drive file not found: {self.metadata['id']}")
+            source = self.drive.default_file
+        shutil.copyfile(source, filename)
+        with self.drive.lock:
+            self.drive.downloads += 1
+
+    def SetContentFile(self, filename):
+        self.content_path = filename
+
+    def Upload(self):
+        self.drive._sleep(self.drive.upload_latency_ms)
+        if 'id' not in self.metadata:
+            self.metadata['id'] = f"fake-{uuid.uuid4().hex}"
+        if self.content is not None:
+            with open(self.drive.path_for(self.metadata['id']), 'wb') as f:
+                f.write(self.content.getvalue())
+        elif self.content_path:
+            shutil.copyfile(self.content_path, self.drive.path_for(self.metadata['id']))
+        with self.drive.lock:
+            self.drive.uploads += 1
+
+    def InsertPermission(self, permission):
+        self.drive._sleep(self.drive.permission_latency_ms)
+        return permission
+
+class FakeDrive:
+    def __init__(self, root, default_file=None, download_latency_ms=0, upload_latency_ms=0, permission_latency_ms=0):
+        self.root = root
+        self.default_file = default_file
+        self.download_latency_ms = download_latency_ms
+        self.upload_latency_ms = upload_latency_ms
+        self.permission_latency_ms = permission_latency_ms
+        self.lock = threading.Lock()
+        self.downloads = 0
+        self.uploads = 0
+        os.makedirs(root, exist_ok=True)
+
+    def _sleep(self, latency_ms):
+        if latency_ms:
+            time.sleep(latency_ms / 1000.0)
+
+    def path_for(self, file_id):
+        return os.path.join(self.root, file_id.replace('/', '_'))
+
+    def add_file(self, file_id, source_path):
+        """Seed a file under a fixed id"""
+        shutil.copyfile(source_path, self.path_for(file_id))
+        return f"https://drive.google.com/file/d/{file_id}/view?usp=sharing"
+
+    def CreateFile(self, metadata=None):
+        return FakeDriveFile(self, metadata)
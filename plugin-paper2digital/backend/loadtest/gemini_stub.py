@@ -0,0 +1,140 @@
+"""
+Local HTTP stand-in for the Gemini generateContent API.
+
+Accepts the same request body as
+POST /v1beta/models/<model>:generateContent?key=...
+and answers with a canned response after a configurable latency. A share of
+requests can be failed with a configurable status code to exercise error
+paths. Scoring prompts get a "SCORE: n/100" answer so that score parsing
+works end to end.
+
+Run standalone:
+    python -m loadtest.gemini_stub --port 8089 --latency-ms 800 --jitter-ms 300 --error-rate 0.02
+"""
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+class StubConfig:
+    def __init__(self, latency_ms=500, jitter_ms=0, error_rate=0.0, error_status=503, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def next_delay_and_error(self):
+        with self.lock:
+            self.requests += 1
+            delay = max(0.0, self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0
+            failed = self.rng.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            return delay, failed
+
+def build_answer(prompt, rng):
+    """Canned answer shaped like what the calling prompt asks for"""
+    if "SCORE:" in prompt:
+        return f"SCORE: {rng.randint(40, 100)}/100\nFEEDBACK: Stub feedback for load testing."
+    if "practice questions" in prompt.lower() or "Q1:" in prompt:
+        return "\n\n".join(f"Q{i}: Stub question {i}?\nA{i}: Stub answer {i}." for i in range(1, 6))
+    return "This is a stub answer generated for load testing. " * 8
+
+def make_handler(config):
+    class GeminiStubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+        def _send_json(self, status, body):
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            if ':generateContent' not in self.path:
+                self._send_json(404, {"error": {"code": 404, "message": "Not found"}})
+                return
+
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                body = json.loads(self.rfile.read(length) or b'{}')
+                prompt = body["contents"][0]["parts"][0]["text"]
+            except (ValueError, KeyError, IndexError):
+                self._send_json(400, {"error": {"code": 400, "message": "Invalid request body"}})
+                return
+
+            delay, failed = config.next_delay_and_error()
+            time.sleep(delay)
+
+            if failed:
+                self._send_json(config.error_status, {
+                    "error": {"code": config.error_status, "message": "Injected stub error", "status": "UNAVAILABLE"}
+                })
+                return
+
+            with config.lock:
+                text = build_answer(prompt, config.rng)
+            self._send_json(200, {
+                "candidates": [{
+                    "content": {"parts": [{"text": text}], "role": "model"},
+                    "finishReason": "STOP"
+                }],
+                "usageMetadata": {
+                    "promptTokenCount": len(prompt) // 4,
+                    "candidatesTokenCount": len(text) // 4,
+                    "totalTokenCount": (len(prompt) + len(text)) // 4
+                }
+            })
+
+    return GeminiStubHandler
+
+def start_gemini_stub(host='127.0.0.1', port=0, **config_kwargs):
+    """Start the stub in a daemon thread; returns (server, base generateContent URL)"""
+    config = StubConfig(**config_kwargs)
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    server.config = config
+    thread = threading.Thread(target=server.serve_forever, name='gemini-stub', daemon=True)
+    thread.start()
+    url = f"http://{host}:{server.server_address[1]}/v1beta/models/gemini-stub:generateContent"
+    logger.info(f"Gemini stub listening on {url}")
+    return server, url
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local Gemini generateContent stub")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency-ms', type=float, default=500)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    config = StubConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.error_status, args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(config))
+    print(f"Gemini stub: GEMINI_API_URL=http://{args.host}:{args.port}/v1beta/models/gemini-stub:generateContent")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
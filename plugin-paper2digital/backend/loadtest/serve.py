@@ -0,0 +1,105 @@
+"""
+Run app.py against local stand-ins for Gemini, Google Drive and Snowflake.
+
+Starts the Gemini stub, seeds a SQLite catalog and a filesystem Drive with
+synthetic course and assignment PDFs (built with the OCR benchmark corpus
+generator), swaps them into the app module and serves it. OCR still runs
+for real, so the numbers reflect the backend's own CPU cost.
+
+Run from the backend folder:
+    python -m loadtest.serve --port 5050 --gemini-latency-ms 800 --snowflake-latency-ms 40
+"""
+import os
+import sys
+import logging
+import argparse
+import tempfile
+
+from benchmarks.ocr_benchmark import build_document
+from loadtest.fake_drive import FakeDrive
+from loadtest.gemini_stub import start_gemini_stub
+from loadtest import sqlite_snowflake
+
+logger = logging.getLogger(__name__)
+
+COURSES = {
+    'compiler': ['lec01-Lexical Analysis', 'lec02-Parsing', 'lec03-Semantic Analysis'],
+    'databases': ['lec01-Relational Model', 'lec02-SQL'],
+}
+ASSIGNMENTS = [
+    ('compiler', 'Assignment 1'),
+    ('compiler', 'Assignment 2'),
+    ('databases', 'Assignment 1'),
+]
+
+def build_fixtures(work_dir, course_pages=3, seed=7):
+    """Create the fake Drive and SQLite catalog; returns (drive, conn)"""
+    corpus_dir = os.path.join(work_dir, 'corpus')
+    course_pdf, _ = build_document(corpus_dir, 'digital', course_pages, seed, 'pdf')
+    assignment_pdf, _ = build_document(corpus_dir, 'scanned', 1, seed, 'pdf')
+
+    drive = FakeDrive(os.path.join(work_dir, 'drive'), default_file=course_pdf)
+    catalog = {}
+    for course, chapters in COURSES.items():
+        catalog[course] = {}
+        for index, chapter in enumerate(chapters):
+            catalog[course][chapter] = drive.add_file(f"course-{course}-{index}", course_pdf)
+
+    assignments = []
+    for index, (course, name) in enumerate(ASSIGNMENTS):
+        assignments.append((course, name, drive.add_file(f"assignment-{index}", assignment_pdf)))
+
+    conn = sqlite_snowflake.connect(os.path.join(work_dir, 'snowflake.db'))
+    sqlite_snowflake.seed_catalog(conn, catalog, assignments)
+    return drive, conn
+
+def install_fakes(app_module, drive, conn, gemini_url, gemini_key='stub-key'):
+    """Point the app module's globals at the local stand-ins"""
+    app_module.drive = drive
+    app_module.conn = conn
+    app_module.cur = app_module.BreakerCursor(conn, app_module.breakers['snowflake'])
+    app_module.GEMINI_API_URL = gemini_url
+    app_module.GEMINI_API_KEY = gemini_key
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve app.py with local Gemini/Drive/Snowflake stand-ins")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--work-dir', default=None, help="Fixture directory (default: a temp dir)")
+    parser.add_argument('--course-pages', type=int, default=3)
+    parser.add_argument('--gemini-latency-ms', type=float, default=800)
+    parser.add_argument('--gemini-jitter-ms', type=float, default=200)
+    parser.add_argument('--gemini-error-rate', type=float, default=0.0)
+    parser.add_argument('--gemini-error-status', type=int, default=503)
+    parser.add_argument('--drive-latency-ms', type=float, default=150)
+    parser.add_argument('--snowflake-latency-ms', type=float, default=40)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='p2d-loadtest-')
+    os.makedirs(work_dir, exist_ok=True)
+
+    _, gemini_url = start_gemini_stub(
+        latency_ms=args.gemini_latency_ms,
+        jitter_ms=args.gemini_jitter_ms,
+        error_rate=args.gemini_error_rate,
+        error_status=args.gemini_error_status
+    )
+    drive, conn = build_fixtures(work_dir, args.course_pages)
+    drive.download_latency_ms = args.drive_latency_ms
+    drive.upload_latency_ms = args.drive_latency_ms
+    conn.latency_ms = args.snowflake_latency_ms
+
+    # Jobs queued against the fakes stay out of the real write-behind journal, and real ones out of the fakes
+    os.environ['WRITE_BEHIND_DB'] = os.path.join(work_dir, 'write_behind.sqlite3')
+
+    # Imported after the stub is up; real Snowflake/Drive init fails harmlessly without credentials
+    import app as app_module
+    install_fakes(app_module, drive, conn, gemini_url)
+
+    logger.info(f"Fixtures in {work_dir}; serving on http://{args.host}:{args.port}")
+    app_module.app.run(host=args.host, port=args.port, debug=False, threaded=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+"""
+SQLite-backed adapter for the Snowflake queries app.py runs.
+
+Exposes the small part of the snowflake.connector connection/cursor API the
+backend uses (cursor, execute, executemany, fetchone, fetchall, commit) and
+rewrites Snowflake-only statements (MERGE, CURRENT_TIMESTAMP()) into SQLite
+equivalents. A configurable per-query latency emulates warehouse round trips.
+
+As with the Snowflake connector, a connection may be shared between threads
+but a cursor may not: a cursor used from a second thread raises, so a load
+test surfaces code that could read another thread's result rows.
+"""
+import re
+import time
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS courses (
+    course_id TEXT PRIMARY KEY,
+    course_name TEXT
+);
+CREATE TABLE IF NOT EXISTS course_pdfs (
+    course_id TEXT NOT NULL,
+    chapter_name TEXT NOT NULL,
+    pdf_uri TEXT NOT NULL,
+    PRIMARY KEY (course_id, chapter_name, pdf_uri)
+);
+CREATE TABLE IF NOT EXISTS pdf_ocr_cache (
+    course_id TEXT NOT NULL,
+    chapter_name TEXT NOT NULL,
+    pdf_uri TEXT,
+    ocr_text TEXT,
+    ocr_data BLOB,
+    ocr_format TEXT,
+    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (course_id, chapter_name, pdf_uri)
+);
+CREATE TABLE IF NOT EXISTS assignments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    course_name TEXT,
+    assignment_name TEXT,
+    assignment_pdf TEXT,
+    solution_pdf TEXT,
+    score INTEGER
+);
+CREATE TABLE IF NOT EXISTS assignment_submissions (
+    assignment_id TEXT NOT NULL,
+    student_id TEXT NOT NULL,
+    solution_pdf TEXT,
+    score INTEGER,
+    feedback TEXT,
+    submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (assignment_id, student_id)
+);
+CREATE TABLE IF NOT EXISTS scoring_cache (
+    assignment_id TEXT NOT NULL,
+    solution_hash TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    score INTEGER,
+    feedback TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (assignment_id, solution_hash, prompt_version)
+);
+CREATE TABLE IF NOT EXISTS course_summaries (
+    course_id TEXT NOT NULL,
+    chapter_name TEXT NOT NULL,
+    level TEXT NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    summary TEXT,
+    source_hash TEXT,
+    summary_version TEXT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (course_id, chapter_name, level, chunk_index)
+);
+CREATE TABLE IF NOT EXISTS practice_questions (
+    course_id TEXT NOT NULL,
+    chapter_name TEXT NOT NULL,
+    language TEXT NOT NULL,
+    question_id TEXT NOT NULL,
+    question TEXT,
+    answer TEXT,
+    source_hash TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (course_id, chapter_name, language, question_id)
+);
+"""
+
+def _merge_pdf_ocr_cache(sql, params):
+    rows = len(params) // 5
+    return (
+        "INSERT INTO pdf_ocr_cache (course_id, chapter_name, pdf_uri, ocr_data, ocr_format) VALUES "
+        + ", ".join(["(?, ?, ?, ?, ?)"] * rows)
+        + " ON CONFLICT (course_id, chapter_name, pdf_uri) DO UPDATE SET "
+        "ocr_data = excluded.ocr_data, ocr_format = excluded.ocr_format, ocr_text = NULL, "
+        "last_updated = CURRENT_TIMESTAMP",
+        params
+    )
+
+def _merge_assignments(sql, params):
+    rows = len(params) // 3
+    return (
+        "UPDATE assignments SET solution_pdf = source.column2, score = source.column3 FROM (VALUES "
+        + ", ".join(["(?, ?, ?)"] * rows)
+        + ") AS source WHERE assignments.id = source.column1",
+        params
+    )
+
+def _merge_assignment_submissions(sql, params):
+    rows = len(params) // 5
+    return (
+        "INSERT INTO assignment_submissions (assignment_id, student_id, solution_pdf, score, feedback) VALUES "
+        + ", ".join(["(?, ?, ?, ?, ?)"] * rows)
+        + " ON CONFLICT (assignment_id, student_id) DO UPDATE SET "
+        "solution_pdf = excluded.solution_pdf, score = excluded.score, "
+        "feedback = excluded.feedback, submitted_at = CURRENT_TIMESTAMP",
+        params
+    )
+
+def _merge_scoring_cache(sql, params):
+    rows = len(params) // 5
+    return (
+        "INSERT INTO scoring_cache (assignment_id, solution_hash, prompt_version, score, feedback) VALUES "
+        + ", ".join(["(?, ?, ?, ?, ?)"] * rows)
+        + " ON CONFLICT (assignment_id, solution_hash, prompt_version) DO NOTHING",
+        params
+    )
+
+# Statements that need more than placeholder rewriting, matched on their prefix
+STATEMENT_REWRITES = [
+    (re.compile(r'^\s*MERGE\s+INTO\s+pdf_ocr_cache\b', re.IGNORECASE), _merge_pdf_ocr_cache),
+    (re.compile(r'^\s*MERGE\s+INTO\s+assignments\b', re.IGNORECASE), _merge_assignments),
+    (re.compile(r'^\s*MERGE\s+INTO\s+assignment_submissions\b', re.IGNORECASE), _merge_assignment_submissions),
+    (re.compile(r'^\s*MERGE\s+INTO\s+scoring_cache\b', re.IGNORECASE), _merge_scoring_cache),
+]
+
+def translate(sql, params=None):
+    """Rewrite one Snowflake statement (and its parameters) for SQLite"""
+    params = tuple(params or ())
+    for pattern, rewrite in STATEMENT_REWRITES:
+        if pattern.match(sql):
+            return rewrite(sql, params)
+    sql = sql.replace('%s', '?')
+    sql = re.sub(r'CURRENT_TIMESTAMP\(\)', 'CURRENT_TIMESTAMP', sql, flags=re.IGNORECASE)
+    return sql, params
+
+class SQLiteCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection._db.cursor()
+        self._owner = None
+
+    def _check_thread(self):
+        owner = threading.get_ident()
+        if self._owner is None:
+            self._owner = owner
+        elif self._owner != owner:
+            raise RuntimeError("Cursor shared between threads: its execute and fetch calls can interleave")
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def execute(self, sql, params=None):
+        self._check_thread()
+        translated, values = translate(sql, params)
+        self.connection._sleep()
+        with self.connection._lock:
+            self._cursor.execute(translated, values)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._check_thread()
+        rows = [translate(sql, params) for params in seq_of_params]
+        if not rows:
+            return self
+        self.connection._sleep()
+        with self.connection._lock:
+            for translated, values in rows:
+                self._cursor.execute(translated, values)
+        return self
+
+    def fetchone(self):
+        self._check_thread()
+        with self.connection._lock:
+            return self._cursor.fetchone()
+
+    def fetchall(self):
+        self._check_thread()
+        with self.connection._lock:
+            return self._cursor.fetchall()
+
+    def close(self):
+        self._cursor.close()
+
+class SQLiteSnowflakeConnection:
+    def __init__(self, path=':memory:', latency_ms=0):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        self._lock = threading.RLock()
+        self.latency_ms = latency_ms
+
+    def _sleep(self):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+
+    def cursor(self):
+        return SQLiteCursor(self)
+
+    def commit(self):
+        with self._lock:
+            self._db.commit()
+
+    def rollback(self):
+        with self._lock:
+            self._db.rollback()
+
+    def close(self):
+        self._db.close()
+
+def connect(path=':memory:', latency_ms=0):
+    return SQLiteSnowflakeConnection(path, latency_ms)
+
+def seed_catalog(conn, courses, assignments=()):
+    """Insert courses {course_id: {chapter: pdf_uri}} and (course, name, pdf_uri) assignments"""
+    cur = conn.cursor()
+    for course_id, chapters in courses.items():
+        cur.execute("INSERT OR IGNORE INTO courses (course_id, course_name) VALUES (%s, %s)", (course_id, course_id))
+        for chapter, pdf_uri in chapters.items():
+            cur.execute(
+                "INSERT OR IGNORE INTO course_pdfs (course_id, chapter_name, pdf_uri) VALUES (%s, %s, %s)",
+                (course_id, chapter, pdf_uri)
+            )
+    for course_name, assignment_name, assignment_pdf in assignments:
+        cur.execute(
+            "INSERT INTO assignments (course_name, assignment_name, assignment_pdf) VALUES (%s, %s, %s)",
+            (course_name, assignment_name, assignment_pdf)
+        )
+    conn.commit()
@@ -0,0 +1,290 @@
+"""
+Lightweight Prometheus-style metrics for the Paper2Digital backend.
+
+Counters, gauges and histograms with labels, kept in process memory and
+rendered in the Prometheus text exposition format (version 0.0.4) by the
+/metrics endpoint. Updates take one dict lookup and one lock, so they are
+cheap enough to call on every Snowflake query, OCR page and Gemini call.
+"""
+import time
+import bisect
+import threading
+import functools
+
+# Latency buckets in seconds, from fast warehouse lookups to full-document OCR
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics)
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self._callbacks = {}
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, callback, **labels):
+        """Compute the value at scrape time, e.g. the current session count"""
+        self._callbacks[self._key(labels)] = callback
+
+    def value(self, **labels):
+        key = self._key(labels)
+        if key in self._callbacks:
+            return self._callbacks[key]()
+        return self._values.get(key, 0)
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            values = dict(self._values)
+        for key, callback in list(self._callbacks.items()):
+            try:
+                values[key] = callback()
+            except Exception:
+                continue
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts..., +Inf count], sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return sum(state[0]) if state else 0
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+class _Timer:
+    """Context manager / decorator that observes elapsed seconds"""
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed = time.perf_counter() - self.start
+        self.histogram.observe(self.elapsed, **self.labels)
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Timer(self.histogram, self.labels):
+                return func(*args, **kwargs)
+        return wrapper
+
+def render():
+    return REGISTRY.render()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# ----------------- Backend Metrics -----------------
+HTTP_REQUEST_SECONDS = Histogram(
+    'p2d_http_request_duration_seconds', 'Route handler latency', ['endpoint', 'method', 'status'])
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    'p2d_http_requests_in_progress', 'Requests currently being handled', ['endpoint'])
+
+SNOWFLAKE_QUERY_SECONDS = Histogram(
+    'p2d_snowflake_query_duration_seconds', 'Snowflake query latency per helper', ['helper'])
+SNOWFLAKE_ERRORS = Counter(
+    'p2d_snowflake_errors', 'Snowflake helper failures', ['helper'])
+
+DRIVE_SECONDS = Histogram(
+    'p2d_drive_duration_seconds', 'Google Drive transfer latency', ['operation'])
+DRIVE_BYTES = Counter(
+    'p2d_drive_bytes', 'Bytes transferred to or from Google Drive', ['operation'])
+
+OCR_SECONDS = Histogram(
+    'p2d_ocr_duration_seconds', 'OCR latency per document', ['source'])
+OCR_PAGES = Counter(
+    'p2d_ocr_pages', 'Pages run through OCR', ['source'])
+OCR_CACHE_BYTES = Counter(
+    'p2d_ocr_cache_bytes', 'OCR cache bytes: raw page text, compressed blobs written and read', ['operation'])
+OCR_COMPACTION_RATIO = Histogram(
+    'p2d_ocr_compaction_ratio', 'Compacted / original OCR text length per document', ['source'],
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 1.0))
+OCR_SCHEDULER_WAIT_SECONDS = Histogram(
+    'p2d_ocr_scheduler_wait_seconds', 'Time an OCR slice waited for an engine slot', ['work_class'])
+OCR_SCHEDULER_QUEUED = Gauge(
+    'p2d_ocr_scheduler_queued', 'OCR slices waiting for an engine slot', ['work_class'])
+OCR_SCHEDULER_SLICES = Counter(
+    'p2d_ocr_scheduler_slices', 'OCR slices dispatched by class and rule (fair/aged)', ['work_class', 'dispatch'])
+
+GEMINI_SECONDS = Histogram(
+    'p2d_gemini_request_duration_seconds', 'Gemini generateContent latency', ['status'])
+GEMINI_REQUESTS = Counter(
+    'p2d_gemini_requests', 'Gemini calls by HTTP status code', ['status'])
+GEMINI_TOKENS = Counter(
+    'p2d_gemini_tokens', 'Gemini token usage reported by the API', ['kind', 'purpose'])
+PROMPT_SECTION_TOKENS = Counter(
+    'p2d_prompt_section_tokens', 'Estimated prompt tokens per section kept or dropped by the budget', ['purpose', 'section', 'kind'])
+
+CACHE_REQUESTS = Counter(
+    'p2d_cache_requests', 'Cache lookups by cache and result (hit/miss/stale)', ['cache', 'result'])
+
+SUMMARY_BUILDS = Counter(
+    'p2d_summary_builds', 'Gemini summaries generated for the course summary tree', ['level'])
+
+PREFETCH_REQUESTS = Counter(
+    'p2d_prefetch_requests', 'Speculative material loads requested on selection (queued/duplicate/dropped/cached)', ['result'])
+PREFETCH_PENDING = Gauge(
+    'p2d_prefetch_pending', 'Material loads queued or running in the prefetch pool')
+
+ADMISSION_IN_USE = Gauge(
+    'p2d_admission_in_use', 'Admission slots held by work class', ['work_class'])
+ADMISSION_QUEUE_DEPTH = Gauge(
+    'p2d_admission_queue_depth', 'Requests waiting for an admission slot by work class', ['work_class'])
+ADMISSION_WAIT_SECONDS = Histogram(
+    'p2d_admission_wait_seconds', 'Time spent waiting for an admission slot', ['work_class'])
+ADMISSION_SHED = Counter(
+    'p2d_admission_shed', 'Requests refused by admission control (queue_full/wait_timeout, or a rate limit)', ['work_class', 'reason'])
+
+CIRCUIT_STATE = Gauge(
+    'p2d_circuit_state', 'Circuit breaker state by dependency (0 closed, 1 half-open, 2 open)', ['dependency'])
+CIRCUIT_CALLS = Counter(
+    'p2d_circuit_calls', 'Calls through a circuit breaker by result (ok/failed/slow/rejected)', ['dependency', 'result'])
+CIRCUIT_TRANSITIONS = Counter(
+    'p2d_circuit_transitions', 'Circuit breaker state changes by new state', ['dependency', 'state'])
+
+SINGLE_FLIGHT_CALLS = Counter(
+    'p2d_single_flight_calls', 'Coalesced OCR/Drive/Gemini work by resource and role (leader/follower/shared)', ['resource', 'role'])
+
+COURSE_MATERIALS_SECONDS = Histogram(
+    'p2d_course_materials_duration_seconds', 'process_course_materials latency', ['scope'])
+
+ACTIVE_SESSIONS = Gauge(
+    'p2d_active_sessions', 'Chat sessions held in memory')
+
+WRITE_BEHIND_PENDING = Gauge(
+    'p2d_write_behind_pending', 'Write-behind jobs waiting to run or being retried')
+WRITE_BEHIND_JOBS = Counter(
+    'p2d_write_behind_jobs', 'Write-behind job attempts by kind and result (done/retry/deferred/failed)', ['kind', 'result'])
+WRITE_BUFFER_PENDING = Gauge(
+    'p2d_write_buffer_pending', 'Rows waiting in a write buffer', ['buffer'])
+WRITE_BUFFER_FLUSHES = Counter(
+    'p2d_write_buffer_flushes', 'Batched writes by buffer and result (ok/rejected/error)', ['buffer', 'result'])
+WRITE_BUFFER_ROWS = Counter(
+    'p2d_write_buffer_rows', 'Rows written by write buffers', ['buffer'])
+WRITE_BUFFER_DROPPED = Counter(
+    'p2d_write_buffer_dropped', 'Rows dropped by write buffers (overflow/failed)', ['buffer', 'reason'])
@@ -0,0 +1,126 @@
+"""
+Page-parallel OCR over a pool of worker processes.
+
+Large documents are split into page shards. Each shard's page images are
+copied once into a shared-memory block, and a worker process that already
+holds a loaded docTR predictor reads them in place. Shards are OCR'd
+concurrently and their results, serialized OCRDocuments, are merged back in
+page order, so latency for one large document scales down with the number
+of cores.
+"""
+import os
+import atexit
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from ocr_result import OCRDocument
+
+logger = logging.getLogger(__name__)
+
+def result_page_texts(result):
+    """Flatten a docTR result into one text string per page"""
+    return OCRDocument.from_doctr(result).pages()
+
+# ----------------- Worker Process -----------------
+_worker_model = None
+
+def _init_worker(pretrained, torch_threads):
+    """Load the predictor once per worker process"""
+    global _worker_model
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+    from doctr.models import ocr_predictor
+    _worker_model = ocr_predictor(pretrained=pretrained)
+
+def _ocr_shard(shm_name, layout):
+    """OCR the pages described by layout [(offset, shape, dtype)] inside a shared-memory block"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        pages = [np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+                 for offset, shape, dtype in layout]
+        document = OCRDocument.from_doctr(_worker_model(pages))
+        del pages
+        return document.to_bytes()
+    finally:
+        shm.close()
+
+# ----------------- Pool -----------------
+def _pack_pages(pages):
+    """Copy page arrays into one shared-memory block; returns (block, layout)"""
+    layout = []
+    offset = 0
+    for page in pages:
+        layout.append((offset, page.shape, page.dtype.str))
+        offset += page.nbytes
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for page, (start, shape, dtype) in zip(pages, layout):
+        target = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=start)
+        target[...] = page
+        del target
+    return shm, layout
+
+class OCRPool:
+    def __init__(self, workers, shard_pages=4, pretrained=True, torch_threads=1):
+        self.workers = workers
+        self.shard_pages = max(1, shard_pages)
+        self.pretrained = pretrained
+        self.torch_threads = torch_threads
+        self._executor = None
+        self._lock = threading.Lock()
+        atexit.register(self.shutdown)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that already runs torch threads can deadlock
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self.pretrained, self.torch_threads)
+                )
+                logger.info(f"OCR process pool started with {self.workers} workers")
+            return self._executor
+
+    def _reset(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def run(self, pages):
+        """OCR page images in parallel shards; returns one OCRDocument in page order"""
+        executor = self._get_executor()
+        shards = [pages[i:i + self.shard_pages] for i in range(0, len(pages), self.shard_pages)]
+        blocks = []
+        try:
+            futures = []
+            for shard in shards:
+                shm, layout = _pack_pages(shard)
+                blocks.append(shm)
+                futures.append(executor.submit(_ocr_shard, shm.name, layout))
+
+            return OCRDocument.concat([OCRDocument.from_bytes(future.result()) for future in futures])
+        except BrokenProcessPool:
+            logger.error("OCR worker process died; restarting the pool on next use")
+            self._reset()
+            raise
+        finally:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
@@ -0,0 +1,213 @@
+"""
+Compact, array-backed representation of an OCR result.
+
+docTR returns a tree of page, block, line and word objects. OCRDocument
+keeps the text of all words in one string buffer, laid out exactly like the
+flattened text the backend has always produced: every word is followed by a
+space, every line by a newline and every block by another newline. Per-word
+offsets, confidences and boxes live in flat `array` buffers next to it.
+Confidences and relative box coordinates are quantized to 16 bits.
+
+The buffer is built in one join, so large outputs do not pay for repeated
+string concatenation. page(i), pages() and text() slice the buffer, lines()
+and words() read the arrays, and to_bytes() is a few memory copies.
+"""
+import sys
+import struct
+from array import array
+
+MAGIC = b'OCRD'
+VERSION = 1
+HEADER = struct.Struct('<4sBIIII')
+QUANT = 65535
+
+# (attribute, array typecode) in serialization order
+ARRAYS = (
+    ('page_chars', 'I'),   # text offset where each page starts, plus the end
+    ('page_lines', 'I'),   # first line of each page, plus the line count
+    ('line_words', 'I'),   # first word of each line, plus the word count
+    ('word_starts', 'I'),  # text offset of each word
+    ('word_lengths', 'I'),
+    ('confidences', 'H'),  # confidence * QUANT
+    ('boxes', 'H'),        # xmin, ymin, xmax, ymax per word, relative to the page * QUANT
+)
+
+def _quantize(value):
+    return min(QUANT, max(0, int(round(float(value) * QUANT))))
+
+def _bounds(geometry):
+    """(xmin, ymin, xmax, ymax) of a docTR box ((x0, y0), (x1, y1)) or polygon"""
+    xs = [float(point[0]) for point in geometry]
+    ys = [float(point[1]) for point in geometry]
+    return min(xs), min(ys), max(xs), max(ys)
+
+class OCRDocument:
+    __slots__ = ('text_buffer',) + tuple(name for name, _ in ARRAYS)
+
+    def __init__(self, text_buffer='', **arrays):
+        self.text_buffer = text_buffer
+        for name, typecode in ARRAYS:
+            setattr(self, name, arrays.get(name, array(typecode)))
+        if not self.page_chars:
+            self.page_chars.append(0)
+            self.page_lines.append(0)
+            self.line_words.append(0)
+
+    @classmethod
+    def from_doctr(cls, result):
+        """Build from a docTR Document (the output of ocr_predictor)"""
+        document = cls()
+        parts = []
+        position = 0
+        page_chars, page_lines = document.page_chars, document.page_lines
+        line_words, word_starts, word_lengths = document.line_words, document.word_starts, document.word_lengths
+        confidences, boxes = document.confidences, document.boxes
+        # Drop the closing entries; they are appended after the last page
+        for offsets in (page_chars, page_lines, line_words):
+            offsets.pop()
+        for page in result.pages:
+            page_chars.append(position)
+            page_lines.append(len(line_words))
+            for block in page.blocks:
+                for line in block.lines:
+                    line_words.append(len(word_starts))
+                    for word in line.words:
+                        value = word.value
+                        word_starts.append(position)
+                        word_lengths.append(len(value))
+                        confidences.append(_quantize(word.confidence))
+                        boxes.extend(_quantize(coordinate) for coordinate in _bounds(word.geometry))
+                        parts.append(value)
+                        parts.append(' ')
+                        position += len(value) + 1
+                    parts.append('\n')
+                    position += 1
+                parts.append('\n')
+                position += 1
+        page_chars.append(position)
+        page_lines.append(len(line_words))
+        line_words.append(len(word_starts))
+        document.text_buffer = ''.join(parts)
+        return document
+
+    @classmethod
+    def concat(cls, documents):
+        """One document holding the pages of documents in order"""
+        merged = cls()
+        # Drop the closing entries; they are appended after the last document
+        for offsets in (merged.page_chars, merged.page_lines, merged.line_words):
+            offsets.pop()
+        parts = []
+        chars = lines = words = 0
+        for document in documents:
+            parts.append(document.text_buffer)
+            merged.page_chars.extend(offset + chars for offset in document.page_chars[:-1])
+            merged.page_lines.extend(line + lines for line in document.page_lines[:-1])
+            merged.line_words.extend(word + words for word in document.line_words[:-1])
+            merged.word_starts.extend(offset + chars for offset in document.word_starts)
+            merged.word_lengths.extend(document.word_lengths)
+            merged.confidences.extend(document.confidences)
+            merged.boxes.extend(document.boxes)
+            chars += len(document.text_buffer)
+            lines += len(document.line_words) - 1
+            words += len(document.word_starts)
+        merged.page_chars.append(chars)
+        merged.page_lines.append(lines)
+        merged.line_words.append(words)
+        merged.text_buffer = ''.join(parts)
+        return merged
+
+    def __len__(self):
+        return len(self.page_chars) - 1
+
+    def page(self, index):
+        """Text of one page"""
+        return self.text_buffer[self.page_chars[index]:self.page_chars[index + 1]]
+
+    def pages(self):
+        return [self.page(index) for index in range(len(self))]
+
+    def text(self, separator='\n'):
+        return separator.join(self.pages())
+
+    def page_document(self, index):
+        """A standalone OCRDocument holding only page index"""
+        first_line, end_line = self.page_lines[index], self.page_lines[index + 1]
+        first_word, end_word = self.line_words[first_line], self.line_words[end_line]
+        chars = self.page_chars[index]
+        return OCRDocument(
+            self.text_buffer[chars:self.page_chars[index + 1]],
+            page_chars=array('I', [0, self.page_chars[index + 1] - chars]),
+            page_lines=array('I', [0, end_line - first_line]),
+            line_words=array('I', (word - first_word for word in self.line_words[first_line:end_line + 1])),
+            word_starts=array('I', (offset - chars for offset in self.word_starts[first_word:end_word])),
+            word_lengths=self.word_lengths[first_word:end_word],
+            confidences=self.confidences[first_word:end_word],
+            boxes=self.boxes[first_word * 4:end_word * 4],
+        )
+
+    def _line_range(self, page):
+        if page is None:
+            return 0, len(self.line_words) - 1
+        return self.page_lines[page], self.page_lines[page + 1]
+
+    def lines(self, page=None):
+        """Text of each line (without the trailing space), of one page or the whole document"""
+        result = []
+        first, end = self._line_range(page)
+        for line in range(first, end):
+            start_word, end_word = self.line_words[line], self.line_words[line + 1]
+            if start_word == end_word:
+                result.append('')
+                continue
+            last = end_word - 1
+            result.append(self.text_buffer[self.word_starts[start_word]:self.word_starts[last] + self.word_lengths[last]])
+        return result
+
+    def words(self, page=None):
+        """[(word, confidence, (xmin, ymin, xmax, ymax))] of one page or the whole document"""
+        first, end = self._line_range(page)
+        start_word, end_word = self.line_words[first], self.line_words[end]
+        return [
+            (
+                self.text_buffer[self.word_starts[i]:self.word_starts[i] + self.word_lengths[i]],
+                self.confidences[i] / QUANT,
+                tuple(value / QUANT for value in self.boxes[i * 4:i * 4 + 4])
+            )
+            for i in range(start_word, end_word)
+        ]
+
+    def to_bytes(self):
+        text = self.text_buffer.encode('utf-8')
+        parts = [HEADER.pack(MAGIC, VERSION, len(self), len(self.line_words) - 1, len(self.word_starts), len(text))]
+        for name, _ in ARRAYS:
+            values = getattr(self, name)
+            if sys.byteorder == 'big':
+                values = array(values.typecode, values)
+                values.byteswap()
+            parts.append(values.tobytes())
+        parts.append(text)
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, pages, lines, words, text_length = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a version {VERSION} OCR document")
+        counts = {
+            'page_chars': pages + 1, 'page_lines': pages + 1, 'line_words': lines + 1,
+            'word_starts': words, 'word_lengths': words, 'confidences': words, 'boxes': words * 4,
+        }
+        view = memoryview(data)
+        offset = HEADER.size
+        arrays = {}
+        for name, typecode in ARRAYS:
+            values = array(typecode)
+            size = counts[name] * values.itemsize
+            values.frombytes(view[offset:offset + size])
+            if sys.byteorder == 'big':
+                values.byteswap()
+            arrays[name] = values
+            offset += size
+        text = bytes(view[offset:offset + text_length]).decode('utf-8')
+        return cls(text, **arrays)
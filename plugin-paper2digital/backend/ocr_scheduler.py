@@ -0,0 +1,123 @@
+"""
+Priority scheduling of OCR work between interactive and background callers.
+
+Every OCR call goes through Scheduler.run() as a slice of at most a few
+pages. A slice waits for one of a fixed number of engine slots. Free slots
+go to waiting slices by weighted fair queuing over three classes:
+
+    interactive  a student is waiting on the response (chat uploads, submissions)
+    normal       bulk grading and course material a request asked for
+    background   warm-up, prefetch and backfill
+
+A slice is tagged with a virtual finish time, start + pages / class weight,
+where start is the later of the scheduler's virtual clock and the class's
+previous finish tag. The slice with the smallest tag runs next. A class that
+was idle does not bank credit, and heavier classes get proportionally more
+pages through. Long documents are cut into slices by the caller, so they
+yield at page boundaries: a one-page upload waits behind at most one slice
+of a 300-page backfill. A slice that has waited longer than max_wait is
+dispatched ahead of the tags, so background work is never starved.
+
+The class is taken from a context variable set with priority(), so it
+follows work into threads started with tracing.wrap. Threads without one
+(prefetch, refreshers) run as background.
+"""
+import time
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+
+import metrics
+
+CLASSES = ('interactive', 'normal', 'background')  # highest priority first
+DEFAULT_WEIGHTS = {'interactive': 16, 'normal': 4, 'background': 1}
+
+_current_class = contextvars.ContextVar('ocr_class', default='background')
+
+@contextmanager
+def priority(work_class):
+    """Run the enclosed OCR work in work_class"""
+    if work_class not in CLASSES:
+        raise ValueError(f"Unknown OCR class {work_class}")
+    token = _current_class.set(work_class)
+    try:
+        yield
+    finally:
+        _current_class.reset(token)
+
+def current_class():
+    return _current_class.get()
+
+def at_most(work_class):
+    """The current class, lowered to work_class if it is higher"""
+    current = current_class()
+    return max(current, work_class, key=CLASSES.index)
+
+class _Ticket:
+    __slots__ = ('work_class', 'start', 'finish', 'seq', 'enqueued', 'dispatched')
+
+    def __init__(self, work_class, start, finish, seq):
+        self.work_class = work_class
+        self.start = start
+        self.finish = finish
+        self.seq = seq
+        self.enqueued = time.monotonic()
+        self.dispatched = False
+
+class Scheduler:
+    def __init__(self, slots=1, weights=None, max_wait=60.0):
+        self.slots = max(1, slots)
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._in_use = 0
+        self._virtual = 0.0
+        self._finish = {work_class: 0.0 for work_class in CLASSES}
+        self._seq = itertools.count()
+        for work_class in CLASSES:
+            metrics.OCR_SCHEDULER_QUEUED.set_function(
+                lambda work_class=work_class: self.queued(work_class), work_class=work_class
+            )
+
+    def queued(self, work_class=None):
+        with self._cond:
+            return sum(1 for ticket in self._waiting if work_class is None or ticket.work_class == work_class)
+
+    def _pick(self, now):
+        aged = [ticket for ticket in self._waiting if now - ticket.enqueued >= self.max_wait]
+        if aged:
+            return min(aged, key=lambda ticket: ticket.enqueued), 'aged'
+        return min(self._waiting, key=lambda ticket: (ticket.finish, ticket.seq)), 'fair'
+
+    def _dispatch(self):
+        now = time.monotonic()
+        while self._waiting and self._in_use < self.slots:
+            ticket, reason = self._pick(now)
+            self._waiting.remove(ticket)
+            self._virtual = max(self._virtual, ticket.start)
+            ticket.dispatched = True
+            self._in_use += 1
+            metrics.OCR_SCHEDULER_SLICES.inc(work_class=ticket.work_class, dispatch=reason)
+            metrics.OCR_SCHEDULER_WAIT_SECONDS.observe(now - ticket.enqueued, work_class=ticket.work_class)
+        self._cond.notify_all()
+
+    def run(self, pages, func, work_class=None):
+        """Wait for a slot in the caller's class, then run func() (OCR of pages page images) in this thread"""
+        work_class = work_class or current_class()
+        with self._cond:
+            start = max(self._virtual, self._finish[work_class])
+            finish = start + max(1, pages) / self.weights[work_class]
+            self._finish[work_class] = finish
+            ticket = _Ticket(work_class, start, finish, next(self._seq))
+            self._waiting.append(ticket)
+            self._dispatch()
+            while not ticket.dispatched:
+                self._cond.wait()
+        try:
+            return func()
+        finally:
+            with self._cond:
+                self._in_use -= 1
+                self._dispatch()
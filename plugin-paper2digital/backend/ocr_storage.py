@@ -0,0 +1,114 @@
+"""
+Versioned, compressed storage format for cached OCR text.
+
+PDF_OCR_CACHE.OCR_DATA holds one blob per PDF:
+
+    magic b'P2DO' | version (1 byte) | codec (1 byte) | page count (uint32)
+    | separator length (uint16) | separator (UTF-8)
+    | compressed length of each page (uint32 per page)
+    | the pages, each compressed on its own
+
+Pages are compressed separately, so page boundaries survive the round trip
+and page(i) can read one page without the others. The backend's readers
+need whole documents: text() joins the pages with the stored separator and
+returns exactly the text that was written. zstd is used when the zstandard
+package is installed, zlib otherwise. The codec byte records which one
+wrote a blob.
+
+Rows cached before OCR_DATA existed only have OCR_TEXT; cached_text() reads
+either kind of row.
+"""
+import zlib
+import struct
+
+try:
+    import zstandard
+except ImportError:  # zlib only; zstd blobs cannot be read without the package
+    zstandard = None
+
+MAGIC = b'P2DO'
+VERSION = 1
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODEC_NAMES = {CODEC_ZLIB: 'zlib', CODEC_ZSTD: 'zstd'}
+ZLIB_LEVEL = 9
+ZSTD_LEVEL = 10
+
+HEADER = struct.Struct('>4sBBIH')
+LENGTH = struct.Struct('>I')
+
+def default_codec():
+    return CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+
+def _compress(data, codec):
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, ZLIB_LEVEL)
+
+def _decompress(data, codec):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("OCR blob is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data)
+    raise ValueError(f"Unknown OCR blob codec {codec}")
+
+def encode(pages, separator='\n', codec=None):
+    """Blob for page texts that separator.join(pages) turns back into the document text"""
+    codec = codec or default_codec()
+    compressed = [_compress(page.encode('utf-8'), codec) for page in pages]
+    separator_bytes = separator.encode('utf-8')
+    parts = [HEADER.pack(MAGIC, VERSION, codec, len(compressed), len(separator_bytes)), separator_bytes]
+    parts.extend(LENGTH.pack(len(blob)) for blob in compressed)
+    parts.extend(compressed)
+    return b''.join(parts)
+
+def format_tag(codec=None):
+    """Value for the OCR_FORMAT column, e.g. 'p2do1+zlib'"""
+    return f"p2do{VERSION}+{CODEC_NAMES[codec or default_codec()]}"
+
+class StoredOCR:
+    """Read view over an encoded blob; a page is decompressed when it is read"""
+
+    def __init__(self, blob):
+        self._blob = bytes(blob)
+        magic, version, self.codec, count, separator_length = HEADER.unpack_from(self._blob, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a version {VERSION} OCR blob")
+        offset = HEADER.size
+        self.separator = self._blob[offset:offset + separator_length].decode('utf-8')
+        offset += separator_length
+        lengths = struct.unpack_from(f'>{count}I', self._blob, offset)
+        offset += LENGTH.size * count
+        self._spans = []
+        for length in lengths:
+            self._spans.append((offset, offset + length))
+            offset += length
+
+    def __len__(self):
+        return len(self._spans)
+
+    def page(self, index):
+        start, end = self._spans[index]
+        return _decompress(self._blob[start:end], self.codec).decode('utf-8')
+
+    def pages(self):
+        return [self.page(index) for index in range(len(self))]
+
+    def text(self):
+        return self.separator.join(self.pages())
+
+    @property
+    def stored_bytes(self):
+        return len(self._blob)
+
+def decode(blob):
+    return StoredOCR(blob)
+
+def cached_text(ocr_data, ocr_text=None):
+    """Document text of a PDF_OCR_CACHE row from its OCR_DATA blob, or the OCR_TEXT of a row written before it"""
+    if ocr_data:
+        return decode(ocr_data).text()
+    # Rows written before OCR_DATA existed had their quotes doubled on the way in
+    return ocr_text.replace("''", "'") if ocr_text else None
@@ -0,0 +1,84 @@
+"""
+Page-level OCR cache keyed by the hash of each page image.
+
+Each entry is a serialized single-page OCRDocument, so cached pages keep
+their word boxes and confidences.
+
+Every page image is hashed, so a page seen before is not OCR'd again. This
+holds within a document, across documents (cover sheets, printed answer
+sheet templates) and after a one-page edit to a course PDF. The key also
+covers the OCR model, so switching models does not serve stale text.
+
+Callers OCR the missing pages in checkpoint batches and store each batch as
+soon as it is done. If extraction dies on page 180 of 200, the next attempt
+finds pages 1-176 here and resumes from there.
+
+The cache is a local SQLite file shared by the worker processes on one host.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS page_results (
+    page_hash TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS page_results_age ON page_results (created_at);
+"""
+# SQLite's default limit on host parameters per statement is 999
+LOOKUP_CHUNK = 500
+
+def page_hash(page, model_tag=''):
+    """Hash of a page image (numpy array) and the OCR model that reads it"""
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{model_tag}|{page.shape}|{page.dtype.str}|".encode('utf-8'))
+    digest.update(page.data if page.flags['C_CONTIGUOUS'] else page.tobytes())
+    return digest.hexdigest()
+
+class PageCache:
+    def __init__(self, path, max_age_days=90):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        if max_age_days > 0:
+            self._db.execute("DELETE FROM page_results WHERE created_at < ?", (time.time() - max_age_days * 86400,))
+
+    def get_many(self, hashes):
+        """{page_hash: serialized page} for the hashes that are cached"""
+        unique = list(dict.fromkeys(hashes))
+        found = {}
+        with self._lock:
+            for i in range(0, len(unique), LOOKUP_CHUNK):
+                chunk = unique[i:i + LOOKUP_CHUNK]
+                rows = self._db.execute(
+                    f"SELECT page_hash, data FROM page_results WHERE page_hash IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def put_many(self, entries):
+        """Store {page_hash: serialized page}; one transaction, so a batch is checkpointed whole or not at all"""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO page_results (page_hash, data, created_at) VALUES (?, ?, ?)",
+                    [(digest, data, now) for digest, data in entries.items()]
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM page_results").fetchone()[0]
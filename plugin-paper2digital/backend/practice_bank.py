@@ -0,0 +1,60 @@
+"""
+Pre-generated practice questions per chapter and language.
+
+A bank is generated ahead of time from chunks spread across a chapter, so
+questions cover the whole chapter rather than its first pages. Generated
+text is parsed into (question, answer) items with stable ids. A session is
+served a random sample of items it has not seen yet.
+"""
+import re
+import random
+import hashlib
+
+ITEM_MARKER = re.compile(r'^\s*\**\s*(Q|A)\s*\d*\s*\**\s*[:.)]\**\s*', re.IGNORECASE | re.MULTILINE)
+
+# Labels used when showing questions, matching the live-generation format per language
+LABELS = {
+    'en': ('Q', 'A'),
+    'hi': ('प्र', 'उ'),
+    'es': ('P', 'R'),
+    'fr': ('Q', 'R'),
+}
+
+def question_id(question):
+    normalized = re.sub(r'\W+', ' ', question.casefold()).strip()
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+def parse_items(text):
+    """[(question, answer)] from 'Q: ...' / 'A: ...' blocks (numbered markers such as Q3: also accepted)"""
+    markers = list(ITEM_MARKER.finditer(text or ''))
+    items = []
+    question = None
+    for i, match in enumerate(markers):
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(text)
+        body = text[match.end():end].strip()
+        if match.group(1).upper() == 'Q':
+            question = body
+        elif question:
+            if body:
+                items.append((question, body))
+            question = None
+    return items
+
+def spread(chunks, count):
+    """Up to count chunks evenly spaced through the document"""
+    if count >= len(chunks):
+        return list(chunks)
+    step = len(chunks) / count
+    return [chunks[int(i * step)] for i in range(count)]
+
+def sample(items, served_ids, count, rng=random):
+    """count items whose id is not in served_ids, or fewer if the bank is running out"""
+    unseen = [item for item in items if item['question_id'] not in served_ids]
+    return rng.sample(unseen, min(count, len(unseen)))
+
+def format_items(items, language='en'):
+    q_label, a_label = LABELS.get(language, LABELS['en'])
+    return "\n\n".join(
+        f"{q_label}{i}: {item['question']}\n{a_label}{i}: {item['answer']}"
+        for i, item in enumerate(items, start=1)
+    )
@@ -0,0 +1,120 @@
+"""
+Token-budgeted prompt assembly for Gemini calls.
+
+A prompt is a template plus named sections (course material, uploaded
+documents, the student's question, ...). The template and fixed fields are
+always kept. The remaining token budget is granted to the sections in priority
+order, and each section is cut at a sentence boundary (or a word boundary
+if a single sentence is too long) so text is never split mid-word.
+
+Token counts are estimated per script: Latin text runs about four characters
+per token, Devanagari about two. The estimate is calibrated per language
+against the promptTokenCount Gemini reports for real calls.
+"""
+import re
+import threading
+
+import metrics
+
+CHARS_PER_TOKEN = {'latin': 4.0, 'devanagari': 2.0, 'other': 1.5}
+# Characters beyond Latin Extended, and the Devanagari block within them
+NON_LATIN = re.compile(r'[^\u0000-\u024F]')
+DEVANAGARI = re.compile(r'[\u0900-\u097F]')
+SENTENCE_BREAK = re.compile(r'((?<=[.!?।॥])\s+|\n+)')
+
+# Ratio of reported to estimated prompt tokens per language, smoothed
+_calibration = {}
+_calibration_lock = threading.Lock()
+CALIBRATION_WEIGHT = 0.1
+
+def _raw_estimate(text):
+    if not text:
+        return 0.0
+    non_latin = len(NON_LATIN.findall(text))
+    devanagari = len(DEVANAGARI.findall(text))
+    latin = len(text) - non_latin
+    return (latin / CHARS_PER_TOKEN['latin']
+            + devanagari / CHARS_PER_TOKEN['devanagari']
+            + (non_latin - devanagari) / CHARS_PER_TOKEN['other'])
+
+def estimate_tokens(text, language='en'):
+    return int(_raw_estimate(text) * _calibration.get(language, 1.0)) + (1 if text else 0)
+
+def record_usage(language, prompt, prompt_tokens):
+    """Fold a Gemini-reported prompt token count into the estimate for this language"""
+    estimated = _raw_estimate(prompt)
+    if not prompt_tokens or estimated <= 0:
+        return
+    ratio = prompt_tokens / estimated
+    with _calibration_lock:
+        previous = _calibration.get(language)
+        _calibration[language] = ratio if previous is None else (
+            previous + CALIBRATION_WEIGHT * (ratio - previous))
+
+def fit(text, max_tokens, language='en'):
+    """Longest prefix of text within max_tokens, ending at a sentence (or word) boundary"""
+    if not text or max_tokens <= 0:
+        return ""
+    if estimate_tokens(text, language) <= max_tokens:
+        return text
+
+    # No script packs more than CHARS_PER_TOKEN['latin'] characters into a token,
+    # so nothing past this point can fit; avoids splitting whole documents
+    text = text[:int(max_tokens * CHARS_PER_TOKEN['latin'] * max(1.0, 1 / _calibration.get(language, 1.0))) + 1]
+
+    parts = SENTENCE_BREAK.split(text)
+    kept = []
+    used = 0
+    for i in range(0, len(parts), 2):
+        piece = parts[i] + (parts[i + 1] if i + 1 < len(parts) else "")
+        cost = estimate_tokens(piece, language)
+        if used + cost > max_tokens:
+            break
+        kept.append(piece)
+        used += cost
+    if kept:
+        return "".join(kept).rstrip()
+
+    # The first sentence alone is too long: cut it at the last whole word that fits
+    words = re.split(r'(\s+)', text)
+    for i in range(0, len(words), 2):
+        piece = words[i] + (words[i + 1] if i + 1 < len(words) else "")
+        cost = estimate_tokens(piece, language)
+        if used + cost > max_tokens:
+            break
+        kept.append(piece)
+        used += cost
+    return "".join(kept).rstrip()
+
+def render(template, language, budget_tokens, fixed=None, sections=(), purpose='general'):
+    """
+    Fill template within budget_tokens.
+
+    fixed: {field: value} inserted whole.
+    sections: [(field, text, share)] in priority order. share (0-1) caps what
+    a section may take before lower-priority sections are served; unused budget
+    then flows back in priority order. None means no cap.
+    """
+    fixed = dict(fixed or {})
+    skeleton = template.format(**fixed, **{name: "" for name, _, _ in sections})
+    available = max(0, budget_tokens - estimate_tokens(skeleton, language))
+
+    needs = {name: estimate_tokens(text, language) for name, text, _ in sections}
+    grants = {}
+    remaining = available
+    for name, _, share in sections:
+        cap = needs[name] if share is None else min(needs[name], int(available * share))
+        grants[name] = min(cap, remaining)
+        remaining -= grants[name]
+    for name, _, _ in sections:
+        extra = min(needs[name] - grants[name], remaining)
+        grants[name] += extra
+        remaining -= extra
+
+    filled = {}
+    for name, text, _ in sections:
+        filled[name] = fit(text, grants[name], language)
+        kept = estimate_tokens(filled[name], language)
+        metrics.PROMPT_SECTION_TOKENS.inc(kept, purpose=purpose, section=name, kind='kept')
+        metrics.PROMPT_SECTION_TOKENS.inc(max(0, needs[name] - kept), purpose=purpose, section=name, kind='dropped')
+    return template.format(**fixed, **filled)
@@ -0,0 +1,107 @@
+"""
+Split OCR text from assignments and answer sheets into question/answer pairs.
+
+Questions are found, in order of preference, by explicit markers ("Q1",
+"Question 2", "Ques. 3"), by a numbered sequence at the start of lines
+("1.", "2)", "(3)") that counts up from 1, or by layout blocks (the blank
+line docTR emits between text blocks) when both documents have the same
+number of blocks. Answers are matched to questions by number. An answer
+sheet with fewer numbered answers than there are questions (plain
+paragraphs, or only "Q2" numbered) is paired by layout blocks instead, when
+it has one block per question. When nothing usable is found the whole
+documents form a single pair, so callers can always score what they get
+back; an answer is never dropped just because it was not numbered.
+"""
+import re
+
+MARKER_PATTERN = re.compile(
+    r'^[ \t]*(?:Q|Ques(?:tion)?|Ans(?:wer)?)\.?[ \t]*(\d{1,3})\b[ \t]*[.):\-]?', re.IGNORECASE | re.MULTILINE)
+NUMBERED_PATTERN = re.compile(r'^[ \t]*\(?(\d{1,3})[.)][ \t]+', re.MULTILINE)
+MARKS_PATTERN = re.compile(r'\[\s*(\d{1,3})\s*\]|(\d{1,3})\s*(?:marks?|points?|pts)\b', re.IGNORECASE)
+
+def _split_at(text, matches):
+    """[(number, body)] for each match, the body running to the next match"""
+    segments = []
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        segments.append((int(match.group(1)), text[match.end():end].strip()))
+    return segments
+
+def _numbered_sequence(text):
+    """Matches of a line-start numbering that counts 1, 2, 3, ... (other numbered lines are body text)"""
+    sequence = []
+    for match in NUMBERED_PATTERN.finditer(text):
+        if int(match.group(1)) == len(sequence) + 1:
+            sequence.append(match)
+    return sequence
+
+def split_questions(text):
+    """Segment text into [(number, body)]; empty when no numbering is found"""
+    if not text:
+        return []
+    markers = list(MARKER_PATTERN.finditer(text))
+    if len(markers) >= 2:
+        segments = _split_at(text, markers)
+    else:
+        sequence = _numbered_sequence(text)
+        if len(sequence) < 2:
+            return []
+        segments = _split_at(text, sequence)
+
+    # A number seen twice (e.g. a question quoted in its own answer) continues the first segment
+    merged = {}
+    for number, body in segments:
+        merged[number] = f"{merged[number]}\n{body}".strip() if number in merged else body
+    return sorted(merged.items())
+
+def layout_blocks(text):
+    return [block.strip() for block in re.split(r'\n\s*\n', text or '') if block.strip()]
+
+def question_marks(question):
+    """Marks printed with a question, e.g. '(10 marks)' or '[5]'; None if absent"""
+    match = MARKS_PATTERN.search(question or '')
+    if not match:
+        return None
+    value = int(match.group(1) or match.group(2))
+    return value if value > 0 else None
+
+def pair_questions(assignment_text, answer_text, max_chars=6000):
+    """
+    Pair questions with answers: [{'label', 'question', 'answer', 'marks'}].
+    Each side is capped at max_chars per pair.
+    """
+    questions = split_questions(assignment_text)
+    answers = dict(split_questions(answer_text))
+
+    if len(questions) >= 2 and len(answers) < len(questions):
+        # Unnumbered or partly numbered answers cannot be matched by number
+        answer_blocks = layout_blocks(answer_text)
+        if len(answer_blocks) == len(questions):
+            answers = {number: block for (number, _), block in zip(questions, answer_blocks)}
+        else:
+            questions = []
+
+    if len(questions) < 2:
+        question_blocks = layout_blocks(assignment_text)
+        answer_blocks = layout_blocks(answer_text)
+        if len(question_blocks) >= 2 and len(question_blocks) == len(answer_blocks):
+            questions = list(enumerate(question_blocks, start=1))
+            answers = dict(enumerate(answer_blocks, start=1))
+
+    if len(questions) < 2:
+        return [{
+            'label': 'All',
+            'question': (assignment_text or '')[:max_chars],
+            'answer': (answer_text or '')[:max_chars],
+            'marks': None
+        }]
+
+    pairs = []
+    for number, question in questions:
+        pairs.append({
+            'label': f"Q{number}",
+            'question': question[:max_chars],
+            'answer': answers.get(number, '')[:max_chars],
+            'marks': question_marks(question)
+        })
+    return pairs
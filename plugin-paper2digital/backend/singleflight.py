@@ -0,0 +1,167 @@
+"""
+Single-flight execution of expensive identical work.
+
+Concurrent calls with the same resource and key (a Drive file id, a content
+hash, a prompt hash) run the work once. The other callers wait and get its
+result, or its exception.
+
+Within a process, callers share a future. Across processes (several
+gunicorn workers on one host) the leader also holds an exclusive file lock
+for the key. A process that had to wait for the lock does not repeat the
+work. It first tries recheck() (e.g. the shared OCR cache the other process
+has just filled), then the result the other process left in the lock
+directory.
+
+Each key has a lock file of its own, named by the hash of the resource and
+key, so work on one key never waits for another. Result files and idle lock
+files are swept once they are older than RESULT_MAX_AGE.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows: coalesce within the process only
+    fcntl = None
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+RESULT_MAX_AGE = 600
+SWEEP_EVERY = 100
+POLL_SECONDS = 0.05
+
+class SingleFlight:
+    def __init__(self, lock_dir=None, lock_timeout=600):
+        """lock_dir enables coordination across processes; lock_timeout caps the wait for another process"""
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self.lock_timeout = lock_timeout
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def do(self, resource, key, compute, recheck=None, share=None):
+        """
+        compute() once for (resource, key) across concurrent callers.
+
+        recheck(): the result if another process already stored it, else None.
+        share(result): whether other processes may reuse the result (default: always).
+        """
+        flight = (resource, key)
+        with self._lock:
+            future = self._in_flight.get(flight)
+            leader = future is None
+            if leader:
+                future = self._in_flight[flight] = Future()
+        if not leader:
+            metrics.SINGLE_FLIGHT_CALLS.inc(resource=resource, role='follower')
+            return future.result()
+        try:
+            result = self._run(resource, key, compute, recheck, share)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(flight, None)
+
+    def _run(self, resource, key, compute, recheck, share):
+        if not self.lock_dir:
+            metrics.SINGLE_FLIGHT_CALLS.inc(resource=resource, role='leader')
+            return compute()
+
+        digest = hashlib.sha256(f"{resource}\0{key}".encode('utf-8')).hexdigest()
+        lock_path = os.path.join(self.lock_dir, f"{resource}-{digest}.lock")
+        result_path = os.path.join(self.lock_dir, f"{resource}-{digest}.json")
+        with open(lock_path, 'a') as lock_file:
+            wait_start = time.time()
+            locked, waited = self._acquire(lock_file)
+            if locked:
+                # Keeps the sweep away from a lock file that is in use
+                os.utime(lock_path)
+            try:
+                if waited:
+                    shared = recheck() if recheck else None
+                    if shared is None:
+                        shared = self._read_result(result_path, wait_start)
+                    if shared is not None:
+                        metrics.SINGLE_FLIGHT_CALLS.inc(resource=resource, role='shared')
+                        return shared
+                metrics.SINGLE_FLIGHT_CALLS.inc(resource=resource, role='leader')
+                result = compute()
+                if share is None or share(result):
+                    self._write_result(result_path, result)
+                return result
+            finally:
+                if locked:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _acquire(self, lock_file):
+        """Take the lock, polling up to lock_timeout; returns (locked, waited)"""
+        deadline = time.monotonic() + self.lock_timeout
+        waited = False
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True, waited
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    logger.warning(f"Gave up waiting for {lock_file.name} after {self.lock_timeout}s")
+                    return False, True
+                waited = True
+                time.sleep(POLL_SECONDS)
+
+    def _read_result(self, path, not_before):
+        """A result written by another process since not_before, or None"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry['result'] if entry.get('at', 0) >= not_before else None
+
+    def _write_result(self, path, result):
+        try:
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'at': time.time(), 'result': result}, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not share single-flight result {path}: {e}")
+            return
+        self._writes += 1
+        if self._writes % SWEEP_EVERY == 0:
+            self._sweep()
+
+    def _sweep(self):
+        cutoff = time.time() - RESULT_MAX_AGE
+        for name in os.listdir(self.lock_dir):
+            path = os.path.join(self.lock_dir, name)
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+                if name.endswith('.json'):
+                    os.remove(path)
+                elif name.endswith('.lock'):
+                    self._remove_idle_lock(path)
+            except OSError:
+                pass
+
+    def _remove_idle_lock(self, path):
+        """Delete a lock file unless another caller holds it"""
+        with open(path, 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            os.remove(path)
@@ -0,0 +1,34 @@
+"""
+Build or refresh the course summary trees offline, e.g. nightly from cron.
+
+Only chapters whose OCR text changed (or that were summarized with an older
+SUMMARY_VERSION) are sent to Gemini again.
+
+    python summarize_courses.py                  # every course
+    python summarize_courses.py --course compiler
+    python summarize_courses.py --force          # rebuild everything
+"""
+import sys
+import argparse
+
+import app
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build hierarchical course summaries")
+    parser.add_argument('--course', action='append', help="Course id (repeatable); default is every course")
+    parser.add_argument('--force', action='store_true', help="Rebuild summaries even if the material is unchanged")
+    args = parser.parse_args(argv)
+
+    courses = args.course or app.get_all_courses()
+    failed = 0
+    for course in courses:
+        try:
+            rebuilt = app.refresh_course_summaries(course, force=args.force)
+            print(f"{course}: {len(rebuilt)} chapters rebuilt {rebuilt}")
+        except Exception as e:
+            failed += 1
+            print(f"{course}: failed ({e})", file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
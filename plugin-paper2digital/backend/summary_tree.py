@@ -0,0 +1,114 @@
+"""
+Hierarchical summaries of course material for whole-course questions.
+
+A chapter's OCR text is cut into chunks at sentence boundaries. Each chunk
+is summarized (in parallel), and the chunk summaries are reduced into one
+chapter summary. If they do not fit into a single call they are grouped and
+reduced again. Chapter summaries are reduced the same way into a course
+summary.
+
+Every stored node carries the hash of the text it was built from and
+SUMMARY_VERSION, so a tree is rebuilt only when the material or the
+summarizing prompt changes. For broad questions the summaries alone serve
+as context. Specific questions also get the raw passages that best match
+their terms.
+"""
+import re
+import math
+import hashlib
+from collections import Counter
+
+import prompt_budget
+
+# Bump when the summarizing prompts change so stored trees are rebuilt
+SUMMARY_VERSION = '1'
+
+BROAD_QUESTION_MARKERS = (
+    'summar', 'overview', 'outline', 'main topic', 'key point', 'key concept', 'what is this course',
+    'about this course', 'about the course', 'what will i learn', 'syllabus', 'all chapters',
+    'सारांश', 'मुख्य विषय', 'अवलोकन', 'resumen', 'resume', 'temas principales', 'panorama',
+    'résumé', 'aperçu', 'sujets principaux', 'plan du cours',
+)
+STOPWORDS = {
+    'the', 'and', 'for', 'are', 'what', 'which', 'how', 'why', 'when', 'where', 'who', 'does', 'this',
+    'that', 'with', 'from', 'into', 'about', 'explain', 'describe', 'give', 'can', 'you', 'please',
+    'between', 'difference', 'example', 'examples', 'define', 'definition', 'tell', 'there', 'their',
+}
+TERM = re.compile(r'\w{3,}')
+
+def source_hash(text):
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()
+
+def chunk_text(text, max_tokens, language='en'):
+    """Split text into consecutive chunks of at most max_tokens, cut at sentence boundaries"""
+    chunks = []
+    rest = (text or '').strip()
+    # fit() only needs a window a little larger than what can fit
+    window = int(max_tokens * prompt_budget.CHARS_PER_TOKEN['latin'] * 2)
+    while rest:
+        piece = prompt_budget.fit(rest[:window], max_tokens, language)
+        if not piece:
+            piece = rest[:window]
+        chunks.append(piece)
+        rest = rest[len(piece):].lstrip()
+    return chunks
+
+MAX_REDUCE_ROUNDS = 5
+
+def reduce_summaries(summaries, summarize, level, max_input_tokens, language='en'):
+    """Merge summaries into one, summarizing groups that fit max_input_tokens until one call suffices"""
+    summaries = [s for s in summaries if s and s.strip()]
+    if not summaries:
+        return ""
+    for _ in range(MAX_REDUCE_ROUNDS):
+        joined = "\n\n".join(summaries)
+        if prompt_budget.estimate_tokens(joined, language) <= max_input_tokens:
+            break
+        groups = [[]]
+        used = 0
+        for summary in summaries:
+            cost = prompt_budget.estimate_tokens(summary, language)
+            if groups[-1] and used + cost > max_input_tokens:
+                groups.append([])
+                used = 0
+            groups[-1].append(summary)
+            used += cost
+        summaries = [summarize(prompt_budget.fit("\n\n".join(group), max_input_tokens, language), level)
+                     for group in groups]
+    return summarize(prompt_budget.fit("\n\n".join(summaries), max_input_tokens, language), level)
+
+def build_chapter_tree(text, summarize, chunk_tokens, max_input_tokens, map_function=map, language='en'):
+    """
+    Summarize one chapter; returns {'chunks': [chunk summaries], 'summary': chapter summary}.
+    map_function runs the chunk summaries (pass executor.map to parallelize).
+    """
+    chunks = chunk_text(text, chunk_tokens, language)
+    chunk_summaries = list(map_function(lambda chunk: summarize(chunk, 'chunk'), chunks))
+    return {
+        'chunks': chunk_summaries,
+        'summary': reduce_summaries(chunk_summaries, summarize, 'chapter', max_input_tokens, language)
+    }
+
+def is_broad_question(question):
+    lowered = (question or '').casefold()
+    return any(marker in lowered for marker in BROAD_QUESTION_MARKERS)
+
+def _terms(text):
+    return [term for term in TERM.findall((text or '').casefold()) if term not in STOPWORDS]
+
+def rank_passages(passages, question, limit=5):
+    """Top passages by shared (idf-weighted) question terms, in document order; empty when nothing matches"""
+    query = set(_terms(question))
+    if not query or not passages:
+        return []
+    passage_terms = [set(_terms(passage)) & query for passage in passages]
+    document_frequency = Counter(term for terms in passage_terms for term in terms)
+    scored = []
+    for position, terms in enumerate(passage_terms):
+        score = sum(math.log(1 + len(passages) / document_frequency[term]) for term in terms)
+        if score > 0:
+            scored.append((score, -position))
+    scored.sort(reverse=True)
+    # Keep the chosen passages in document order
+    chosen = sorted(-position for _, position in scored[:limit])
+    return [passages[position] for position in chosen]
@@ -0,0 +1,168 @@
+import time
+import threading
+
+import pytest
+
+import admission
+from admission import SlotPool, RateLimiter, Overloaded
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.01)
+
+def acquire_in_thread(pool, shed):
+    result = {}
+    def target():
+        try:
+            result['acquired'] = pool.acquire(shed)
+        except Overloaded as e:
+            result['error'] = e
+    thread = threading.Thread(target=target)
+    thread.start()
+    return thread, result
+
+def test_full_queue_sheds_at_once():
+    pool = SlotPool('test_full', slots=1, queue_size=0)
+    held = pool.acquire()
+
+    with pytest.raises(Overloaded) as shed:
+        pool.acquire()
+    assert shed.value.status == 503
+    assert shed.value.reason == 'queue_full'
+    assert shed.value.work_class == 'test_full'
+    assert shed.value.retry_after >= 1
+    pool.release(held)
+
+def test_queued_caller_is_shed_when_the_wait_runs_out():
+    pool = SlotPool('test_timeout', slots=1, queue_size=1, max_wait=0.05)
+    held = pool.acquire()
+
+    with pytest.raises(Overloaded) as shed:
+        pool.acquire()
+    assert shed.value.reason == 'wait_timeout'
+    pool.release(held)
+
+def test_queued_caller_gets_the_released_slot():
+    pool = SlotPool('test_handoff', slots=1, queue_size=1, max_wait=5)
+    held = pool.acquire()
+    thread, result = acquire_in_thread(pool, shed=True)
+    wait_for(lambda: pool._waiting == 1)
+
+    pool.release(held)
+    thread.join(5)
+    assert 'acquired' in result
+    assert pool._in_use == 1
+
+def test_check_sheds_only_when_slots_and_queue_are_full():
+    pool = SlotPool('test_check', slots=1, queue_size=1, max_wait=5)
+    pool.check()
+    held = pool.acquire()
+    pool.check()  # a slot is busy but the queue has room
+    assert pool._in_use == 1
+
+    thread, _ = acquire_in_thread(pool, shed=True)
+    wait_for(lambda: pool._queued == 1)
+    with pytest.raises(Overloaded):
+        pool.check()
+    pool.release(held)
+    thread.join(5)
+
+def test_background_callers_wait_instead_of_being_shed():
+    pool = SlotPool('test_background', slots=1, queue_size=0, max_wait=0.01)
+    held = pool.acquire()
+    thread, result = acquire_in_thread(pool, shed=False)
+    time.sleep(0.1)  # well past max_wait
+    assert not result
+    # Background waiters do not fill the queue interactive callers are shed on
+    assert pool._queued == 0
+
+    pool.release(held)
+    thread.join(5)
+    assert 'acquired' in result
+
+def test_reserved_slots_stay_free_for_interactive_callers():
+    pool = SlotPool('test_reserved', slots=2, queue_size=0, reserved=1)
+    background = pool.acquire(shed=False)
+    thread, result = acquire_in_thread(pool, shed=False)
+    wait_for(lambda: pool._waiting == 1)
+
+    interactive = pool.acquire(shed=True)
+    assert pool._in_use == 2
+    assert not result
+
+    pool.release(interactive)
+    time.sleep(0.05)
+    assert not result  # the freed slot is the reserved one
+    pool.release(background)
+    thread.join(5)
+    assert 'acquired' in result
+
+def test_reserved_never_takes_every_slot():
+    pool = SlotPool('test_clamp', slots=2, queue_size=0, reserved=5)
+    assert pool.reserved == 1
+    pool.release(pool.acquire(shed=False))
+
+def test_admit_releases_on_error():
+    pool = SlotPool('test_admit', slots=1, queue_size=0)
+    with pytest.raises(RuntimeError):
+        with pool.admit():
+            assert pool._in_use == 1
+            raise RuntimeError("OCR failed")
+    assert pool._in_use == 0
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission.time, 'monotonic', clock)
+    return clock
+
+def test_rate_limit_per_minute(clock):
+    limiter = RateLimiter('test_minute', per_minute=2)
+    assert limiter.check('alice') == 0
+    assert limiter.check('alice') == 0
+    assert limiter.check('alice') == 30
+    assert limiter.check('bob') == 0
+
+    clock.now += 30
+    assert limiter.check('alice') == 0
+    assert limiter.check('alice') > 0
+
+def test_rate_limit_per_hour_applies_too(clock):
+    limiter = RateLimiter('test_hour', per_minute=10, per_hour=3)
+    for _ in range(3):
+        assert limiter.check('alice') == 0
+    clock.now += 60
+    # The minute budget has refilled, the hour budget has not
+    assert limiter.check('alice') > 60
+
+def test_refused_calls_do_not_spend_tokens(clock):
+    limiter = RateLimiter('test_refused', per_minute=1)
+    assert limiter.check('alice') == 0
+    for _ in range(5):
+        assert limiter.check('alice') > 0
+    clock.now += 60
+    assert limiter.check('alice') == 0
+
+def test_disabled_limits_and_missing_keys_are_allowed(clock):
+    assert RateLimiter('test_off').check('alice') == 0
+    limiter = RateLimiter('test_nokey', per_minute=1)
+    assert limiter.check(None) == 0
+    assert limiter.check(None) == 0
+
+def test_least_recently_used_keys_are_forgotten(clock):
+    limiter = RateLimiter('test_lru', per_minute=1, max_keys=2)
+    for key in ('a', 'b', 'c'):
+        assert limiter.check(key) == 0
+    # 'a' was evicted, so it starts with a full bucket; 'c' is still tracked
+    assert limiter.check('a') == 0
+    assert limiter.check('c') > 0
@@ -0,0 +1,107 @@
+import pytest
+
+import breaker
+from breaker import CircuitBreaker, CircuitOpen, CLOSED, OPEN, HALF_OPEN
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(breaker.time, 'monotonic', clock)
+    return clock
+
+def fail():
+    raise ConnectionError("upstream down")
+
+def trip(circuit, calls):
+    for _ in range(calls):
+        with pytest.raises(ConnectionError):
+            circuit.call(fail)
+
+def test_stays_closed_below_min_calls(clock):
+    circuit = CircuitBreaker('test', failure_rate=0.5, window=10, min_calls=4)
+    trip(circuit, 3)
+    assert circuit.state == CLOSED
+
+def test_opens_at_the_failure_rate_and_fails_fast(clock):
+    circuit = CircuitBreaker('test', failure_rate=0.5, window=10, min_calls=4, open_seconds=30)
+    circuit.call(lambda: 'ok')
+    circuit.call(lambda: 'ok')
+    trip(circuit, 2)
+    assert circuit.state == OPEN
+
+    calls = []
+    with pytest.raises(CircuitOpen) as refused:
+        circuit.call(lambda: calls.append(1))
+    assert calls == []
+    assert refused.value.name == 'test'
+    assert refused.value.retry_after == 30
+
+def test_failed_results_count_as_failures(clock):
+    circuit = CircuitBreaker('test', failure_rate=0.5, min_calls=2)
+    for _ in range(2):
+        assert circuit.call(lambda: 503, failed=lambda status: status >= 500) == 503
+    assert circuit.state == OPEN
+
+def test_slow_calls_open_the_circuit(clock):
+    circuit = CircuitBreaker('test', slow_seconds=1.0, slow_rate=0.5, min_calls=2)
+
+    def slow():
+        clock.now += 2
+        return 'late'
+
+    circuit.call(slow)
+    circuit.call(slow)
+    assert circuit.state == OPEN
+
+def test_half_open_probe_success_closes(clock):
+    circuit = CircuitBreaker('test', min_calls=2, open_seconds=30)
+    trip(circuit, 2)
+    clock.now += 31
+    assert circuit.state == HALF_OPEN
+
+    assert circuit.call(lambda: 'ok') == 'ok'
+    assert circuit.state == CLOSED
+    assert circuit.snapshot()['recent_calls'] == 0
+
+def test_half_open_probe_failure_reopens(clock):
+    circuit = CircuitBreaker('test', min_calls=2, open_seconds=30)
+    trip(circuit, 2)
+    clock.now += 31
+
+    trip(circuit, 1)
+    assert circuit.state == OPEN
+    with pytest.raises(CircuitOpen):
+        circuit.call(lambda: 'ok')
+
+def test_half_open_admits_only_the_configured_probes(clock):
+    circuit = CircuitBreaker('test', min_calls=2, open_seconds=30, probes=1)
+    trip(circuit, 2)
+    clock.now += 31
+
+    def probe():
+        # A second call while the probe is still running is refused
+        with pytest.raises(CircuitOpen):
+            circuit.call(lambda: 'ok')
+        return 'probed'
+
+    assert circuit.call(probe) == 'probed'
+    assert circuit.state == CLOSED
+
+def test_snapshot_reports_rates_and_retry_after(clock):
+    circuit = CircuitBreaker('test', min_calls=4, open_seconds=10)
+    circuit.call(lambda: 'ok')
+    trip(circuit, 1)
+    assert circuit.snapshot() == {'state': CLOSED, 'recent_calls': 2, 'failure_rate': 0.5, 'slow_rate': 0.0}
+
+    trip(circuit, 2)
+    clock.now += 4
+    snapshot = circuit.snapshot()
+    assert snapshot['state'] == OPEN
+    assert snapshot['retry_after'] == 6
@@ -0,0 +1,81 @@
+import zlib
+import struct
+
+import pytest
+
+import ocr_storage
+
+PAGES = [
+    "Q1. Define photosynthesis. (5 marks)",
+    "",
+    "Réponse : l'énergie lumineuse — 光合作用\nsecond line\n",
+    "x" * 5000,
+]
+
+CODECS = [
+    ocr_storage.CODEC_ZLIB,
+    pytest.param(ocr_storage.CODEC_ZSTD, marks=pytest.mark.skipif(
+        ocr_storage.zstandard is None, reason="zstandard is not installed")),
+]
+
+@pytest.mark.parametrize('codec', CODECS)
+@pytest.mark.parametrize('separator', ['\n', '\n\n', ''])
+def test_round_trip_reproduces_text_and_pages(codec, separator):
+    stored = ocr_storage.decode(ocr_storage.encode(PAGES, separator, codec=codec))
+
+    assert stored.codec == codec
+    assert stored.separator == separator
+    assert len(stored) == len(PAGES)
+    assert stored.pages() == PAGES
+    assert stored.page(2) == PAGES[2]
+    assert stored.text() == separator.join(PAGES)
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_empty_document(codec):
+    stored = ocr_storage.decode(ocr_storage.encode([], codec=codec))
+    assert len(stored) == 0
+    assert stored.text() == ''
+
+def test_version_1_layout_is_stable():
+    # Blobs stay in Snowflake indefinitely: a hand-built version 1 blob must keep decoding
+    pages = [zlib.compress("first page".encode('utf-8')), zlib.compress("zweite Seite".encode('utf-8'))]
+    blob = (b'P2DO' + bytes([1, ocr_storage.CODEC_ZLIB]) + struct.pack('>I', 2) + struct.pack('>H', 2) + b'\n\n'
+            + b''.join(struct.pack('>I', len(page)) for page in pages) + b''.join(pages))
+
+    assert ocr_storage.decode(blob).text() == "first page\n\nzweite Seite"
+    assert ocr_storage.encode(["first page", "zweite Seite"], '\n\n', codec=ocr_storage.CODEC_ZLIB)[:16] == blob[:16]
+
+def test_format_tag_names_version_and_codec():
+    assert ocr_storage.format_tag(ocr_storage.CODEC_ZLIB) == 'p2do1+zlib'
+    assert ocr_storage.format_tag(ocr_storage.CODEC_ZSTD) == 'p2do1+zstd'
+
+def test_rejects_other_formats():
+    blob = ocr_storage.encode(PAGES, codec=ocr_storage.CODEC_ZLIB)
+    with pytest.raises(ValueError):
+        ocr_storage.decode(b'XXXX' + blob[4:])
+    with pytest.raises(ValueError):
+        ocr_storage.decode(blob[:4] + bytes([2]) + blob[5:])
+
+def test_unknown_codec_fails_on_read():
+    blob = bytearray(ocr_storage.encode(["text"], codec=ocr_storage.CODEC_ZLIB))
+    blob[5] = 9
+    with pytest.raises(ValueError):
+        ocr_storage.decode(bytes(blob)).text()
+
+@pytest.mark.skipif(ocr_storage.zstandard is not None, reason="zstandard is installed")
+def test_zstd_blob_without_zstandard_is_a_clear_error():
+    blob = bytearray(ocr_storage.encode(["text"], codec=ocr_storage.CODEC_ZLIB))
+    blob[5] = ocr_storage.CODEC_ZSTD
+    with pytest.raises(ValueError, match='zstandard'):
+        ocr_storage.decode(bytes(blob)).text()
+
+def test_cached_text_prefers_the_blob():
+    blob = ocr_storage.encode(["it's page one", "page two"], codec=ocr_storage.CODEC_ZLIB)
+    assert ocr_storage.cached_text(blob, "stale legacy text") == "it's page one\npage two"
+
+def test_cached_text_reads_legacy_ocr_text():
+    # OCR_TEXT rows from before OCR_DATA were stored with doubled quotes
+    assert ocr_storage.cached_text(None, "the student''s answer") == "the student's answer"
+    assert ocr_storage.cached_text(b'', "plain") == "plain"
+    assert ocr_storage.cached_text(None, None) is None
+    assert ocr_storage.cached_text(None, '') is None
@@ -0,0 +1,40 @@
+from segmentation import pair_questions
+
+PAPER = (
+    "Q1. Define photosynthesis. (5 marks)\n"
+    "Q2. Explain the water cycle. (10 marks)\n"
+    "Q3. Name three greenhouse gases. (5 marks)"
+)
+
+def test_numbered_answers_pair_by_number():
+    answers = "Q3 carbon dioxide, methane, ozone\nQ1 plants make sugar from light\nQ2 evaporation, condensation, rain"
+    pairs = pair_questions(PAPER, answers)
+    assert [pair['label'] for pair in pairs] == ['Q1', 'Q2', 'Q3']
+    assert pairs[0]['answer'] == 'plants make sugar from light'
+    assert pairs[2]['answer'] == 'carbon dioxide, methane, ozone'
+    assert [pair['marks'] for pair in pairs] == [5, 10, 5]
+
+def test_unnumbered_answer_paragraphs_pair_by_block():
+    answers = (
+        "Plants make sugar from light.\n\n"
+        "Water evaporates, condenses and falls as rain.\n\n"
+        "Carbon dioxide, methane and ozone."
+    )
+    pairs = pair_questions(PAPER, answers)
+    assert [pair['label'] for pair in pairs] == ['Q1', 'Q2', 'Q3']
+    assert all(pair['answer'] for pair in pairs)
+    assert pairs[1]['answer'] == 'Water evaporates, condenses and falls as rain.'
+
+def test_unnumbered_answer_without_blocks_is_scored_whole():
+    answers = "Plants make sugar from light. Water evaporates and falls as rain. Carbon dioxide and methane."
+    pairs = pair_questions(PAPER, answers)
+    assert len(pairs) == 1
+    assert pairs[0]['label'] == 'All'
+    assert pairs[0]['answer'] == answers
+
+def test_partly_numbered_answers_are_not_dropped():
+    answers = "Plants make sugar from light.\nQ2 evaporation, condensation, rain\nCarbon dioxide and methane."
+    pairs = pair_questions(PAPER, answers)
+    assert len(pairs) == 1
+    assert pairs[0]['label'] == 'All'
+    assert 'Plants make sugar' in pairs[0]['answer'] and 'Carbon dioxide' in pairs[0]['answer']
@@ -0,0 +1,148 @@
+import os
+import time
+import hashlib
+import threading
+
+import pytest
+
+import metrics
+from singleflight import SingleFlight
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.01)
+
+def run_in_thread(func, *args):
+    result = {}
+    def target():
+        try:
+            result['value'] = func(*args)
+        except Exception as e:
+            result['error'] = e
+    thread = threading.Thread(target=target)
+    thread.start()
+    return thread, result
+
+def test_concurrent_callers_share_one_computation():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return {'text': 'ocr'}
+
+    leader, leader_result = run_in_thread(flight.do, 'test_share', 'doc', compute)
+    wait_for(lambda: calls)
+    follower, follower_result = run_in_thread(flight.do, 'test_share', 'doc', compute)
+    wait_for(lambda: metrics.SINGLE_FLIGHT_CALLS.value(resource='test_share', role='follower'))
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert len(calls) == 1
+    assert leader_result['value'] == follower_result['value'] == {'text': 'ocr'}
+
+def test_followers_get_the_leaders_exception():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def compute():
+        release.wait(5)
+        raise ValueError("OCR failed")
+
+    leader, leader_result = run_in_thread(flight.do, 'test_error', 'doc', compute)
+    wait_for(lambda: flight._in_flight)
+    follower, follower_result = run_in_thread(flight.do, 'test_error', 'doc', compute)
+    wait_for(lambda: metrics.SINGLE_FLIGHT_CALLS.value(resource='test_error', role='follower'))
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert isinstance(leader_result['error'], ValueError)
+    assert follower_result['error'] is leader_result['error']
+    # The failed key is not stuck: the next call runs again
+    assert flight.do('test_error', 'doc', lambda: 'ok') == 'ok'
+
+@pytest.mark.skipif(os.name != 'posix', reason="file locks need fcntl")
+def test_waiting_process_reuses_the_shared_result(tmp_path):
+    # Two instances on one directory stand in for two processes
+    first, second = SingleFlight(str(tmp_path)), SingleFlight(str(tmp_path))
+    release = threading.Event()
+    started = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append('first')
+        started.set()
+        release.wait(5)
+        return 'shared'
+
+    leader, _ = run_in_thread(first.do, 'test_cross', 'doc', slow)
+    started.wait(5)
+    waiter, waiter_result = run_in_thread(second.do, 'test_cross', 'doc', lambda: calls.append('second') or 'recomputed')
+    time.sleep(0.2)
+    release.set()
+    leader.join(5)
+    waiter.join(5)
+
+    assert calls == ['first']
+    assert waiter_result['value'] == 'shared'
+
+@pytest.mark.skipif(os.name != 'posix', reason="file locks need fcntl")
+def test_result_not_shared_recomputes(tmp_path):
+    first, second = SingleFlight(str(tmp_path)), SingleFlight(str(tmp_path))
+    release = threading.Event()
+    started = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append('first')
+        started.set()
+        release.wait(5)
+        return 'partial'
+
+    leader, leader_result = run_in_thread(first.do, 'test_noshare', 'doc', slow, None, lambda result: False)
+    started.wait(5)
+    waiter, waiter_result = run_in_thread(second.do, 'test_noshare', 'doc',
+                                          lambda: calls.append('second') or 'complete')
+    time.sleep(0.2)
+    release.set()
+    leader.join(5)
+    waiter.join(5)
+
+    assert leader_result['value'] == 'partial'
+    assert waiter_result['value'] == 'complete'
+    assert calls == ['first', 'second']
+
+@pytest.mark.skipif(os.name != 'posix', reason="file locks need fcntl")
+def test_different_keys_never_wait_for_each_other(tmp_path):
+    # Keys that landed on the same lock stripe used to serialize; pick two such keys
+    def stripe(key):
+        return int(hashlib.sha256(f"test_keys\0{key}".encode('utf-8')).hexdigest()[:8], 16) % 1024
+    keys = {}
+    for i in range(100000):
+        keys.setdefault(stripe(f"k{i}"), []).append(f"k{i}")
+        if len(keys[stripe(f"k{i}")]) == 2:
+            break
+    first_key, second_key = keys[stripe(f"k{i}")]
+
+    flight = SingleFlight(str(tmp_path))
+    barrier = threading.Barrier(2, timeout=5)
+
+    def compute(key):
+        # Both must be inside compute() at once for the barrier to pass
+        barrier.wait()
+        return key
+
+    a, a_result = run_in_thread(flight.do, 'test_keys', first_key, lambda: compute(first_key))
+    b, b_result = run_in_thread(flight.do, 'test_keys', second_key, lambda: compute(second_key))
+    a.join(10)
+    b.join(10)
+
+    assert a_result == {'value': first_key}
+    assert b_result == {'value': second_key}
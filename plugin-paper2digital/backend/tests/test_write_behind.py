@@ -0,0 +1,141 @@
+import os
+import time
+import subprocess
+import sys
+
+import pytest
+
+from write_behind import WriteBehindQueue, RetryLater, _owner
+
+@pytest.fixture
+def journal(tmp_path):
+    return str(tmp_path / 'journal.sqlite3')
+
+def run_due(queue):
+    """Run every job that is due now, in the calling thread"""
+    ran = 0
+    while True:
+        job = queue._next_due()
+        if job is None:
+            return ran
+        queue._execute(*job)
+        ran += 1
+
+def make_running(queue, job_id, owner, claimed_at):
+    with queue._lock:
+        queue._db.execute("UPDATE jobs SET state = 'running', claimed_by = ?, claimed_at = ? WHERE id = ?",
+                          (owner, claimed_at, job_id))
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+def test_job_runs_once_and_records_payload_changes(journal):
+    queue = WriteBehindQueue(journal)
+    seen = []
+
+    def handler(payload, blob):
+        seen.append((dict(payload), blob))
+        payload['solution_pdf'] = 'https://drive/link'
+
+    queue.register('persist', handler)
+    job_id = queue.submit('persist', {'assignment_id': 7}, blob=b'%PDF')
+    assert run_due(queue) == 1
+    assert run_due(queue) == 0
+
+    assert seen == [({'assignment_id': 7}, b'%PDF')]
+    status = queue.status(job_id)
+    assert status['state'] == 'done'
+    assert status['attempts'] == 1
+    assert status['payload']['solution_pdf'] == 'https://drive/link'
+    assert queue.pending() == 0
+
+def test_failures_retry_with_backoff_then_fail(journal):
+    queue = WriteBehindQueue(journal, max_attempts=2, base_delay=0.0)
+    queue.register('persist', lambda payload, blob: 1 / 0)
+    job_id = queue.submit('persist', {})
+
+    run_due(queue)
+    status = queue.status(job_id)
+    assert status['state'] == 'failed'
+    assert status['attempts'] == 2
+    assert 'ZeroDivisionError' in status['last_error']
+
+def test_retry_resumes_from_recorded_progress(journal):
+    queue = WriteBehindQueue(journal, base_delay=0.0)
+    uploads = []
+
+    def handler(payload, blob):
+        # The upload succeeds, then the database write after it fails once
+        if 'link' not in payload:
+            uploads.append(1)
+            payload['link'] = 'uploaded'
+            raise Exception("Assignment update failed")
+
+    queue.register('persist', handler)
+    job_id = queue.submit('persist', {})
+    run_due(queue)
+
+    assert len(uploads) == 1
+    assert queue.status(job_id)['state'] == 'done'
+    assert queue.status(job_id)['attempts'] == 2
+
+def test_retry_later_does_not_use_an_attempt(journal):
+    queue = WriteBehindQueue(journal, max_attempts=1)
+
+    def handler(payload, blob):
+        raise RetryLater(60, "drive circuit is open")
+
+    queue.register('persist', handler)
+    job_id = queue.submit('persist', {})
+    run_due(queue)
+
+    status = queue.status(job_id)
+    assert status['state'] == 'pending'
+    assert status['attempts'] == 0
+    assert status['last_error'].startswith('Deferred')
+    assert run_due(queue) == 0  # not due for another minute
+
+def test_two_queues_on_one_journal_never_claim_the_same_job(journal):
+    first, second = WriteBehindQueue(journal), WriteBehindQueue(journal)
+    first.submit('persist', {})
+
+    assert first._next_due() is not None
+    assert second._next_due() is None
+
+def test_live_owners_keep_their_claims(journal):
+    queue = WriteBehindQueue(journal)
+    job_id = queue.submit('persist', {})
+    # The parent process (pytest's runner) stands in for another live worker
+    make_running(queue, job_id, f"{_owner().rpartition(':')[0]}:{os.getppid()}", time.time())
+
+    reopened = WriteBehindQueue(journal)
+    assert reopened.recover() == 0
+    assert reopened.status(job_id)['state'] == 'running'
+
+def test_claims_of_dead_owners_are_requeued(journal):
+    queue = WriteBehindQueue(journal)
+    job_id = queue.submit('persist', {})
+    make_running(queue, job_id, f"{_owner().rpartition(':')[0]}:{dead_pid()}", time.time())
+
+    reopened = WriteBehindQueue(journal)
+    assert reopened.status(job_id)['state'] == 'pending'
+
+def test_claims_from_other_hosts_wait_for_the_lease(journal):
+    queue = WriteBehindQueue(journal, lease_seconds=60)
+    fresh = queue.submit('persist', {})
+    expired = queue.submit('persist', {})
+    make_running(queue, fresh, 'other-host:1234', time.time())
+    make_running(queue, expired, 'other-host:1234', time.time() - 120)
+
+    assert queue.recover() == 1
+    assert queue.status(fresh)['state'] == 'running'
+    assert queue.status(expired)['state'] == 'pending'
+
+def test_claim_left_by_an_earlier_process_with_our_pid_is_requeued(journal):
+    queue = WriteBehindQueue(journal)
+    job_id = queue.submit('persist', {})
+    make_running(queue, job_id, _owner(), time.time())
+
+    assert WriteBehindQueue(journal).status(job_id)['state'] == 'pending'
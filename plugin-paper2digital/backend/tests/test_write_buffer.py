@@ -0,0 +1,115 @@
+import metrics
+from breaker import CircuitOpen
+from write_buffer import WriteBuffer, RowsRejected
+
+class Warehouse:
+    """write_rows stand-in that records every batch it accepts"""
+    def __init__(self, reject=(), down=False):
+        self.reject = set(reject)
+        self.down = down
+        self.written = []
+        self.attempts = []
+
+    def write_rows(self, rows):
+        self.attempts.append(list(rows))
+        if self.down == 'circuit':
+            raise CircuitOpen('snowflake', 5)
+        if self.down:
+            return False
+        if self.reject.intersection(rows):
+            raise RowsRejected("Numeric value 'x' is not recognized")
+        self.written.extend(rows)
+        return True
+
+def make_buffer(name, warehouse, **options):
+    # A long max_delay keeps the background thread idle; the tests flush by hand
+    options = dict(dict(max_rows=100, max_delay=3600, base_backoff=0.0), **options)
+    return WriteBuffer(name, warehouse.write_rows, **options)
+
+def flush_until_empty(buffer, rounds=20):
+    for _ in range(rounds):
+        if not buffer.pending():
+            return
+        buffer._flush_batch()
+
+def test_reads_see_pending_rows_until_written():
+    warehouse = Warehouse()
+    buffer = make_buffer('test_overlay', warehouse)
+    buffer.add('doc', 'old text')
+    buffer.add('doc', 'new text')
+
+    assert buffer.get('doc') == 'new text'
+    assert buffer.pending() == 1
+    assert buffer.flush()
+    assert buffer.get('doc') is None
+    assert warehouse.written == ['new text']
+    buffer.close()
+
+def test_rejected_row_is_isolated_and_dropped():
+    warehouse = Warehouse(reject={'bad'})
+    buffer = make_buffer('test_reject', warehouse, split_after=2)
+    for row in ('a', 'bad', 'c'):
+        buffer.add(row, row)
+
+    flush_until_empty(buffer)
+
+    assert buffer.pending() == 0
+    assert sorted(warehouse.written) == ['a', 'c']
+    assert metrics.WRITE_BUFFER_DROPPED.value(buffer='test_reject', reason='failed') == 1
+    buffer.close()
+
+def test_outage_keeps_rows_and_batch_size():
+    warehouse = Warehouse(down=True)
+    buffer = make_buffer('test_outage', warehouse, split_after=1, max_backoff=0.0)
+    for row in ('a', 'b', 'c'):
+        buffer.add(row, row)
+
+    for _ in range(5):
+        assert not buffer._flush_batch()
+
+    assert buffer.pending() == 3
+    assert all(len(batch) == 3 for batch in warehouse.attempts)
+    assert metrics.WRITE_BUFFER_DROPPED.value(buffer='test_outage', reason='failed') == 0
+
+    warehouse.down = False
+    assert buffer.flush()
+    assert sorted(warehouse.written) == ['a', 'b', 'c']
+    buffer.close()
+
+def test_open_circuit_is_an_outage_not_bad_data():
+    warehouse = Warehouse(down='circuit')
+    buffer = make_buffer('test_circuit', warehouse, split_after=1, max_backoff=0.0)
+    buffer.add('a', 'a')
+    buffer.add('b', 'b')
+
+    for _ in range(5):
+        buffer._flush_batch()
+
+    assert buffer.pending() == 2
+    warehouse.down = False
+    buffer.close()
+    assert sorted(warehouse.written) == ['a', 'b']
+
+def test_oldest_rows_are_dropped_beyond_max_pending():
+    warehouse = Warehouse(down=True)
+    buffer = make_buffer('test_overflow', warehouse, max_rows=2, max_pending=2, base_backoff=60.0)
+    for row in ('a', 'b', 'c'):
+        buffer.add(row, row)
+
+    assert buffer.pending() == 2
+    assert buffer.get('a') is None
+    assert buffer.get('c') == 'c'
+    assert metrics.WRITE_BUFFER_DROPPED.value(buffer='test_overflow', reason='overflow') == 1
+    warehouse.down = False
+    buffer.close()
+
+def test_close_writes_what_is_left():
+    warehouse = Warehouse()
+    buffer = make_buffer('test_close', warehouse)
+    buffer.add('a', 'a')
+    buffer.add('b', 'b')
+
+    buffer.close()
+
+    assert sorted(warehouse.written) == ['a', 'b']
+    assert buffer.pending() == 0
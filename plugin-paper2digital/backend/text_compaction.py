@@ -0,0 +1,132 @@
+"""
+Post-OCR compaction of page texts from lecture PDFs and course handouts.
+
+Slides and scanned handouts repeat the same header, footer, page number and
+slide title on every page. This stage removes them, keeping the first
+occurrence. It also rejoins words hyphenated across line breaks, collapses
+whitespace and drops pages that are near-duplicates of an earlier page
+(e.g. incremental slide builds).
+
+Numbers are masked when lines are compared, so "Page 3" and "Page 4" count as
+the same footer. Numbered labels ("Q2", "2.", "Example 3", "Step 1") and
+marks ("(10 marks)") are content, not boilerplate, and are always kept. Near-duplicates are found by comparing
+5-word shingle sets with Jaccard similarity. The returned stats report how
+much smaller the text became.
+"""
+import re
+from collections import Counter, defaultdict
+
+# A short line is boilerplate when it appears on at least this share of pages (and at least MIN_REPEAT_PAGES)
+REPEAT_FRACTION = 0.5
+MIN_REPEAT_PAGES = 3
+MAX_BOILERPLATE_CHARS = 80
+# Lines at the top of a page that repeat the previous page's top lines are continued slide titles
+TITLE_LINES = 2
+SHINGLE_SIZE = 5
+DUPLICATE_SIMILARITY = 0.9
+PAGE_SEPARATOR = '\n\n'
+
+# Matched against the line itself, so a "2." or "2)" question label is not a page number
+PAGE_NUMBER = re.compile(r'^(?:page|slide|p\.?)?\s*\d+\s*(?:(?:of|/)\s*\d+)?$', re.IGNORECASE)
+LABEL = re.compile(
+    r'^\(?\d{1,3}[.)]'
+    r'|^(?:q|ques(?:tion)?|ans(?:wer)?|example|ex|exercise|problem|step|part|case)\.?\s*\(?\d{1,3}\b'
+    r'|\d{1,3}\s*(?:marks?|points?|pts)\b|\[\s*\d{1,3}\s*\]',
+    re.IGNORECASE
+)
+HYPHENATED_BREAK = re.compile(r'(\w)-[ \t]*\n[ \t]*([a-z])')
+SPACES = re.compile(r'[ \t\u00a0]+')
+BLANK_LINES = re.compile(r'\n{3,}')
+
+def line_signature(line):
+    """Comparison key for a line: case-folded, digits masked, whitespace collapsed"""
+    return SPACES.sub(' ', re.sub(r'\d+', '#', line.casefold())).strip(' .-|:')
+
+def normalize_page(text):
+    text = HYPHENATED_BREAK.sub(r'\1\2', text or '')
+    lines = [SPACES.sub(' ', line).strip() for line in text.split('\n')]
+    return BLANK_LINES.sub('\n\n', '\n'.join(lines)).strip()
+
+def _shingles(text):
+    words = re.findall(r'\w+', text.casefold())
+    if len(words) < SHINGLE_SIZE:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+def _strip_boilerplate(pages):
+    """Drop repeated header/footer/page-number/title lines; returns (pages, lines removed)"""
+    page_lines = [page.split('\n') for page in pages]
+    # Labels get no signature, so they are never counted as repeated or as titles
+    page_signatures = [['' if LABEL.search(line) else line_signature(line) for line in lines]
+                       for lines in page_lines]
+
+    frequency = Counter()
+    for signatures in page_signatures:
+        frequency.update(set(sig for sig in signatures if sig and len(sig) <= MAX_BOILERPLATE_CHARS))
+    threshold = max(MIN_REPEAT_PAGES, REPEAT_FRACTION * len(pages))
+    repeated = {sig for sig, count in frequency.items() if count >= threshold}
+
+    seen = set()
+    previous_titles = set()
+    removed = 0
+    result = []
+    for lines, signatures in zip(page_lines, page_signatures):
+        titles = set([sig for sig in signatures if sig and len(sig) <= MAX_BOILERPLATE_CHARS][:TITLE_LINES])
+        kept = []
+        for line, sig in zip(lines, signatures):
+            if PAGE_NUMBER.match(line) or (sig and ((sig in repeated and sig in seen)
+                                                    or (sig in titles and sig in previous_titles))):
+                removed += 1
+                continue
+            seen.add(sig)
+            kept.append(line)
+        previous_titles = titles
+        result.append('\n'.join(kept).strip())
+    return result, removed
+
+def _drop_near_duplicates(pages):
+    """Remove empty pages and pages whose shingles mostly match an earlier kept page"""
+    kept = []
+    kept_sizes = []
+    index = defaultdict(list)  # shingle -> positions in kept
+    for page in pages:
+        shingles = _shingles(page)
+        if not shingles:
+            continue
+        shared = Counter()
+        for shingle in shingles:
+            for position in index[shingle]:
+                shared[position] += 1
+        duplicate = any(
+            count / (len(shingles) + kept_sizes[position] - count) >= DUPLICATE_SIMILARITY
+            for position, count in shared.items()
+        )
+        if duplicate:
+            continue
+        for shingle in shingles:
+            index[shingle].append(len(kept))
+        kept.append(page)
+        kept_sizes.append(len(shingles))
+    return kept
+
+def compact_page_list(page_texts):
+    """Compact one document's page texts; returns (kept pages, stats), the pages joined by PAGE_SEPARATOR"""
+    chars_in = sum(len(text or '') for text in page_texts)
+    pages = [normalize_page(text) for text in page_texts]
+    pages, lines_removed = _strip_boilerplate(pages)
+    pages = _drop_near_duplicates(pages)
+    chars_out = sum(len(page) for page in pages) + len(PAGE_SEPARATOR) * max(0, len(pages) - 1)
+    stats = {
+        'pages_in': len(page_texts),
+        'pages_out': len(pages),
+        'lines_removed': lines_removed,
+        'chars_in': chars_in,
+        'chars_out': chars_out,
+        'ratio': round(chars_out / chars_in, 3) if chars_in else 1.0
+    }
+    return pages, stats
+
+def compact_pages(page_texts):
+    """Compact one document's page texts; returns (text, stats)"""
+    pages, stats = compact_page_list(page_texts)
+    return PAGE_SEPARATOR.join(pages), stats
@@ -0,0 +1,313 @@
+"""
+Per-request tracing and sampled profiling for the Paper2Digital backend.
+
+Every request gets a trace with a span tree (route -> process_course_materials
+-> get_cached_ocr / download_pdf / extract_text_from_file -> call_gemini ...).
+The trace id is attached to every log record and returned in the X-Trace-Id
+header. A caller-supplied id (X-Request-ID) is used only if it is a short
+token of letters, digits, '-' and '_', since it also names profile files. Recent traces are kept in a ring buffer.
+
+Profiling is opt-in. A sampled share of requests runs a stack sampler (or
+cProfile) plus optional tracemalloc snapshots. When such a request exceeds
+the slow threshold, a flamegraph-ready collapsed-stack file, the span tree and
+the allocation diff are written to PROFILE_DIR.
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import logging
+import threading
+import functools
+import contextvars
+from collections import deque, Counter
+
+logger = logging.getLogger(__name__)
+
+TRACE_BUFFER_SIZE = int(os.getenv('TRACE_BUFFER_SIZE', 200))
+TRACE_SLOW_MS = float(os.getenv('TRACE_SLOW_MS', 5000))
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_MODE = os.getenv('PROFILE_MODE', 'sampler')  # sampler or cprofile
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', 10))
+PROFILE_TRACEMALLOC = os.getenv('PROFILE_TRACEMALLOC', 'False').lower() == 'true'
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+TRACE_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+_recent_traces = deque(maxlen=TRACE_BUFFER_SIZE)
+_slow_traces = deque(maxlen=TRACE_BUFFER_SIZE)
+_buffer_lock = threading.Lock()
+
+# ----------------- Spans and Traces -----------------
+class Span:
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.children = []
+        self.start = time.perf_counter()
+        self.end = None
+        self.error = None
+        if parent is not None:
+            parent.children.append(self)
+
+    @property
+    def duration_ms(self):
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self, origin):
+        return {
+            'name': self.name,
+            'start_ms': round((self.start - origin) * 1000, 2),
+            'duration_ms': round(self.duration_ms, 2),
+            'attributes': self.attributes,
+            'error': self.error,
+            'children': [child.to_dict(origin) for child in self.children]
+        }
+
+class Trace:
+    def __init__(self, name, trace_id=None, attributes=None):
+        if not (trace_id and TRACE_ID_PATTERN.fullmatch(trace_id)):
+            trace_id = uuid.uuid4().hex[:16]
+        self.trace_id = trace_id
+        self.timestamp = time.time()
+        self.root = Span(name, attributes=attributes)
+        self.profiler = None
+        self.profile_files = {}
+
+    @property
+    def duration_ms(self):
+        return self.root.duration_ms
+
+    def summary(self):
+        return {
+            'trace_id': self.trace_id,
+            'name': self.root.name,
+            'timestamp': self.timestamp,
+            'duration_ms': round(self.duration_ms, 2),
+            'status': self.root.attributes.get('status'),
+            'profiled': bool(self.profile_files)
+        }
+
+    def to_dict(self):
+        data = self.summary()
+        data['root'] = self.root.to_dict(self.root.start)
+        data['profile_files'] = sorted(self.profile_files)
+        return data
+
+def current_trace_id():
+    trace = _current_trace.get()
+    return trace.trace_id if trace else None
+
+def current_span():
+    return _current_span.get()
+
+def start_trace(name, trace_id=None, **attributes):
+    """Begin a trace for the current request; returns the trace"""
+    trace = Trace(name, trace_id, attributes)
+    _current_trace.set(trace)
+    _current_span.set(trace.root)
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        trace.profiler = _start_profiler()
+    return trace
+
+def finish_trace(**attributes):
+    """Close the current trace, store it and dump profiles if it was slow"""
+    trace = _current_trace.get()
+    if trace is None:
+        return None
+    trace.root.set(**attributes)
+    trace.root.end = time.perf_counter()
+    _current_trace.set(None)
+    _current_span.set(None)
+
+    profile = trace.profiler.stop() if trace.profiler else None
+    slow = trace.duration_ms >= TRACE_SLOW_MS
+
+    with _buffer_lock:
+        _recent_traces.append(trace)
+        if slow:
+            _slow_traces.append(trace)
+
+    if slow:
+        logger.warning(f"Slow request {trace.root.name} took {trace.duration_ms:.0f} ms (trace {trace.trace_id})")
+        if profile:
+            _write_profile(trace, profile)
+    return trace
+
+class _SpanContext:
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.span = None
+        self.token = None
+
+    def __enter__(self):
+        parent = _current_span.get()
+        if parent is None:
+            return None
+        self.span = Span(self.name, parent, self.attributes)
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.span is not None:
+            self.span.end = time.perf_counter()
+            if exc is not None:
+                self.span.error = f"{exc_type.__name__}: {exc}"
+            _current_span.reset(self.token)
+        return False
+
+def span(name, **attributes):
+    """Context manager for a child span; a no-op outside a traced request"""
+    return _SpanContext(name, attributes)
+
+def traced(name=None):
+    """Decorator that wraps a function call in a span"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return func(*args, **kwargs)
+            with _SpanContext(span_name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def wrap(func):
+    """Carry the current trace context into a worker thread"""
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        # A context can only be entered by one thread at a time, and the wrapper
+        # may run concurrently (e.g. under executor.map), so each call gets a copy
+        return context.copy().run(func, *args, **kwargs)
+    return wrapper
+
+def recent_traces(slow_only=False, limit=50):
+    with _buffer_lock:
+        source = list(_slow_traces if slow_only else _recent_traces)
+    return [t.summary() for t in reversed(source)][:limit]
+
+def get_trace(trace_id):
+    with _buffer_lock:
+        for trace in list(_recent_traces) + list(_slow_traces):
+            if trace.trace_id == trace_id:
+                return trace
+    return None
+
+# ----------------- Logging -----------------
+def install_log_record_factory():
+    """Add %(trace_id)s to every log record"""
+    previous = logging.getLogRecordFactory()
+    if getattr(previous, '_adds_trace_id', False):
+        return
+
+    def factory(*args, **kwargs):
+        record = previous(*args, **kwargs)
+        record.trace_id = current_trace_id() or '-'
+        return record
+
+    factory._adds_trace_id = True
+    logging.setLogRecordFactory(factory)
+
+# ----------------- Profiling -----------------
+class _StackSampler:
+    """Samples one thread's stack at a fixed interval into collapsed-stack counts"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+class _Profiler:
+    def __init__(self):
+        self.sampler = None
+        self.cprofile = None
+        self.snapshot = None
+        if PROFILE_MODE == 'cprofile':
+            import cProfile
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        else:
+            self.sampler = _StackSampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000.0)
+        if PROFILE_TRACEMALLOC:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(25)
+            self.snapshot = tracemalloc.take_snapshot()
+
+    def stop(self):
+        result = {}
+        if self.sampler:
+            result['collapsed'] = self.sampler.stop()
+        if self.cprofile:
+            self.cprofile.disable()
+            result['pstats'] = self.cprofile
+        if self.snapshot is not None:
+            import tracemalloc
+            diff = tracemalloc.take_snapshot().compare_to(self.snapshot, 'lineno')
+            result['tracemalloc'] = "\n".join(str(stat) for stat in diff[:50])
+        return result
+
+def _start_profiler():
+    try:
+        return _Profiler()
+    except Exception as e:
+        logger.error(f"Failed to start profiler: {e}")
+        return None
+
+def _write_profile(trace, profile):
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, trace.trace_id)
+        if profile.get('collapsed'):
+            # Feed to flamegraph.pl or load into speedscope as-is
+            trace.profile_files['collapsed'] = base + '.collapsed'
+            with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+                f.write(profile['collapsed'])
+        if profile.get('pstats'):
+            trace.profile_files['pstats'] = base + '.pstats'
+            profile['pstats'].dump_stats(base + '.pstats')
+        if profile.get('tracemalloc'):
+            trace.profile_files['tracemalloc'] = base + '.tracemalloc.txt'
+            with open(base + '.tracemalloc.txt', 'w', encoding='utf-8') as f:
+                f.write(profile['tracemalloc'])
+        trace.profile_files['trace'] = base + '.trace.json'
+        with open(base + '.trace.json', 'w', encoding='utf-8') as f:
+            json.dump(trace.to_dict(), f, indent=2)
+        logger.info(f"Profile for trace {trace.trace_id} written to {PROFILE_DIR}")
+    except Exception as e:
+        logger.error(f"Failed to write profile for trace {trace.trace_id}: {e}")
@@ -0,0 +1,122 @@
+"""
+Speculative warm-up of course material between chat turns.
+
+Selecting a course or chapter is almost always followed by a question that
+needs that material. Selection therefore queues background loads (OCR cache
+reads or OCR itself, stored summaries) on a small bounded executor. Results
+land in an in-process TTL cache, so the question is answered from memory.
+
+Loads are keyed, so sessions selecting the same course share one load. A
+foreground request that needs a key joins a load already running, and takes
+over one still waiting in the queue instead of waiting behind other keys.
+"""
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+class TTLCache:
+    """LRU cache whose entries expire ttl_seconds after they were stored"""
+
+    def __init__(self, max_entries, ttl_seconds, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, stale=False):
+        """Stored value, or None if absent or expired; stale=True also returns expired entries"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= self.clock() and not stale:
+                # Kept (until evicted) as a fallback for stale reads
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0 or self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+class Prefetcher:
+    """Bounded background loader that deduplicates by key and hands queued work to foreground callers"""
+
+    def __init__(self, max_workers, max_pending):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='prefetch')
+        self._lock = threading.Lock()
+        self._queued = {}   # key -> load not yet started
+        self._running = {}  # key -> Future of a load in progress
+
+    def prefetch(self, key, load):
+        """Queue load() for key; returns 'queued', 'duplicate' or 'dropped' (queue full)"""
+        with self._lock:
+            if key in self._queued or key in self._running:
+                result = 'duplicate'
+            elif len(self._queued) >= self.max_pending:
+                result = 'dropped'
+            else:
+                self._queued[key] = load
+                result = 'queued'
+        metrics.PREFETCH_REQUESTS.inc(result=result)
+        if result == 'queued':
+            self._executor.submit(self._run_queued, key)
+        return result
+
+    def _run_queued(self, key):
+        with self._lock:
+            load = self._queued.pop(key, None)
+            if load is None:
+                return  # a foreground caller already took it over
+            future = self._running[key] = Future()
+        self._complete(key, future, load)
+        if future.exception() is not None:
+            logger.warning(f"Prefetch of {key} failed: {future.exception()}")
+
+    def _complete(self, key, future, load):
+        try:
+            future.set_result(load())
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._running.pop(key, None)
+
+    def run(self, key, load):
+        """load() for key in the caller's thread, or the result of the same load already running"""
+        with self._lock:
+            future = self._running.get(key)
+            leader = future is None
+            if leader:
+                self._queued.pop(key, None)
+                future = self._running[key] = Future()
+        if leader:
+            self._complete(key, future, load)
+        else:
+            metrics.CACHE_REQUESTS.inc(cache='materials', result='in_flight')
+        return future.result()
+
+    def pending(self):
+        with self._lock:
+            return len(self._queued) + len(self._running)
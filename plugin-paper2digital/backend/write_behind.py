@@ -0,0 +1,245 @@
+"""
+Durable write-behind queue for work a response does not have to wait for.
+
+Jobs are journaled to a local SQLite file before the request returns, then
+run by a background thread. A failed job is retried with exponential backoff
+until it succeeds or runs out of attempts; jobs still pending when the
+process stops are picked up again on the next start.
+
+Several processes may share one journal. A process claims a job by marking
+it running with its owner (host and pid) and the claim time. A running job
+goes back to the queue only when its owner is no longer alive on this host,
+or when the claim is older than lease_seconds (owners on other hosts cannot
+be checked), so a job is not run twice while its owner is still at it.
+
+Handlers receive the job's payload dict and may update it in place. The
+payload is saved after every attempt, so a handler can record progress
+(e.g. a Drive link that was already uploaded) and skip finished steps when
+it is retried. A handler that raises RetryLater (e.g. while the upstream's
+circuit breaker is open) is rescheduled without using up an attempt.
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    blob BLOB,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    claimed_by TEXT,
+    claimed_at REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs (state, next_attempt_at);
+"""
+
+class RetryLater(Exception):
+    def __init__(self, delay, reason=''):
+        super().__init__(reason or f"retry in {delay}s")
+        self.delay = delay
+
+RECOVER_EVERY = 30
+
+def _owner():
+    # Looked up on every claim: the pid changes when a server forks its workers
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class WriteBehindQueue:
+    def __init__(self, path, max_attempts=8, base_delay=2.0, max_delay=300.0, poll_interval=1.0,
+                 lease_seconds=900.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._current = None  # id of the job this process is running
+        self._recovered_at = 0.0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self.recover()
+        metrics.WRITE_BEHIND_PENDING.set_function(self.pending)
+
+    def register(self, kind, handler):
+        """handler(payload, blob) runs the job; raising schedules a retry, RetryLater one that is not counted"""
+        self._handlers[kind] = handler
+
+    def submit(self, kind, payload, blob=None):
+        """Journal a job and return its id; it runs once the call returns"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, kind, payload, blob, next_attempt_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), blob, now, now, now)
+            )
+        self._wake.set()
+        return job_id
+
+    def status(self, job_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT kind, payload, state, attempts, last_error FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            'job_id': job_id,
+            'kind': row[0],
+            'state': row[2],
+            'attempts': row[3],
+            'last_error': row[4],
+            'payload': json.loads(row[1])
+        }
+
+    def pending(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state IN ('pending', 'running')"
+            ).fetchone()[0]
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _claim_is_stale(self, job_id, owner, claimed_at, now):
+        if claimed_at is None or now - claimed_at > self.lease_seconds:
+            return True
+        host, _, pid = (owner or '').rpartition(':')
+        if host != socket.gethostname() or not pid.isdigit():
+            return False
+        pid = int(pid)
+        if pid == os.getpid():
+            # A claim from an earlier process that had this pid (e.g. pid 1 in a container)
+            return job_id != self._current
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+        return False
+
+    def recover(self):
+        """Put running jobs whose owner has died or whose lease ran out back in the queue; returns how many"""
+        now = time.time()
+        self._recovered_at = now
+        with self._lock:
+            running = self._db.execute(
+                "SELECT id, claimed_by, claimed_at FROM jobs WHERE state = 'running'"
+            ).fetchall()
+            recovered = 0
+            for job_id, owner, claimed_at in running:
+                if not self._claim_is_stale(job_id, owner, claimed_at, now):
+                    continue
+                recovered += self._db.execute(
+                    "UPDATE jobs SET state = 'pending', claimed_by = NULL, claimed_at = NULL, updated_at = ? "
+                    "WHERE id = ? AND state = 'running' AND claimed_by IS ? AND claimed_at IS ?",
+                    (now, job_id, owner, claimed_at)
+                ).rowcount
+        if recovered:
+            logger.warning(f"Write-behind re-queued {recovered} jobs whose claim had lapsed")
+        return recovered
+
+    def _next_due(self):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, kind, payload, blob, attempts FROM jobs "
+                "WHERE state = 'pending' AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT 1",
+                (time.time(),)
+            ).fetchone()
+            if row is None:
+                return None
+            # Conditional claim, so two processes sharing the journal never run the same job
+            now = time.time()
+            claimed = self._db.execute(
+                "UPDATE jobs SET state = 'running', claimed_by = ?, claimed_at = ?, updated_at = ? "
+                "WHERE id = ? AND state = 'pending'",
+                (_owner(), now, now, row[0])
+            ).rowcount
+            if claimed:
+                self._current = row[0]
+        return row if claimed else None
+
+    def _run(self):
+        while not self._stop.is_set():
+            if time.time() - self._recovered_at >= RECOVER_EVERY:
+                self.recover()
+            job = self._next_due()
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self._execute(*job)
+
+    def _execute(self, job_id, kind, payload_json, blob, attempts):
+        payload = json.loads(payload_json)
+        attempts += 1
+        handler = self._handlers.get(kind)
+        try:
+            if handler is None:
+                raise RuntimeError(f"No handler registered for {kind}")
+            handler(payload, blob)
+            state, next_attempt_at, error = 'done', time.time(), None
+            # The body is no longer needed once the job has succeeded
+            blob = None
+            metrics.WRITE_BEHIND_JOBS.inc(kind=kind, result='done')
+        except RetryLater as e:
+            attempts -= 1
+            state, next_attempt_at, error = 'pending', time.time() + e.delay, f"Deferred: {e}"
+            metrics.WRITE_BEHIND_JOBS.inc(kind=kind, result='deferred')
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if attempts >= self.max_attempts:
+                state, next_attempt_at = 'failed', time.time()
+                metrics.WRITE_BEHIND_JOBS.inc(kind=kind, result='failed')
+                logger.error(f"Write-behind job {job_id} ({kind}) failed after {attempts} attempts: {error}")
+            else:
+                delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+                state, next_attempt_at = 'pending', time.time() + delay
+                metrics.WRITE_BEHIND_JOBS.inc(kind=kind, result='retry')
+                logger.warning(f"Write-behind job {job_id} ({kind}) attempt {attempts} failed, retrying in {delay:.0f}s: {error}")
+        with self._lock:
+            self._current = None
+            # Only while the claim is still ours: a lapsed one may have been re-queued and claimed again
+            updated = self._db.execute(
+                "UPDATE jobs SET payload = ?, blob = ?, state = ?, attempts = ?, next_attempt_at = ?, "
+                "last_error = ?, claimed_by = NULL, claimed_at = NULL, updated_at = ? WHERE id = ? AND claimed_by = ?",
+                (json.dumps(payload), blob, state, attempts, next_attempt_at, error, time.time(), job_id, _owner())
+            ).rowcount
+        if not updated:
+            logger.warning(f"Write-behind job {job_id} ({kind}) finished after its claim lapsed")
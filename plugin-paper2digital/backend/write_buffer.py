@@ -0,0 +1,168 @@
+"""
+Batched write-behind buffer for warehouse upserts.
+
+Requests hand rows to the buffer and return without waiting for the
+warehouse. A background thread writes them as one multi-row statement once
+max_rows are pending or the oldest row has waited max_delay seconds. A newer
+row for a key that is still pending replaces the older one, so every key is
+written once per batch. A failed write keeps its rows and is retried with
+exponential backoff. When write_rows raises RowsRejected (the warehouse
+refused the data itself) split_after times in a row, the batch is halved so
+one bad row cannot hold back the rest; a single row that keeps being
+rejected is dropped and logged. Any other failure (an outage, an open
+circuit) only backs off, and the rows wait for the warehouse. At most max_pending rows are held, the oldest
+being dropped beyond that, so these buffers suit data that can be rebuilt
+(caches), not writes that must not be lost. close(), registered with atexit,
+writes what is left.
+
+Until its row is written, get(key) returns it, so reads see pending writes.
+"""
+import time
+import atexit
+import itertools
+import logging
+import threading
+from collections import OrderedDict
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+class RowsRejected(Exception):
+    """Raised by write_rows when the warehouse refused the rows, as opposed to being unreachable"""
+
+class WriteBuffer:
+    def __init__(self, name, write_rows, max_rows=100, max_delay=2.0, base_backoff=1.0, max_backoff=60.0,
+                 max_pending=10000, split_after=3):
+        """write_rows(rows) writes a batch and returns True on success; it raises RowsRejected for bad data"""
+        self.name = name
+        self.write_rows = write_rows
+        self.max_rows = max(1, max_rows)
+        self.max_delay = max_delay
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.max_pending = max(self.max_rows, max_pending)
+        self.split_after = max(1, split_after)
+        self._pending = OrderedDict()  # key -> (row, first queued at), oldest first
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._batch_rows = self.max_rows  # shrinks while writes keep failing
+        self._failures = 0
+        self._rejections = 0
+        self._retry_at = 0.0
+        self._stopped = False
+        metrics.WRITE_BUFFER_PENDING.set_function(self.pending, buffer=name)
+        self._thread = threading.Thread(target=self._run, name=f'write-buffer-{name}', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, key, row):
+        with self._cond:
+            entry = self._pending.get(key)
+            # A replaced row keeps its place (and age) in the queue
+            self._pending[key] = (row, entry[1] if entry else time.monotonic())
+            if len(self._pending) > self.max_pending:
+                dropped, _ = self._pending.popitem(last=False)
+                metrics.WRITE_BUFFER_DROPPED.inc(buffer=self.name, reason='overflow')
+                logger.warning(f"Write buffer {self.name} is full ({self.max_pending} rows), dropped {dropped}")
+            # Wake the flusher to start the age timer, or to write a full batch
+            if len(self._pending) == 1 or len(self._pending) >= self.max_rows:
+                self._cond.notify()
+
+    def get(self, key):
+        """The pending row for key, or None once it has been written"""
+        with self._cond:
+            entry = self._pending.get(key)
+            return entry[0] if entry else None
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def _due(self):
+        if not self._pending:
+            return None
+        if len(self._pending) >= self.max_rows:
+            return self._retry_at
+        oldest = next(iter(self._pending.values()))[1]
+        return max(oldest + self.max_delay, self._retry_at)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    now = time.monotonic()
+                    due = self._due()
+                    if due is not None and due <= now:
+                        break
+                    self._cond.wait(None if due is None else due - now)
+                if self._stopped:
+                    return
+            self._flush_batch()
+
+    def _flush_batch(self):
+        """Write a batch of the oldest pending rows; returns False if the write failed"""
+        with self._flush_lock:
+            with self._cond:
+                batch = list(itertools.islice(self._pending.items(), self._batch_rows))
+            if not batch:
+                return True
+            rejected = False
+            try:
+                ok = self.write_rows([row for _, (row, _) in batch])
+            except RowsRejected as e:
+                logger.error(f"Write buffer {self.name} batch of {len(batch)} rows was rejected: {e}")
+                ok, rejected = False, True
+            except Exception as e:
+                logger.error(f"Write buffer {self.name} flush failed: {e}")
+                ok = False
+            metrics.WRITE_BUFFER_FLUSHES.inc(buffer=self.name, result='ok' if ok else 'rejected' if rejected else 'error')
+            with self._cond:
+                if ok:
+                    metrics.WRITE_BUFFER_ROWS.inc(len(batch), buffer=self.name)
+                    for key, entry in batch:
+                        # Rows replaced while the batch was being written stay pending
+                        if self._pending.get(key) is entry:
+                            del self._pending[key]
+                    self._batch_rows = min(self.max_rows, self._batch_rows * 2)
+                    self._failures = self._rejections = 0
+                    self._retry_at = 0.0
+                else:
+                    self._failures += 1
+                    delay = min(self.max_backoff, self.base_backoff * 2 ** (self._failures - 1))
+                    if rejected:
+                        self._rejections += 1
+                    # Only the data's fault is worth splitting for; during an outage every row would fail
+                    if rejected and self._rejections >= self.split_after:
+                        if len(batch) > 1:
+                            # Look for the row that fails in a smaller batch
+                            self._batch_rows = max(1, len(batch) // 2)
+                        else:
+                            key, entry = batch[0]
+                            if self._pending.get(key) is entry:
+                                del self._pending[key]
+                            metrics.WRITE_BUFFER_DROPPED.inc(buffer=self.name, reason='failed')
+                            logger.error(f"Write buffer {self.name} dropped {key} after {self._rejections} rejected writes")
+                        self._failures = self._rejections = 0
+                        delay = self.base_backoff
+                    self._retry_at = time.monotonic() + delay
+            return ok
+
+    def flush(self):
+        """Write everything pending now; returns False if a write failed"""
+        while self.pending():
+            if not self._flush_batch():
+                return False
+        return True
+
+    def close(self, attempts=3):
+        with self._cond:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join(timeout=30)
+        for _ in range(attempts):
+            if self.flush():
+                return
+        logger.error(f"Write buffer {self.name} closed with {self.pending()} rows unwritten")